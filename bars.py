@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAMES = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600}
+
+BAR_DTYPE = np.dtype([
+    ("start", "<f8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("ticks", "<u4"),
+])
+
+
+class BarStore:
+    """Finished bars in one fixed-width binary file per pair and timeframe.
+
+    Bars are appended in time order, so a range query is two binary
+    searches on the memory-mapped start column.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, pair: str, timeframe: str) -> str:
+        return os.path.join(self.directory, pair.replace("/", "_"), f"{timeframe}.bin")
+
+    def append(self, pair: str, timeframe: str, bar: np.ndarray):
+        path = self._path(pair, timeframe)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'ab') as f:
+                f.write(np.asarray(bar, dtype=BAR_DTYPE).tobytes())
+
+    def query(self, pair: str, timeframe: str, start: Optional[float] = None,
+              end: Optional[float] = None, limit: Optional[int] = None) -> np.ndarray:
+        """Bars whose start lies in [start, end), oldest first; limit keeps the newest ones"""
+        path = self._path(pair, timeframe)
+        if not os.path.exists(path) or os.path.getsize(path) < BAR_DTYPE.itemsize:
+            return np.empty(0, dtype=BAR_DTYPE)
+        count = os.path.getsize(path) // BAR_DTYPE.itemsize
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(count,))
+        starts = bars["start"]
+        lo = 0 if start is None else int(np.searchsorted(starts, start, side="left"))
+        hi = count if end is None else int(np.searchsorted(starts, end, side="left"))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        result = np.array(bars[lo:hi])
+        del bars
+        return result
+
+
+class BarAggregator:
+    """Builds OHLC bars for several timeframes from a stream of quotes.
+
+    Each tick only updates the open bar of every timeframe. A bar is
+    finished when a tick for a later window arrives or when close_due()
+    sees that its window has ended; finished bars are written to the store
+    (if any) and passed to the bar listeners. Ticks for a window that was
+    already finished are dropped, so bars are stored in order and only once.
+    """
+
+    def __init__(self, store: Optional[BarStore], timeframes: Optional[Dict[str, int]] = None):
+        self.store = store
+        self.timeframes = timeframes or TIMEFRAMES
+        self._open: Dict[Tuple[str, str], List[float]] = {}
+        # End of the last finished bar per (pair, timeframe)
+        self._closed_until: Dict[Tuple[str, str], float] = {}
+        self._listeners: List[Callable[[str, str, np.ndarray], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, str, np.ndarray], None]):
+        self._listeners.append(listener)
+
+    def add_tick(self, pair: str, timestamp: float, price: float):
+        finished = []
+        with self._lock:
+            for timeframe, seconds in self.timeframes.items():
+                window_start = timestamp - timestamp % seconds
+                key = (pair, timeframe)
+                if window_start < self._closed_until_for(key):
+                    continue  # Late tick for a window that is already finished
+                bar = self._open.get(key)
+                if bar is not None and window_start != bar[0]:
+                    if window_start < bar[0]:
+                        continue  # Late tick for a window that is already finished
+                    finished.append((pair, timeframe, self._open.pop(key)))
+                    self._closed_until[key] = bar[0] + seconds
+                    bar = None
+                if bar is None:
+                    self._open[key] = [window_start, price, price, price, price, 1]
+                else:
+                    bar[2] = max(bar[2], price)
+                    bar[3] = min(bar[3], price)
+                    bar[4] = price
+                    bar[5] += 1
+        self._finish(finished)
+
+    def _closed_until_for(self, key: Tuple[str, str]) -> float:
+        closed_until = self._closed_until.get(key)
+        if closed_until is None:
+            # After a restart, continue after the newest stored bar
+            closed_until = 0.0
+            if self.store is not None:
+                last = self.store.query(key[0], key[1], limit=1)
+                if len(last):
+                    closed_until = float(last["start"][-1]) + self.timeframes[key[1]]
+            self._closed_until[key] = closed_until
+        return closed_until
+
+    def on_quote(self, signal_data: Dict):
+        """Quote listener for forex.add_quote_listener; bars follow the local fetch clock"""
+        fetched_at = signal_data.get("fetched_at", signal_data["timestamp"])
+        self.add_tick(signal_data["pair"], datetime.fromisoformat(fetched_at).timestamp(), signal_data["price"])
+
+    def close_due(self, now: float) -> int:
+        """Finish every open bar whose window ended before `now`"""
+        with self._lock:
+            due = [
+                key for key, bar in self._open.items()
+                if bar[0] + self.timeframes[key[1]] <= now
+            ]
+            finished = [(pair, timeframe, self._open.pop((pair, timeframe))) for pair, timeframe in due]
+            for pair, timeframe, bar in finished:
+                self._closed_until[(pair, timeframe)] = bar[0] + self.timeframes[timeframe]
+        self._finish(finished)
+        return len(finished)
+
+    def _finish(self, finished):
+        for pair, timeframe, values in finished:
+            bar = np.array(tuple(values), dtype=BAR_DTYPE)
+            if self.store is not None:
+                try:
+                    self.store.append(pair, timeframe, bar)
+                except Exception as e:
+                    logger.error(f"Error storing {timeframe} bar for {pair}: {e}")
+            for listener in self._listeners:
+                try:
+                    listener(pair, timeframe, bar)
+                except Exception as e:
+                    logger.error(f"Bar listener failed for {pair} {timeframe}: {e}")
+
+
+bar_store = BarStore(config.BAR_STORE_DIR)
+bar_aggregator = BarAggregator(bar_store)
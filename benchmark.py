@@ -0,0 +1,316 @@
+"""Micro-benchmarks for the forex and database hot paths.
+
+Everything runs against a temporary data directory and a stubbed HTTP
+layer, so no network or real bot data is touched, e.g.
+
+    python benchmark.py --output data/bench_baseline.json
+    python benchmark.py --compare data/bench_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import httpx
+
+import config
+
+logger = logging.getLogger(__name__)
+
+BENCH_PAIR = "EUR/USD"
+
+
+def isolate_data(data_dir: str):
+    """Point every data file in config at a temporary directory.
+
+    Must run before forex or database are imported, as both open their
+    files at import time.
+    """
+    for name in dir(config):
+        value = getattr(config, name)
+        if name.isupper() and isinstance(value, str) and (value == "data" or value.startswith("data/")):
+            setattr(config, name, os.path.join(data_dir, value[len("data"):].lstrip("/")))
+
+
+def _summarize(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    count = len(samples)
+
+    def percentile(p):
+        return samples[min(count - 1, int(p / 100 * count))] * 1e6
+
+    total = sum(samples)
+    return {
+        "iterations": count,
+        "ops_per_sec": round(count / total, 1) if total else None,
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+        "p50_us": round(percentile(50), 2),
+        "p95_us": round(percentile(95), 2),
+        "p99_us": round(percentile(99), 2),
+    }
+
+
+def _measure(func: Callable[[], object], iterations: int, budget: float) -> Dict:
+    """Time func() until `iterations` runs or `budget` seconds, whichever comes first"""
+    samples = []
+    deadline = time.perf_counter() + budget
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        finished = time.perf_counter()
+        samples.append(finished - started)
+        if finished > deadline and len(samples) >= 5:
+            break
+    return _summarize(samples)
+
+
+async def _measure_async(func, iterations: int, budget: float) -> Dict:
+    samples = []
+    deadline = time.perf_counter() + budget
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        finished = time.perf_counter()
+        samples.append(finished - started)
+        if finished > deadline and len(samples) >= 5:
+            break
+    return _summarize(samples)
+
+
+def exchange_rate_payload(from_currency: str, to_currency: str) -> Dict:
+    """A CURRENCY_EXCHANGE_RATE response with a random rate"""
+    rate = 1.0 + random.random() / 10
+    return {
+        "Realtime Currency Exchange Rate": {
+            "1. From_Currency Code": from_currency,
+            "3. To_Currency Code": to_currency,
+            "5. Exchange Rate": f"{rate:.5f}",
+            "6. Last Refreshed": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "8. Bid Price": f"{rate - 0.00005:.5f}",
+            "9. Ask Price": f"{rate + 0.00005:.5f}",
+        }
+    }
+
+
+def _stub_transport() -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        return httpx.Response(200, json=exchange_rate_payload(params["from_currency"], params["to_currency"]))
+    return httpx.MockTransport(handler)
+
+
+def bench_forex(iterations: int, budget: float) -> Dict[str, Dict]:
+    import forex
+    from key_scheduler import KeyScheduler
+    from market_client import MarketDataClient
+
+    # One key without quotas, so misses are never throttled into demo data
+    forex._key_scheduler = KeyScheduler({"bench": "bench"})
+    results = {}
+
+    async def run():
+        client = MarketDataClient(transport=_stub_transport())
+        try:
+            await forex.get_forex_data_async(BENCH_PAIR, client=client)
+            results["forex_cache_hit"] = await _measure_async(
+                lambda: forex.get_forex_data_async(BENCH_PAIR, client=client), iterations, budget
+            )
+
+            # With no TTL and no stale window every lookup misses and goes to the stub
+            ttl, stale_window = forex._signal_cache.ttl, forex._signal_cache.stale_window
+            forex._signal_cache.ttl = forex._signal_cache.stale_window = 0
+            try:
+                results["forex_cache_miss"] = await _measure_async(
+                    lambda: forex.get_forex_data_async(BENCH_PAIR, client=client), iterations, budget
+                )
+            finally:
+                forex._signal_cache.ttl, forex._signal_cache.stale_window = ttl, stale_window
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+    signal_data = forex._signal_cache.get(BENCH_PAIR)
+    results["format_signal_message"] = _measure(
+        lambda: forex.format_signal_message(signal_data), iterations, budget
+    )
+    forex.close_cache()
+    return results
+
+
+def _raw_storage(backend: str, data_dir: str):
+    from database import JsonStorage, SqliteStorage
+
+    os.makedirs(data_dir, exist_ok=True)
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(data_dir, "bot.db"), import_dir=data_dir)
+    return JsonStorage(data_dir)
+
+
+def _wrap(storage):
+    if not config.USER_CACHE_ENABLED:
+        return storage
+    from user_cache import CachedStorage
+    return CachedStorage(
+        storage,
+        flush_interval=config.USER_CACHE_FLUSH_INTERVAL,
+        flush_threshold=config.USER_CACHE_FLUSH_THRESHOLD,
+        max_entries=config.USER_CACHE_MAX_ENTRIES
+    )
+
+
+def _make_user(user_id: int) -> Dict:
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "is_premium": user_id % 10 == 0,
+        "signals_used": user_id % 3,
+        "daily_signals": 0,
+        "last_signal_date": "2024-01-01",
+        "join_date": "2024-01-01T00:00:00",
+        "license_key": None
+    }
+
+
+def _prefill_users(storage, count: int):
+    from database import JsonStorage
+
+    # The JSON backend rewrites the whole file per batch, so it gets one batch
+    chunk = count if isinstance(storage, JsonStorage) else 50_000
+    for first in range(1, count + 1, chunk):
+        storage.save_users({user_id: _make_user(user_id) for user_id in range(first, min(first + chunk, count + 1))})
+
+
+def _prefill_signals(storage, count: int):
+    from database import JsonStorage
+
+    signal_data = {"pair": BENCH_PAIR, "price": 1.1, "strength": 0.8, "sent_by": 1,
+                   "created_at": "2024-01-01T00:00:00"}
+    if isinstance(storage, JsonStorage):
+        storage._save_data({str(i): signal_data for i in range(1, count + 1)}, storage.signals_file)
+        return
+    row = (signal_data["sent_by"], signal_data["created_at"], json.dumps(signal_data))
+    with storage._transaction() as conn:
+        conn.executemany("INSERT INTO signals (sent_by, created_at, data) VALUES (?, ?, ?)", [row] * count)
+
+
+def bench_database(backend: str, user_sizes: List[int], signal_sizes: List[int], iterations: int,
+                   budget: float, data_dir: str) -> Dict[str, Dict]:
+    from database import Database
+
+    results = {}
+    for size in user_sizes:
+        size_dir = os.path.join(data_dir, f"users_{size}")
+        raw = _raw_storage(backend, size_dir)
+        started = time.perf_counter()
+        _prefill_users(raw, size)
+        logger.info(f"Prefilled {size} users in {time.perf_counter() - started:.1f}s")
+
+        db = Database(_wrap(raw))
+        ids = [random.randint(1, size) for _ in range(iterations)]
+        picks = iter(ids * 3)
+        results[f"db_get_user[{size}]"] = _measure(lambda: db.get_user(next(picks)), iterations, budget)
+        results[f"db_add_signal_use[{size}]"] = _measure(lambda: db.add_signal_use(next(picks)), iterations, budget)
+        results[f"db_get_daily_signals[{size}]"] = _measure(
+            lambda: db.get_daily_signals(next(picks)), iterations, budget
+        )
+        db.close()
+        shutil.rmtree(size_dir, ignore_errors=True)
+
+    for size in signal_sizes:
+        size_dir = os.path.join(data_dir, f"signals_{size}")
+        raw = _raw_storage(backend, size_dir)
+        _prefill_signals(raw, size)
+        db = Database(_wrap(raw))
+        signal_data = {"pair": BENCH_PAIR, "price": 1.1, "strength": 0.8, "sent_by": 1}
+        results[f"db_save_signal[{size}]"] = _measure(lambda: db.save_signal(signal_data), iterations, budget)
+        db.close()
+        shutil.rmtree(size_dir, ignore_errors=True)
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Print mean latency changes against the baseline; returns the regressed benchmarks"""
+    regressions = []
+    print(f"{'benchmark':40} {'baseline us':>12} {'current us':>12} {'change':>9}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:40} {'-':>12} {current['mean_us']:>12.2f} {'new':>9}")
+            continue
+        change = current["mean_us"] / previous["mean_us"] - 1 if previous["mean_us"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {previous['mean_us']:>12.2f} {current['mean_us']:>12.2f} {change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark forex and database hot paths")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default=config.STORAGE_BACKEND)
+    parser.add_argument("--user-sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--signal-sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--iterations", type=int, default=2000, help="maximum runs per benchmark")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per benchmark")
+    parser.add_argument("--skip-forex", action="store_true")
+    parser.add_argument("--skip-database", action="store_true")
+    parser.add_argument("--output", default=config.BENCHMARK_OUTPUT_FILE)
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    data_dir = tempfile.mkdtemp(prefix="bot-bench-")
+    isolate_data(data_dir)
+    random.seed(0)
+    try:
+        results = {}
+        if not args.skip_forex:
+            results.update(bench_forex(args.iterations, args.budget))
+        if not args.skip_database:
+            results.update(bench_database(
+                args.backend, args.user_sizes, args.signal_sizes, args.iterations, args.budget, data_dir
+            ))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "user_cache": config.USER_CACHE_ENABLED,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    logger.info(f"Wrote {len(results)} results to {output}")
+
+    if baseline_path:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,18 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 import config
 import handlers
-import asyncio
-import nest_asyncio
+import market_client
+import forex
+import broadcast
+import metrics
+from refresher import pair_refresher
+from indicators import indicator_engine
+from bars import bar_aggregator
+from tick_archive import tick_archive
+from update_processor import PerUserUpdateProcessor
+import secrets
+import time
+from typing import Optional
 
 # Enable logging
 logging.basicConfig(
@@ -12,12 +22,90 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-# Apply nest_asyncio to fix event loop issues
-nest_asyncio.apply()
+async def sync_signal_cache(context):
+    forex.sync_cache()
 
-async def main():
-    # Create application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+async def resume_broadcasts(context):
+    broadcast.resume_broadcasts(context.application, handlers.db)
+
+async def close_bars(context):
+    # Bars for every pair end on the same boundaries, so indicators advance as one batch
+    bar_aggregator.close_due(time.time())
+    if config.INDICATORS_ENABLED:
+        indicator_engine.step()
+
+def is_primary(application: Application) -> bool:
+    """The single process, worker 0 when updates are sharded across workers,
+    or the elected refresher among processes sharing the quote cache"""
+    return application.bot_data.get("primary", True)
+
+def _elect_primary(worker: Optional[int]) -> bool:
+    if worker is not None:
+        return worker == 0
+    if config.SHARED_CACHE_ENABLED:
+        # Separate bot processes on one host share the cache and data files;
+        # the one holding the refresher lock keeps them
+        return forex.is_refresher()
+    return True
+
+async def claim_primary(context):
+    """Take over the market data pipeline once the previous primary has exited"""
+    application = context.application
+    if not forex.is_refresher():
+        return
+    logging.info("Taking over as the primary process")
+    context.job.schedule_removal()
+    application.bot_data["primary"] = True
+    forex._signal_cache.owner = True
+    start_market_data(application)
+    start_broadcast_resume(application)
+
+def start_broadcast_resume(application: Application):
+    # Pick up broadcasts that were interrupted by a restart, and later
+    # those whose sender died without finishing
+    broadcast.resume_broadcasts(application, handlers.db)
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(resume_broadcasts, interval=config.BROADCAST_LEASE_SECONDS)
+
+async def post_init(application: Application):
+    if is_primary(application):
+        start_broadcast_resume(application)
+    if config.METRICS_ENABLED:
+        # Each worker serves its own metrics on the next port up
+        port = config.METRICS_PORT + application.bot_data.get("worker", 0)
+        try:
+            await metrics.start(config.METRICS_HOST, port, config.METRICS_LOOP_LAG_INTERVAL,
+                                config.METRICS_FILE_SIZE_INTERVAL)
+        except OSError as e:
+            # e.g. another independent instance already serves this port
+            logging.warning(f"Metrics disabled, could not listen on {config.METRICS_HOST}:{port}: {e}")
+
+async def post_shutdown(application: Application):
+    await metrics.stop()
+    # Close pooled HTTP connections to the market data API
+    await market_client.close_client()
+    forex.close_cache()
+    if is_primary(application):
+        tick_archive.close()
+
+def build_application(worker: Optional[int] = None) -> Application:
+    """Build the bot; `worker` is set in sharded worker processes, which get
+    their updates from the supervisor instead of Telegram."""
+    # Create application; updates from different users are handled concurrently,
+    # each user's own updates one after another
+    builder = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(config.CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if worker is not None:
+        builder = builder.updater(None)
+    application = builder.build()
+    if worker is not None:
+        application.bot_data["worker"] = worker
+    application.bot_data["primary"] = _elect_primary(worker)
 
     # Add command handlers
     application.add_handler(CommandHandler("start", handlers.start_command))
@@ -29,6 +117,9 @@ async def main():
     application.add_handler(CommandHandler("manualsignal", handlers.manual_signal_command))
     application.add_handler(CommandHandler("removelicense", handlers.remove_license_command))
     application.add_handler(CommandHandler("viewusers", handlers.view_users_command))
+    application.add_handler(CommandHandler("refreshstatus", handlers.refresh_status_command))
+    application.add_handler(CommandHandler("bars", handlers.bars_command))
+    application.add_handler(CommandHandler("profile", handlers.profile_command))
 
     # Add text message handler for keyboard buttons
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_text_message))
@@ -37,12 +128,98 @@ async def main():
     application.add_handler(CallbackQueryHandler(handlers.signal_callback, pattern="^signal_"))
     application.add_handler(CallbackQueryHandler(handlers.button_callback))
 
-    # Start the bot
-    logging.info("Starting bot")
-    await application.run_polling(drop_pending_updates=True)
+    # Record latency and errors of every handler
+    if config.METRICS_ENABLED:
+        for handler in application.handlers[0]:
+            handler.callback = metrics.timed_handler(handler.callback)
 
-if __name__ == '__main__':
+    if (worker is not None or config.SHARED_CACHE_ENABLED) and application.job_queue is not None:
+        # Quotes fetched by other processes reach this one through the shared cache
+        application.job_queue.run_repeating(sync_signal_cache, interval=config.SIGNAL_CACHE_SYNC_INTERVAL)
+    if config.SHARED_CACHE_ENABLED:
+        # Every process schedules the refresh; only the elected one runs it
+        schedule_pair_refresh(application)
+    if is_primary(application):
+        start_market_data(application)
+    elif worker is None:
+        # Only one process may compact the shared signal cache files
+        forex._signal_cache.owner = False
+        if application.job_queue is not None:
+            application.job_queue.run_repeating(claim_primary, interval=config.SIGNAL_CACHE_SYNC_INTERVAL)
+    return application
+
+def start_market_data(application: Application):
+    """Tick archive, bars and pair refresh; kept by the primary process only"""
+    # Archive every quote on disk for range queries and replay
+    forex.add_quote_listener(tick_archive.on_quote)
+
+    # Build OHLC bars from every quote; indicators read finished bars only
+    forex.add_quote_listener(bar_aggregator.on_quote)
+    if config.INDICATORS_ENABLED:
+        indicator_engine.seed(bar_aggregator.store)
+        bar_aggregator.add_listener(indicator_engine.on_bar)
+    if application.job_queue is not None:
+        first = 60 - time.time() % 60 + config.BAR_CLOSE_DELAY
+        application.job_queue.run_repeating(close_bars, interval=60, first=first)
+
+    if not config.SHARED_CACHE_ENABLED:
+        schedule_pair_refresh(application)
+
+def schedule_pair_refresh(application: Application):
+    # Keep the signal cache warm so callbacks do not wait on the API
+    if config.PAIR_REFRESH_ENABLED:
+        if application.job_queue is None:
+            logging.warning("Job queue unavailable, install python-telegram-bot[job-queue] for pair refresh")
+        else:
+            pair_refresher.schedule(application.job_queue)
+
+def run_webhook(application: Application):
+    if not config.WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE is 'webhook'")
+    secret_token = config.WEBHOOK_SECRET_TOKEN
+    if not secret_token:
+        if config.SHARED_CACHE_ENABLED:
+            # Every instance would register its own random token and Telegram keeps only the last one
+            raise ValueError("WEBHOOK_SECRET_TOKEN must be set when several instances share a webhook "
+                             "(SHARED_CACHE_ENABLED)")
+        secret_token = secrets.token_urlsafe(32)
+        logging.warning("WEBHOOK_SECRET_TOKEN not set, using a random token for this run")
+
+    logging.info(f"Starting bot in webhook mode on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}/{config.WEBHOOK_PATH}")
+    # Telegram sends the secret in a header; requests without it are rejected with 403
+    application.run_webhook(
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        url_path=config.WEBHOOK_PATH,
+        webhook_url=config.WEBHOOK_URL,
+        secret_token=secret_token,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=True
+    )
+
+def start(application: Application):
+    """Receive updates from Telegram in the configured BOT_MODE until stopped"""
+    if config.BOT_MODE == "webhook":
+        run_webhook(application)
+    elif config.BOT_MODE == "polling":
+        logging.info("Starting bot")
+        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {config.BOT_MODE}")
+
+def main():
+    if config.WORKER_PROCESSES > 1:
+        import supervisor
+        supervisor.run(config.WORKER_PROCESSES)
+        return
+
+    application = build_application()
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        start(application)
+    finally:
+        # Flush cached user changes before exiting
+        handlers.db.close()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in broadcast leases
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Jobs this process is sending right now
+_running: Set[str] = set()
+
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity"""
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def try_consume(self, amount: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def time_until_available(self, amount: float = 1) -> float:
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class BroadcastStats:
+    def __init__(self, total: int):
+        self.total = total
+        self.retries = 0
+        self.delivered_ids: List[int] = []
+        self.failed_ids: List[int] = []
+
+    @property
+    def delivered(self) -> int:
+        return len(self.delivered_ids)
+
+    @property
+    def failed(self) -> int:
+        return len(self.failed_ids)
+
+
+class Broadcaster:
+    """Sends one message to many chats under Telegram's rate limits.
+
+    Up to `concurrency` sends are in flight at once. A global token bucket
+    keeps the overall rate under the bot limit, and a minimum interval is
+    kept between two messages to the same chat. A RetryAfter from Telegram
+    pauses every sender for the requested time before the message is
+    retried; such retries do not count against `max_attempts`.
+    """
+
+    def __init__(self, bot, concurrency: Optional[int] = None, rate_per_second: Optional[float] = None,
+                 per_chat_interval: Optional[float] = None, max_attempts: int = 3):
+        self.bot = bot
+        self.concurrency = concurrency or config.BROADCAST_CONCURRENCY
+        rate = rate_per_second or config.BROADCAST_RATE_LIMIT
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else config.BROADCAST_PER_CHAT_INTERVAL
+        self.max_attempts = max_attempts
+        self._bucket = TokenBucket(rate, 1)
+        self._bucket_lock = asyncio.Lock()
+        self._paused_until = 0.0
+        self._last_sent: Dict[int, float] = {}
+
+    async def _wait_for_slot(self, chat_id: int):
+        async with self._bucket_lock:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                if self._bucket.try_consume():
+                    break
+                await asyncio.sleep(self._bucket.time_until_available())
+
+        chat_wait = self._last_sent.get(chat_id, 0.0) + self.per_chat_interval - time.monotonic()
+        if chat_wait > 0:
+            await asyncio.sleep(chat_wait)
+
+    async def _send(self, chat_id: int, text: str, stats: BroadcastStats) -> bool:
+        # Flood control pauses are not failures, so only other errors use up attempts
+        attempt = 0
+        while attempt < self.max_attempts:
+            await self._wait_for_slot(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self._last_sent[chat_id] = time.monotonic()
+                metrics.BROADCAST_MESSAGES.inc(result="delivered")
+                return True
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                logger.warning(f"Flood control during broadcast, pausing {retry_after}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                stats.retries += 1
+                metrics.BROADCAST_MESSAGES.inc(result="retry")
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot, deleted account, invalid chat: retrying will not help
+                logger.info(f"Dërgimi i sinjalit dështoi për përdoruesin {chat_id}: {str(e)}")
+                metrics.BROADCAST_MESSAGES.inc(result="failed")
+                return False
+            except TelegramError as e:
+                logger.warning(f"Error sending to {chat_id} (attempt {attempt + 1}/{self.max_attempts}): {e}")
+                stats.retries += 1
+                metrics.BROADCAST_MESSAGES.inc(result="retry")
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+        metrics.BROADCAST_MESSAGES.inc(result="failed")
+        return False
+
+    async def run(self, chat_ids: Iterable[int], text: str) -> BroadcastStats:
+        chat_ids = list(chat_ids)
+        stats = BroadcastStats(len(chat_ids))
+        pending = iter(chat_ids)
+
+        async def worker():
+            for chat_id in pending:
+                if await self._send(chat_id, text, stats):
+                    stats.delivered_ids.append(chat_id)
+                else:
+                    stats.failed_ids.append(chat_id)
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, len(chat_ids)) or 1)])
+        return stats
+
+
+def eligible_recipients(users: Dict[str, Dict]) -> List[int]:
+    """Premium users and free users that still have signals left"""
+    return [
+        int(user_id) for user_id, user_data in users.items()
+        if user_data["is_premium"] or user_data["signals_used"] < config.FREE_SIGNAL_LIMIT
+    ]
+
+
+def create_broadcast_job(db, signal_text: str, admin_chat_id: int, status_message_id: Optional[int] = None) -> Dict:
+    """Store a durable broadcast job for every eligible user"""
+    recipients = eligible_recipients(db.get_all_users())
+    job_id = db.create_broadcast(signal_text, admin_chat_id, recipients, status_message_id)
+    logger.info(f"Created broadcast job {job_id} for {len(recipients)} users")
+    return db.get_broadcast(job_id)
+
+
+async def _report_progress(bot, job: Dict, delivered: int, failed: int, started_at: float, sent_now: int):
+    if not job.get("status_message_id"):
+        return
+    elapsed = time.monotonic() - started_at
+    rate = sent_now / elapsed if elapsed > 0 else 0.0
+    try:
+        await bot.edit_message_text(
+            chat_id=job["admin_chat_id"],
+            message_id=job["status_message_id"],
+            text=(
+                f"📤 Duke dërguar sinjalin: {delivered + failed + job.get('uncertain', 0)}/{job['total']}\n"
+                f"✅ Dërguar: {delivered}  ❌ Dështuan: {failed}\n"
+                f"⚡️ {rate:.1f} mesazhe/s"
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Could not report broadcast progress: {e}")
+
+
+async def run_broadcast_job(bot, db, job: Dict):
+    """Send a stored broadcast job, checkpointing after every batch.
+
+    Recipients are claimed in batches before they are sent to and each
+    batch's outcome is checkpointed together with the free-signal charges.
+    Recipients that were claimed but not checkpointed when the process
+    stopped are never sent to again, so a restart can not send a user the
+    same signal twice or charge them twice.
+
+    The sender holds a lease on the job and renews it with every batch.
+    Another process only takes the job over once the lease has expired,
+    and a sender that lost its lease stops.
+    """
+    job_id = job["id"]
+    if job_id in _running or not db.acquire_broadcast_lease(job_id, LEASE_OWNER):
+        return
+    _running.add(job_id)
+    try:
+        await _send_broadcast_job(bot, db, job)
+    finally:
+        _running.discard(job_id)
+
+
+async def _send_broadcast_job(bot, db, job: Dict):
+    job_id = job["id"]
+    uncertain = db.recover_broadcast(job_id)
+    if uncertain:
+        logger.warning(f"Broadcast {job_id}: {uncertain} recipients were interrupted mid-send and are skipped")
+        job = db.get_broadcast(job_id)
+
+    broadcaster = Broadcaster(bot)
+    text = f"🔔 Sinjal i Ri Forex:\n\n{job['text']}"
+    delivered, failed = job["delivered"], job["failed"]
+    started_at = time.monotonic()
+    last_report = started_at
+    sent_now = 0
+
+    while True:
+        if not db.acquire_broadcast_lease(job_id, LEASE_OWNER):
+            logger.warning(f"Broadcast {job_id}: lease taken over by another process, stopping")
+            return
+        batch = db.claim_broadcast_recipients(job_id, config.BROADCAST_CHECKPOINT_SIZE)
+        if not batch:
+            break
+        stats = await broadcaster.run(batch, text)
+        db.checkpoint_broadcast(job_id, stats.delivered_ids, stats.failed_ids)
+
+        delivered += stats.delivered
+        failed += stats.failed
+        sent_now += stats.delivered
+        if time.monotonic() - last_report >= config.BROADCAST_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            await _report_progress(bot, job, delivered, failed, started_at, sent_now)
+
+    db.update_broadcast(job_id, {"status": "done"})
+    logger.info(f"Broadcast {job_id} finished: {delivered} delivered, {failed} failed, {job.get('uncertain', 0)} skipped")
+
+    await bot.send_message(
+        chat_id=job["admin_chat_id"],
+        text=(
+            f"✅ Sinjali u dërgua me sukses tek {delivered} përdorues!\n"
+            f"❌ Dështuan: {failed}"
+        )
+    )
+
+
+def resume_broadcasts(application, db):
+    """Restart unfinished broadcast jobs whose sender stopped renewing its lease"""
+    now = time.time()
+    for job in db.get_unfinished_broadcasts():
+        if job["id"] in _running or (job.get("lease_until") or 0) >= now:
+            continue
+        logger.info(f"Resuming broadcast {job['id']} ({job['delivered'] + job['failed']}/{job['total']} done)")
+        application.create_task(run_broadcast_job(application.bot, db, job))
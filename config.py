@@ -3,12 +3,39 @@ TELEGRAM_BOT_TOKEN = "7943385629:AAGjnTp-3oBj_yW-Xze_EpR693Y2ZdPdC6s"
 ADMIN_ID = 7151308102
 FREE_SIGNAL_LIMIT = 2
 PREMIUM_DAILY_LIMIT = 10
+QUOTA_RESET_TIMEZONE = ""  # IANA zone whose midnight resets daily limits, e.g. "Europe/Tirane"; "" = server time
+
+# Update delivery: "polling" (long polling) or "webhook" (Telegram pushes to an embedded HTTP server)
+BOT_MODE = "polling"
+CONCURRENT_UPDATES = 64  # updates processed at the same time
+WEBHOOK_LISTEN = "127.0.0.1"  # behind a local reverse proxy that terminates TLS
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"
+WEBHOOK_URL = ""  # public URL Telegram posts to, e.g. "https://example.com/telegram"
+WEBHOOK_SECRET_TOKEN = ""  # shared by every instance, required for several; a random one is used per run if empty
+WEBHOOK_MAX_CONNECTIONS = 40  # simultaneous connections Telegram may open
+WORKER_PROCESSES = 1  # >1 shards updates by user id across processes (sqlite backend only)
+WORKER_RESTART_INTERVAL = 5  # seconds between checks for dead worker processes
 
 # API Configuration
+# Any number of keys may be listed; quotas are looked up by key name
 ALPHA_VANTAGE_API_KEYS = {
     "free": "GUZYT7XQMZCNHBNH",
     "premium": "QUFLIODYF08MMRKO"
 }
+ALPHA_VANTAGE_KEY_QUOTAS = {
+    "free": {"per_minute": 5, "per_day": 25, "premium": False},
+    "premium": {"per_minute": 75, "per_day": None, "premium": True}
+}
+ALPHA_VANTAGE_DEFAULT_QUOTA = {"per_minute": 5, "per_day": 25, "premium": False}
+PREMIUM_KEY_RESERVE = 0.3  # share of premium-key capacity kept for premium users
+API_USAGE_DB_PATH = "data/api_usage.db"  # requests per key, UTC day and minute, shared by all processes
+
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+API_REQUEST_TIMEOUT = 10  # seconds per request
+API_MAX_CONNECTIONS = 20
+API_KEEPALIVE_EXPIRY = 30  # seconds an idle connection is kept open
+API_RETRY_BACKOFF = 1.0  # base delay in seconds, doubled on each retry
 
 FOREX_PAIRS = [
     "EUR/USD",
@@ -20,10 +47,94 @@ FOREX_PAIRS = [
     "EUR/JPY"
 ]
 SIGNAL_STRENGTH_THRESHOLD = 0.75
+SIGNAL_STRONG_MARGIN = 0.15  # strong signals need this much more than the threshold
+
+# Cross pairs (e.g. EUR/GBP) are derived from their legs against this currency
+TRIANGULATION_ENABLED = True
+TRIANGULATION_ANCHOR = "USD"
+
+# Storage Configuration
+DATA_DIR = "data"
+STORAGE_BACKEND = "sqlite"  # "sqlite" or "json"
+SQLITE_DB_PATH = "data/bot.db"
+
+# User cache (write-behind) in front of the storage backend; single-process
+# only, so it is off in sharded workers and with SHARED_CACHE_ENABLED
+USER_CACHE_ENABLED = True
+USER_CACHE_FLUSH_INTERVAL = 5  # seconds between batched flushes
+USER_CACHE_FLUSH_THRESHOLD = 500  # flush early once this many users are dirty
+USER_CACHE_MAX_ENTRIES = 100000
 
 # Cache Configuration
 CACHE_DURATION = 300  # 5 minutes in seconds
 CACHE_DURATION_MESSAGE = "📊 Sinjalet përditësohen çdo 5 minuta"
+CACHE_STALE_WINDOW = 120  # seconds an expired signal may be served while it refreshes
+SIGNAL_CACHE_FILE = "data/signal_cache.json"
+SIGNAL_CACHE_LOG_FILE = "data/signal_cache.log"
+SIGNAL_CACHE_MAX_ENTRIES = 1000
+SIGNAL_CACHE_COMPACT_EVERY = 500  # log entries before they are folded into the snapshot
+SIGNAL_CACHE_SYNC_INTERVAL = 1.0  # seconds between workers reading each other's cache updates
+
+# Latest quotes shared by all bot processes on this host through shared memory;
+# one elected process runs the background refresh
+SHARED_CACHE_ENABLED = False
+SHARED_CACHE_NAME = "forex_bot_quotes"  # /dev/shm/<name>; remove it after changing FOREX_PAIRS
+SHARED_CACHE_LOCK_FILE = "data/shared_cache.lock"
+SHARED_CACHE_PAYLOAD_SIZE = 2048  # bytes reserved per pair
+
+# Append-only columnar tick archive, one directory of segments per pair
+TICK_ARCHIVE_DIR = "data/ticks"
+TICK_SEGMENT_ROWS = 1_000_000  # ticks per segment before rolling over
+TICK_SEGMENT_SECONDS = 86400  # time span of a segment before rolling over
+TICK_RETENTION_DAYS = 90  # segments older than this are deleted on rollover and on load
+TICK_INDEX_STRIDE = 1024  # rows between sparse time index entries
+
+# Offline replay of the tick archive (python replay.py)
+REPLAY_HORIZON = 300  # seconds to evaluate signals that have no trading duration
+REPLAY_OUTPUT_FILE = "data/replay_stats.json"
+
+# Prometheus metrics served on a local HTTP endpoint
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464  # sharded workers use the next ports up; a busy port disables metrics for that process
+METRICS_LOOP_LAG_INTERVAL = 1.0  # seconds between event-loop lag probes
+METRICS_FILE_SIZE_INTERVAL = 60  # seconds between data file size measurements
+
+# Admin /profile command
+PROFILE_DIR = "data/profiles"
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Micro-benchmarks and load tests (python benchmark.py / python loadgen.py)
+BENCHMARK_OUTPUT_FILE = "data/benchmark.json"
+LOADGEN_OUTPUT_FILE = "data/loadgen.json"
+
+# OHLC bars built from fetched quotes (1m, 5m, 15m, 1h)
+BAR_STORE_DIR = "data/bars"
+BAR_CLOSE_DELAY = 2  # seconds after a minute boundary before open bars are closed
+
+# Technical indicators used for signal strength once enough history exists
+INDICATORS_ENABLED = True
+INDICATOR_TIMEFRAME = "5m"  # indicators advance once per finished bar of this timeframe
+INDICATOR_SMA_PERIOD = 20
+INDICATOR_EMA_FAST = 12
+INDICATOR_EMA_SLOW = 26
+INDICATOR_RSI_PERIOD = 14
+INDICATOR_ATR_PERIOD = 14
+INDICATOR_BOLLINGER_K = 2.0
+
+# Background refresh of FOREX_PAIRS on the job queue
+PAIR_REFRESH_ENABLED = True
+PAIR_REFRESH_LEAD_TIME = 60  # refresh this many seconds before the cache expires
+
+# Broadcast (/sendsignal) limits
+BROADCAST_CONCURRENCY = 20  # messages in flight at once
+BROADCAST_RATE_LIMIT = 25  # messages per second across all chats (Telegram allows ~30)
+BROADCAST_PER_CHAT_INTERVAL = 1.0  # minimum seconds between messages to one chat
+BROADCAST_PROGRESS_INTERVAL = 10  # seconds between progress updates to the admin
+BROADCAST_CHECKPOINT_SIZE = 200  # recipients sent between two durable checkpoints
+BROADCAST_LEASE_SECONDS = 120  # a sender renews its lease every batch; expired jobs are resumed
 
 # Message templates
 WELCOME_MESSAGE = """
@@ -1,18 +1,69 @@
 import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, List, Optional
 
-class Database:
-    def __init__(self):
-        self.users_file = "data/users.json"
-        self.signals_file = "data/signals.json"
-        self.licenses_file = "data/licenses.json"
+import config
+from quota import current_day
+
+logger = logging.getLogger(__name__)
+
+# Delivery state of each broadcast recipient
+RECIPIENT_PENDING = 0
+RECIPIENT_CLAIMED = 1  # handed to a sender, outcome not yet checkpointed
+RECIPIENT_DELIVERED = 2
+RECIPIENT_FAILED = 3
+RECIPIENT_UNCERTAIN = 4  # was claimed when the process stopped; never re-sent
+
+USER_COLUMNS = (
+    "user_id", "username", "is_premium", "signals_used",
+    "daily_signals", "last_signal_date", "join_date", "license_key"
+)
+
+
+def reserve_signal(user: Dict, day: str, daily_limit: int, free_limit: int) -> bool:
+    """Charge one signal to `user` in place unless it is over its limit"""
+    if user["is_premium"]:
+        if user.get("last_signal_date") != day:
+            user["daily_signals"] = 0
+            user["last_signal_date"] = day
+        if user["daily_signals"] >= daily_limit:
+            return False
+        user["daily_signals"] += 1
+    elif user["signals_used"] >= free_limit:
+        return False
+    user["signals_used"] += 1
+    return True
+
+
+def release_signal(user: Dict, day: str):
+    """Refund a signal reserved on `day` that was not delivered"""
+    user["signals_used"] = max(0, user["signals_used"] - 1)
+    if user["is_premium"] and user.get("last_signal_date") == day:
+        user["daily_signals"] = max(0, user["daily_signals"] - 1)
+
+
+class JsonStorage:
+    """Storage backend that keeps every table in its own JSON file"""
+
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, "users.json")
+        self.signals_file = os.path.join(data_dir, "signals.json")
+        self.licenses_file = os.path.join(data_dir, "licenses.json")
+        self.broadcasts_file = os.path.join(data_dir, "broadcasts.json")
+        self._recipients_cache: Dict[str, List[int]] = {}
         self._initialize_files()
 
     def _initialize_files(self):
-        os.makedirs("data", exist_ok=True)
+        os.makedirs(self.data_dir, exist_ok=True)
 
-        for file_path in [self.users_file, self.signals_file, self.licenses_file]:
+        for file_path in [self.users_file, self.signals_file, self.licenses_file, self.broadcasts_file]:
             if not os.path.exists(file_path):
                 with open(file_path, 'w') as f:
                     json.dump({}, f)
@@ -25,14 +76,531 @@ class Database:
         with open(file_path, 'w') as f:
             json.dump(data, f, indent=4)
 
-    def get_user(self, user_id):
+    def get_user(self, user_id) -> Optional[Dict]:
         users = self._load_data(self.users_file)
         return users.get(str(user_id))
 
-    def save_user(self, user_id, user_data):
+    def save_user(self, user_id, user_data: Dict):
+        self.save_users({user_id: user_data})
+
+    def save_users(self, users_data: Dict):
+        """Write several user records with a single file rewrite"""
+        if not users_data:
+            return
+        users = self._load_data(self.users_file)
+        for user_id, user_data in users_data.items():
+            users[str(user_id)] = user_data
+        self._save_data(users, self.users_file)
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        return self._load_data(self.users_file)
+
+    def reserve_signal(self, user_id, day: str, daily_limit: int, free_limit: int) -> Optional[Dict]:
         users = self._load_data(self.users_file)
-        users[str(user_id)] = user_data
+        user = users.get(str(user_id))
+        if user is None or not reserve_signal(user, day, daily_limit, free_limit):
+            return None
         self._save_data(users, self.users_file)
+        return user
+
+    def release_signal(self, user_id, day: str):
+        users = self._load_data(self.users_file)
+        user = users.get(str(user_id))
+        if user is not None:
+            release_signal(user, day)
+            self._save_data(users, self.users_file)
+
+    def get_license(self, key) -> Optional[Dict]:
+        licenses = self._load_data(self.licenses_file)
+        return licenses.get(key)
+
+    def save_license(self, key, license_data: Dict):
+        licenses = self._load_data(self.licenses_file)
+        licenses[key] = license_data
+        self._save_data(licenses, self.licenses_file)
+
+    def save_license_and_user(self, key, license_data: Dict, user_id, user_data: Dict):
+        # Two files cannot change together; on activation the user goes first,
+        # so a crash in between does not burn the license without granting premium
+        self.save_user(user_id, user_data)
+        self.save_license(key, license_data)
+
+    def add_signal(self, signal_data: Dict) -> str:
+        signals = self._load_data(self.signals_file)
+        signal_id = str(len(signals) + 1)
+        signals[signal_id] = signal_data
+        self._save_data(signals, self.signals_file)
+        return signal_id
+
+    def _recipients_file(self, job_id) -> str:
+        return os.path.join(self.data_dir, "broadcasts", f"{job_id}.json")
+
+    def _recipients(self, job_id) -> List[int]:
+        # Written once when the job is created, so it is read once per process
+        recipients = self._recipients_cache.get(str(job_id))
+        if recipients is None:
+            recipients = self._recipients_cache[str(job_id)] = self._load_data(self._recipients_file(job_id))
+        return recipients
+
+    def create_broadcast(self, job: Dict, recipients) -> str:
+        jobs = self._load_data(self.broadcasts_file)
+        job_id = str(max(map(int, jobs), default=0) + 1)
+        recipients_file = self._recipients_file(job_id)
+        os.makedirs(os.path.dirname(recipients_file), exist_ok=True)
+        with open(recipients_file, 'w') as f:
+            json.dump([int(user_id) for user_id in recipients], f)
+        # Recipients are claimed in list order; progress is two offsets into the list
+        jobs[job_id] = {**job, "id": job_id, "claimed": 0, "checkpointed": 0}
+        self._save_data(jobs, self.broadcasts_file)
+        return job_id
+
+    def get_broadcast(self, job_id) -> Optional[Dict]:
+        return self._load_data(self.broadcasts_file).get(str(job_id))
+
+    def update_broadcast(self, job_id, fields: Dict):
+        jobs = self._load_data(self.broadcasts_file)
+        jobs[str(job_id)].update(fields)
+        self._save_data(jobs, self.broadcasts_file)
+
+    def get_unfinished_broadcasts(self):
+        jobs = self._load_data(self.broadcasts_file)
+        return [job for job in jobs.values() if job["status"] != "done"]
+
+    def claim_broadcast_recipients(self, job_id, limit: int):
+        jobs = self._load_data(self.broadcasts_file)
+        job = jobs[str(job_id)]
+        claimed = self._recipients(job_id)[job["claimed"]:job["claimed"] + limit]
+        if claimed:
+            job["claimed"] += len(claimed)
+            self._save_data(jobs, self.broadcasts_file)
+        return claimed
+
+    def acquire_broadcast_lease(self, job_id, owner: str, now: float, lease_until: float) -> bool:
+        jobs = self._load_data(self.broadcasts_file)
+        job = jobs[str(job_id)]
+        if job["status"] == "done":
+            return False
+        if job.get("owner") not in (None, owner) and job.get("lease_until", 0) >= now:
+            return False
+        job["owner"], job["lease_until"] = owner, lease_until
+        self._save_data(jobs, self.broadcasts_file)
+        return True
+
+    def recover_broadcast(self, job_id) -> int:
+        jobs = self._load_data(self.broadcasts_file)
+        job = jobs[str(job_id)]
+        recovered = job["claimed"] - job["checkpointed"]
+        if recovered:
+            job["uncertain"] = job.get("uncertain", 0) + recovered
+            job["checkpointed"] = job["claimed"]
+            self._save_data(jobs, self.broadcasts_file)
+        return recovered
+
+    def checkpoint_broadcast(self, job_id, delivered, failed, users_data: Dict):
+        jobs = self._load_data(self.broadcasts_file)
+        job = jobs[str(job_id)]
+        # One sender holds the lease and checkpoints its batches in claim order
+        job["checkpointed"] = min(job["claimed"], job["checkpointed"] + len(delivered) + len(failed))
+        job["delivered"] += len(delivered)
+        job["failed"] += len(failed)
+        job["updated_at"] = datetime.now().isoformat()
+        # Progress first: after a crash between the two writes a user is
+        # under-charged rather than sent the signal twice
+        self._save_data(jobs, self.broadcasts_file)
+        self.save_users(users_data)
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    """Storage backend on an embedded SQLite database in WAL mode.
+
+    Every operation touches only the affected rows, so the cost of a call
+    does not depend on how many users are stored.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            is_premium INTEGER NOT NULL DEFAULT 0,
+            signals_used INTEGER NOT NULL DEFAULT 0,
+            daily_signals INTEGER NOT NULL DEFAULT 0,
+            last_signal_date TEXT,
+            join_date TEXT,
+            license_key TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_premium ON users(is_premium);
+        CREATE INDEX IF NOT EXISTS idx_users_license_key ON users(license_key);
+
+        CREATE TABLE IF NOT EXISTS licenses (
+            key TEXT PRIMARY KEY,
+            duration_days INTEGER,
+            created_at TEXT,
+            used INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_licenses_used ON licenses(used);
+
+        CREATE TABLE IF NOT EXISTS signals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sent_by INTEGER,
+            created_at TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_signals_created_at ON signals(created_at);
+
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            admin_chat_id INTEGER,
+            status_message_id INTEGER,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            uncertain INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT,
+            owner TEXT,
+            lease_until REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status);
+
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, seq)
+        );
+        CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_state ON broadcast_recipients(job_id, state, seq);
+        CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_user ON broadcast_recipients(job_id, user_id);
+    """
+
+    BROADCAST_FIELDS = ("status_message_id", "status", "updated_at")
+
+    def __init__(self, db_path: str = "data/bot.db", import_dir: Optional[str] = "data"):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(db_path)
+
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+        if is_new and import_dir:
+            self._import_json(import_dir)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    def _migrate(self):
+        """Add columns introduced after a database was created"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(broadcasts)")}
+        for column, definition in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE broadcasts ADD COLUMN {column} {definition}")
+
+    def _import_json(self, data_dir: str):
+        """Copy existing JSON data into a freshly created database"""
+        # Read the files directly: JsonStorage would create the missing ones
+        def read(name: str) -> Dict:
+            path = os.path.join(data_dir, name)
+            if not os.path.exists(path):
+                return {}
+            with open(path, 'r') as f:
+                return json.load(f)
+
+        self.save_users(read("users.json"))
+        for key, license_data in read("licenses.json").items():
+            self.save_license(key, license_data)
+        signals = read("signals.json")
+        for signal_id in sorted(signals, key=int):
+            self.add_signal(signals[signal_id])
+
+    @staticmethod
+    def _user_from_row(row) -> Dict:
+        user = dict(row)
+        user["is_premium"] = bool(user["is_premium"])
+        return user
+
+    @staticmethod
+    def _user_params(user_id, user_data: Dict):
+        return (
+            int(user_id),
+            user_data.get("username"),
+            int(bool(user_data.get("is_premium", False))),
+            user_data.get("signals_used", 0),
+            user_data.get("daily_signals", 0),
+            user_data.get("last_signal_date"),
+            user_data.get("join_date"),
+            user_data.get("license_key"),
+        )
+
+    def get_user(self, user_id) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM users WHERE user_id = ?", (int(user_id),)
+            ).fetchone()
+        return self._user_from_row(row) if row else None
+
+    def save_user(self, user_id, user_data: Dict):
+        self.save_users({user_id: user_data})
+
+    def _upsert_users(self, conn, users_data: Dict):
+        placeholders = ", ".join("?" for _ in USER_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in USER_COLUMNS[1:])
+        conn.executemany(
+            f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {updates}",
+            [self._user_params(user_id, data) for user_id, data in users_data.items()]
+        )
+
+    def save_users(self, users_data: Dict):
+        """Upsert several user records in a single transaction"""
+        if not users_data:
+            return
+        with self._transaction() as conn:
+            self._upsert_users(conn, users_data)
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM users ORDER BY rowid").fetchall()
+        return {str(row["user_id"]): self._user_from_row(row) for row in rows}
+
+    def reserve_signal(self, user_id, day: str, daily_limit: int, free_limit: int) -> Optional[Dict]:
+        """Check the limit and charge the signal in one write transaction"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+            if row is None:
+                return None
+            user = self._user_from_row(row)
+            if not reserve_signal(user, day, daily_limit, free_limit):
+                return None
+            conn.execute(
+                "UPDATE users SET signals_used = ?, daily_signals = ?, last_signal_date = ? WHERE user_id = ?",
+                (user["signals_used"], user["daily_signals"], user["last_signal_date"], int(user_id))
+            )
+        return user
+
+    def release_signal(self, user_id, day: str):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+            if row is None:
+                return
+            user = self._user_from_row(row)
+            release_signal(user, day)
+            conn.execute(
+                "UPDATE users SET signals_used = ?, daily_signals = ? WHERE user_id = ?",
+                (user["signals_used"], user["daily_signals"], int(user_id))
+            )
+
+    def get_license(self, key) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM licenses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        license_data = dict(row)
+        license_data["used"] = bool(license_data["used"])
+        return license_data
+
+    @staticmethod
+    def _upsert_license(conn, key, license_data: Dict):
+        conn.execute(
+            "INSERT INTO licenses (key, duration_days, created_at, used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET duration_days = excluded.duration_days, "
+            "created_at = excluded.created_at, used = excluded.used",
+            (
+                key,
+                license_data.get("duration_days"),
+                license_data.get("created_at"),
+                int(bool(license_data.get("used", False))),
+            )
+        )
+
+    def save_license(self, key, license_data: Dict):
+        with self._transaction() as conn:
+            self._upsert_license(conn, key, license_data)
+
+    def save_license_and_user(self, key, license_data: Dict, user_id, user_data: Dict):
+        """Write a license and the user holding it in one transaction"""
+        with self._transaction() as conn:
+            self._upsert_license(conn, key, license_data)
+            self._upsert_users(conn, {user_id: user_data})
+
+    def add_signal(self, signal_data: Dict) -> str:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO signals (sent_by, created_at, data) VALUES (?, ?, ?)",
+                (signal_data.get("sent_by"), signal_data.get("created_at"), json.dumps(signal_data))
+            )
+        return str(cursor.lastrowid)
+
+    @staticmethod
+    def _broadcast_from_row(row) -> Dict:
+        job = dict(row)
+        job["id"] = str(job["id"])
+        return job
+
+    def create_broadcast(self, job: Dict, recipients) -> str:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO broadcasts (text, admin_chat_id, status_message_id, status, total, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job["text"], job.get("admin_chat_id"), job.get("status_message_id"),
+                    job["status"], job["total"], job.get("created_at"), job.get("updated_at"),
+                )
+            )
+            job_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO broadcast_recipients (job_id, seq, user_id) VALUES (?, ?, ?)",
+                [(job_id, seq, int(user_id)) for seq, user_id in enumerate(recipients)]
+            )
+        return str(job_id)
+
+    def get_broadcast(self, job_id) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM broadcasts WHERE id = ?", (int(job_id),)).fetchone()
+        return self._broadcast_from_row(row) if row else None
+
+    def update_broadcast(self, job_id, fields: Dict):
+        columns = [column for column in fields if column in self.BROADCAST_FIELDS]
+        if not columns:
+            return
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE broadcasts SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [fields[column] for column in columns] + [int(job_id)]
+            )
+
+    def get_unfinished_broadcasts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM broadcasts WHERE status != 'done' ORDER BY id"
+            ).fetchall()
+        return [self._broadcast_from_row(row) for row in rows]
+
+    def claim_broadcast_recipients(self, job_id, limit: int):
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT seq, user_id FROM broadcast_recipients WHERE job_id = ? AND state = ? "
+                "ORDER BY seq LIMIT ?",
+                (int(job_id), RECIPIENT_PENDING, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE broadcast_recipients SET state = ? WHERE job_id = ? AND seq = ?",
+                [(RECIPIENT_CLAIMED, int(job_id), row["seq"]) for row in rows]
+            )
+        return [row["user_id"] for row in rows]
+
+    def acquire_broadcast_lease(self, job_id, owner: str, now: float, lease_until: float) -> bool:
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE broadcasts SET owner = ?, lease_until = ? WHERE id = ? AND status != 'done' "
+                "AND (owner IS NULL OR owner = ? OR lease_until < ?)",
+                (owner, lease_until, int(job_id), owner, now)
+            ).rowcount == 1
+
+    def recover_broadcast(self, job_id) -> int:
+        with self._transaction() as conn:
+            recovered = conn.execute(
+                "UPDATE broadcast_recipients SET state = ? WHERE job_id = ? AND state = ?",
+                (RECIPIENT_UNCERTAIN, int(job_id), RECIPIENT_CLAIMED)
+            ).rowcount
+            if recovered:
+                conn.execute(
+                    "UPDATE broadcasts SET uncertain = uncertain + ? WHERE id = ?",
+                    (recovered, int(job_id))
+                )
+        return recovered
+
+    def checkpoint_broadcast(self, job_id, delivered, failed, users_data: Dict):
+        """Record recipient outcomes and charged users in one transaction"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE broadcast_recipients SET state = ? WHERE job_id = ? AND user_id = ?",
+                [(RECIPIENT_DELIVERED, int(job_id), int(user_id)) for user_id in delivered]
+                + [(RECIPIENT_FAILED, int(job_id), int(user_id)) for user_id in failed]
+            )
+            conn.execute(
+                "UPDATE broadcasts SET delivered = delivered + ?, failed = failed + ?, updated_at = ? "
+                "WHERE id = ?",
+                (len(delivered), len(failed), datetime.now().isoformat(), int(job_id))
+            )
+            if users_data:
+                self._upsert_users(conn, users_data)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: Optional[str] = None):
+    """Build the storage backend selected in config"""
+    backend = backend or config.STORAGE_BACKEND
+    if backend == "sqlite":
+        storage = SqliteStorage(config.SQLITE_DB_PATH, import_dir=config.DATA_DIR)
+    elif backend == "json":
+        storage = JsonStorage(config.DATA_DIR)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    # Time the backend itself, so cache hits do not hide its latency
+    if config.METRICS_ENABLED:
+        from metrics import TimedStorage
+        storage = TimedStorage(storage)
+
+    use_cache = config.USER_CACHE_ENABLED
+    if use_cache and config.SHARED_CACHE_ENABLED:
+        # Other bot processes write the same users; a write-behind copy here would go stale
+        logger.warning("USER_CACHE_ENABLED is ignored while SHARED_CACHE_ENABLED runs several bot processes")
+        use_cache = False
+    if use_cache:
+        from user_cache import CachedStorage
+        storage = CachedStorage(
+            storage,
+            flush_interval=config.USER_CACHE_FLUSH_INTERVAL,
+            flush_threshold=config.USER_CACHE_FLUSH_THRESHOLD,
+            max_entries=config.USER_CACHE_MAX_ENTRIES
+        )
+        if config.METRICS_ENABLED:
+            from metrics import track_user_cache
+            track_user_cache(storage.stats)
+    return storage
+
+
+class Database:
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else create_storage()
+        # Compound operations (read-modify-write) must not interleave
+        self._lock = threading.RLock()
+
+    def get_user(self, user_id):
+        return self.storage.get_user(user_id)
+
+    def save_user(self, user_id, user_data):
+        self.storage.save_user(user_id, user_data)
+
+    def get_all_users(self):
+        return self.storage.get_all_users()
 
     def create_user(self, user_id, username):
         user_data = {
@@ -41,31 +609,52 @@ class Database:
             "is_premium": False,
             "signals_used": 0,
             "daily_signals": 0,
-            "last_signal_date": datetime.now().strftime("%Y-%m-%d"),
+            "last_signal_date": current_day(),
             "join_date": datetime.now().isoformat(),
             "license_key": None
         }
         self.save_user(user_id, user_data)
         return user_data
 
+    @staticmethod
+    def _apply_signal_use(user):
+        # Për përdoruesit premium, resetojmë numëruesin ditor nëse është ditë e re
+        if user["is_premium"]:
+            current_date = current_day()
+            if user.get('last_signal_date') != current_date:
+                user['daily_signals'] = 0
+                user['last_signal_date'] = current_date
+
+        # Rrisim numëruesit përkatës
+        user['signals_used'] += 1
+        if user["is_premium"]:
+            user['daily_signals'] += 1
+
     def add_signal_use(self, user_id):
-        user = self.get_user(user_id)
-        if user:
-            # Për përdoruesit premium, resetojmë numëruesin ditor nëse është ditë e re
-            if user["is_premium"]:
-                current_date = datetime.now().strftime("%Y-%m-%d")
-                if user.get('last_signal_date') != current_date:
-                    user['daily_signals'] = 0
-                    user['last_signal_date'] = current_date
-
-            # Rrisim numëruesit përkatës
-            user['signals_used'] += 1
-            if user["is_premium"]:
-                user['daily_signals'] += 1
-
-            self.save_user(user_id, user)
-            return user['signals_used']
-        return 0
+        with self._lock:
+            user = self.get_user(user_id)
+            if user:
+                self._apply_signal_use(user)
+                self.save_user(user_id, user)
+                return user['signals_used']
+            return 0
+
+    def reserve_signal_use(self, user_id, day: Optional[str] = None) -> Optional[Dict]:
+        """Atomically check the user's limit and charge one signal.
+
+        Returns the updated user, or None if the user is unknown or has no
+        signals left. Call release_signal_use() if the signal is then not
+        delivered.
+        """
+        with self._lock:
+            return self.storage.reserve_signal(
+                user_id, day or current_day(), config.PREMIUM_DAILY_LIMIT, config.FREE_SIGNAL_LIMIT
+            )
+
+    def release_signal_use(self, user_id, day: Optional[str] = None):
+        """Refund a signal reserved on `day` (today) that could not be delivered"""
+        with self._lock:
+            self.storage.release_signal(user_id, day or current_day())
 
     def get_daily_signals(self, user_id):
         user = self.get_user(user_id)
@@ -74,65 +663,122 @@ class Database:
             if not user["is_premium"]:
                 return user.get('signals_used', 0)
 
-            # Për përdoruesit premium, kontrollojmë vetëm sinjalet ditore
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            if user.get('last_signal_date') != current_date:
-                user['daily_signals'] = 0
-                user['last_signal_date'] = current_date
-                self.save_user(user_id, user)
+            # Për përdoruesit premium, numëruesi vlen vetëm për ditën e ruajtur;
+            # rivendoset në shkrimin e radhës, jo gjatë leximit
+            if user.get('last_signal_date') != current_day():
+                return 0
             return user['daily_signals']
         return 0
 
     def create_license(self, key, duration_days):
-        licenses = self._load_data(self.licenses_file)
-        licenses[key] = {
+        self.storage.save_license(key, {
             "key": key,
             "duration_days": duration_days,
             "created_at": datetime.now().isoformat(),
             "used": False
-        }
-        self._save_data(licenses, self.licenses_file)
+        })
 
     def activate_license(self, user_id, license_key):
-        licenses = self._load_data(self.licenses_file)
-        if license_key in licenses and not licenses[license_key]["used"]:
-            user = self.get_user(user_id)
-            if user:
-                user["is_premium"] = True
-                user["license_key"] = license_key
-                licenses[license_key]["used"] = True
-                self._save_data(licenses, self.licenses_file)
-                self.save_user(user_id, user)
-                return True
-        return False
+        with self._lock:
+            license_data = self.storage.get_license(license_key)
+            if license_data and not license_data["used"]:
+                user = self.get_user(user_id)
+                if user:
+                    user["is_premium"] = True
+                    user["license_key"] = license_key
+                    license_data["used"] = True
+                    self.storage.save_license_and_user(license_key, license_data, user_id, user)
+                    return True
+            return False
 
     def save_signal(self, signal_data):
-        signals = self._load_data(self.signals_file)
-        signal_id = str(len(signals) + 1)
-        signals[signal_id] = {
+        return self.storage.add_signal({
             **signal_data,
             "created_at": datetime.now().isoformat()
-        }
-        self._save_data(signals, self.signals_file)
+        })
 
     def remove_user_license(self, user_id):
         """Remove license from a user"""
-        user = self.get_user(user_id)
-        if user and user["is_premium"]:
-            # Get the current license key
-            license_key = user["license_key"]
-
-            # Update user data
-            user["is_premium"] = False
-            user["license_key"] = None
-            self.save_user(user_id, user)
-
-            # Mark license as unused so it can be used again
-            if license_key:
-                licenses = self._load_data(self.licenses_file)
-                if license_key in licenses:
-                    licenses[license_key]["used"] = False
-                    self._save_data(licenses, self.licenses_file)
-
-            return True
-        return False
\ No newline at end of file
+        with self._lock:
+            user = self.get_user(user_id)
+            if user and user["is_premium"]:
+                # Get the current license key
+                license_key = user["license_key"]
+
+                # Update user data
+                user["is_premium"] = False
+                user["license_key"] = None
+
+                # Mark license as unused so it can be used again
+                license_data = self.storage.get_license(license_key) if license_key else None
+                if license_data:
+                    license_data["used"] = False
+                    self.storage.save_license_and_user(license_key, license_data, user_id, user)
+                else:
+                    self.save_user(user_id, user)
+
+                return True
+            return False
+
+    def create_broadcast(self, text, admin_chat_id, recipients, status_message_id=None):
+        """Store a broadcast job with its recipient list and return its id"""
+        now = datetime.now().isoformat()
+        return self.storage.create_broadcast({
+            "text": text,
+            "admin_chat_id": admin_chat_id,
+            "status_message_id": status_message_id,
+            "status": "running",
+            "total": len(recipients),
+            "delivered": 0,
+            "failed": 0,
+            "uncertain": 0,
+            "created_at": now,
+            "updated_at": now
+        }, recipients)
+
+    def get_broadcast(self, job_id):
+        return self.storage.get_broadcast(job_id)
+
+    def update_broadcast(self, job_id, fields):
+        self.storage.update_broadcast(job_id, {**fields, "updated_at": datetime.now().isoformat()})
+
+    def get_unfinished_broadcasts(self):
+        return self.storage.get_unfinished_broadcasts()
+
+    def claim_broadcast_recipients(self, job_id, limit):
+        """Mark the next recipients as being sent to and return their ids"""
+        return self.storage.claim_broadcast_recipients(job_id, limit)
+
+    def acquire_broadcast_lease(self, job_id, owner):
+        """Take or renew the right to send a broadcast; False while another process holds it"""
+        now = time.time()
+        return self.storage.acquire_broadcast_lease(job_id, owner, now, now + config.BROADCAST_LEASE_SECONDS)
+
+    def recover_broadcast(self, job_id):
+        """Retire recipients whose send outcome was lost in a restart"""
+        return self.storage.recover_broadcast(job_id)
+
+    def checkpoint_broadcast(self, job_id, delivered, failed):
+        """Record a batch of outcomes and charge delivered free users in the same write"""
+        with self._lock:
+            charged = {}
+            for user_id in delivered:
+                user = self.get_user(user_id)
+                if user and not user["is_premium"]:
+                    self._apply_signal_use(user)
+                    charged[user_id] = user
+            self.storage.checkpoint_broadcast(job_id, delivered, failed, charged)
+            return len(charged)
+
+    def flush(self):
+        """Write pending cached changes to the backend, if a cache is in use"""
+        if hasattr(self.storage, "flush"):
+            self.storage.flush()
+
+    def cache_stats(self):
+        if hasattr(self.storage, "stats"):
+            return self.storage.stats()
+        return None
+
+    def close(self):
+        self.storage.close()
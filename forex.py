@@ -1,18 +1,65 @@
-import requests
+import asyncio
+import httpx
 import config
 from datetime import datetime, timedelta
 import random
 import logging
 import time
-from typing import Dict, Optional
-import json
-import os
+from typing import Callable, Dict, List, Optional, Tuple
+from market_client import MarketDataClient, get_client
+from singleflight import SingleFlight
+from key_scheduler import create_key_scheduler
+from triangulation import RateGraph
+from signal_cache import SignalCache, FRESH, STALE
+from shared_cache import SharedQuoteCache
+from signals import get_signal_type, get_trading_duration, signal_from_quote
+import metrics
+from profiling import traced
 
 logger = logging.getLogger(__name__)
 
 # Cache për të ruajtur rezultatet e fundit
-_signal_cache: Dict[str, Dict] = {}
-_cache_file = "data/signal_cache.json"
+_signal_cache = SignalCache(
+    config.SIGNAL_CACHE_FILE,
+    config.SIGNAL_CACHE_LOG_FILE,
+    ttl=config.CACHE_DURATION,
+    stale_window=config.CACHE_STALE_WINDOW,
+    max_entries=config.SIGNAL_CACHE_MAX_ENTRIES,
+    compact_every=config.SIGNAL_CACHE_COMPACT_EVERY
+)
+_signal_cache.load()
+
+# Stale-while-revalidate refreshes running in the background
+_background_refreshes = set()
+
+# Rendered message body per pair, tagged with the snapshot version it was built from
+_rendered_messages: Dict[str, Tuple[int, str]] = {}
+
+# Called with every real (non-demo) quote stored in the cache
+_quote_listeners: List[Callable[[Dict], None]] = []
+
+# Concurrent cache misses for the same pair share one upstream fetch
+_fetch_group = SingleFlight()
+
+# Picks an API key with remaining quota for each request
+_key_scheduler = create_key_scheduler()
+
+# Cross pairs are computed from their USD legs
+_rate_graph = RateGraph(config.FOREX_PAIRS, anchor=config.TRIANGULATION_ANCHOR)
+
+def _create_shared_quotes() -> Optional[SharedQuoteCache]:
+    if not config.SHARED_CACHE_ENABLED:
+        return None
+    try:
+        return SharedQuoteCache(
+            config.SHARED_CACHE_NAME,
+            get_refresh_pairs(),
+            config.SHARED_CACHE_LOCK_FILE,
+            payload_size=config.SHARED_CACHE_PAYLOAD_SIZE
+        )
+    except (OSError, ValueError) as e:
+        logger.error(f"Shared quote cache unavailable, using the local cache only: {e}")
+        return None
 
 def _generate_demo_data(pair: str) -> Dict:
     """Generate demo data when API fails"""
@@ -48,197 +95,244 @@ def _generate_demo_data(pair: str) -> Dict:
         "trend": random.choice(["⬆️ RRITËSE", "⬇️ ZBRITËSE"]),
         "bid": bid,
         "ask": ask,
-        "is_demo": True
+        "is_demo": True,
+        "source": "direct"
     }
 
     return signal_data
 
-def get_forex_data(pair: str, is_premium: bool = False, max_retries: int = 3) -> Optional[Dict]:
-    """Get forex data from Alpha Vantage API with retry mechanism and caching"""
-    if not _signal_cache:
-        _load_cache()
-
-    if pair in _signal_cache:
-        cached_data = _signal_cache[pair]
-        cache_time = datetime.fromisoformat(cached_data['timestamp'])
-        time_since_cache = (datetime.now() - cache_time).total_seconds()
-        time_until_refresh = max(0, config.CACHE_DURATION - time_since_cache)
-
-        if time_since_cache < config.CACHE_DURATION:
-            logger.info(f"Using cached data for {pair}. Next refresh in {int(time_until_refresh)} seconds")
-            return cached_data
-        else:
-            logger.info(f"Cache expired for {pair}, refreshing data from API")
-
-    # First try with premium API if user is premium
-    if is_premium:
-        api_keys = [config.ALPHA_VANTAGE_API_KEYS["premium"], config.ALPHA_VANTAGE_API_KEYS["free"]]
-    else:
-        api_keys = [config.ALPHA_VANTAGE_API_KEYS["free"]]
-
-    for api_key in api_keys:
-        for attempt in range(max_retries):
+def get_time_until_refresh(signal_data: Dict) -> float:
+    """Seconds until a cached signal expires.
+
+    Uses the local time the quote was fetched; the API timestamp is in the
+    exchange's timezone and can lag behind the fetch.
+    """
+    return _signal_cache.time_until_expiry(signal_data)
+
+def _build_signal(pair: str, exchange_data: Dict) -> Dict:
+    """Turn an Alpha Vantage exchange-rate payload into signal data"""
+    return signal_from_quote(
+        pair,
+        close=float(exchange_data["5. Exchange Rate"]),
+        bid=float(exchange_data["8. Bid Price"]),
+        ask=float(exchange_data["9. Ask Price"]),
+        timestamp=exchange_data["6. Last Refreshed"]
+    )
+
+def add_quote_listener(listener: Callable[[Dict], None]):
+    """Register a callback that receives every new real quote"""
+    _quote_listeners.append(listener)
+
+def _store_signal(pair: str, signal_data: Dict):
+    fetched_at = datetime.now()
+    signal_data["fetched_at"] = fetched_at.isoformat()
+    _signal_cache.put(pair, signal_data)
+    if _shared_quotes is not None and not signal_data.get("is_demo"):
+        _shared_quotes.put(pair, signal_data, fetched_at.timestamp())
+
+    if not signal_data.get("is_demo"):
+        _notify_quote_listeners(signal_data)
+
+def _notify_quote_listeners(signal_data: Dict):
+    for listener in _quote_listeners:
+        try:
+            listener(signal_data)
+        except Exception as e:
+            logger.error(f"Quote listener failed for {signal_data.get('pair')}: {e}")
+
+def _adopt_shared(pair: str) -> bool:
+    """Take the shared-memory quote for `pair` if another process stored a newer one.
+
+    Listeners are only registered in the primary process, and a quote it
+    stored or synced itself is not newer, so each quote reaches them once.
+    """
+    if _shared_quotes is None:
+        return False
+    signal_data = _shared_quotes.get(pair)
+    if signal_data is None or not _signal_cache.merge(pair, signal_data):
+        return False
+    _notify_quote_listeners(signal_data)
+    return True
+
+def sync_cache() -> int:
+    """Pick up quotes other processes stored in the shared cache files or shared memory"""
+    synced = _signal_cache.sync()
+    for signal_data in synced:
+        if not signal_data.get("is_demo"):
+            _notify_quote_listeners(signal_data)
+    adopted = sum(_adopt_shared(pair) for pair in _shared_quotes.pairs) if _shared_quotes is not None else 0
+    return len(synced) + adopted
+
+def is_refresher() -> bool:
+    """Whether this process runs the background refresh; always true without a shared cache"""
+    return _shared_quotes is None or _shared_quotes.is_refresher()
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter between retries"""
+    base = config.API_RETRY_BACKOFF
+    return base * (2 ** attempt) + random.uniform(0, base)
+
+async def _fetch_forex_data(pair: str, is_premium: bool, max_retries: int,
+                            client: MarketDataClient) -> Dict:
+    """Fetch a fresh quote from the API, falling back to demo data"""
+    base, quote = pair.split('/')
+    for attempt in range(max_retries):
+        # Only send the request on a key that still has quota left; the
+        # usage store is shared with other processes, so keep its writes off the loop
+        api_key = await asyncio.to_thread(_key_scheduler.acquire, is_premium)
+        if api_key is None:
+            logger.warning(f"No API key has quota left for {pair}")
+            metrics.API_KEYS_EXHAUSTED.inc()
+            break
+
+        try:
+            logger.info(f"Fetching forex data for {pair} with key '{api_key.name}' (attempt {attempt + 1}/{max_retries})")
+            started = time.perf_counter()
             try:
-                base, quote = pair.split('/')
-                logger.info(f"Fetching forex data for {pair} (attempt {attempt + 1}/{max_retries})")
-
-                url = "https://www.alphavantage.co/query"
-                params = {
-                    "function": "CURRENCY_EXCHANGE_RATE",
-                    "from_currency": base,
-                    "to_currency": quote,
-                    "apikey": api_key
-                }
-
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                if "Realtime Currency Exchange Rate" in data:
-                    exchange_data = data["Realtime Currency Exchange Rate"]
-
-                    close = float(exchange_data["5. Exchange Rate"])
-                    bid = float(exchange_data["8. Bid Price"])
-                    ask = float(exchange_data["9. Ask Price"])
-
-                    # Përmirësojmë trendin duke përdorur spread
-                    spread = ask - bid
-                    spread_percentage = spread / close
-
-                    # Trend më realist bazuar në spread
-                    if spread_percentage < 0.0001:  # Spread shumë i ngushtë
-                        trend_direction = 1  # Trend pozitiv
-                    elif spread_percentage > 0.0003:  # Spread i gjerë
-                        trend_direction = -1  # Trend negativ
-                    else:
-                        trend_direction = 0  # Neutral
-
-                    # Forcë e sinjalit më realiste
-                    strength = 1 - (spread_percentage * 1000)  # Normalize spread impact
-                    strength = min(max(strength, 0), 1)  # Keep between 0 and 1
-
-                    # Përshtatim forcën bazuar në trendin
-                    if trend_direction != 0:
-                        strength = strength * (0.8 + (0.4 * random.random()))  # Add some randomness
-                    else:
-                        strength = strength * 0.5  # Weaken neutral signals
-
-                    signal_data = {
-                        "pair": pair,
-                        "price": close,
-                        "strength": strength,
-                        "signal": get_signal_type(strength),
-                        "timestamp": exchange_data["6. Last Refreshed"],
-                        "trend": "⬆️ RRITËSE" if trend_direction > 0 else "⬇️ ZBRITËSE" if trend_direction < 0 else "➡️ NEUTRALE",
-                        "bid": bid,
-                        "ask": ask,
-                        "is_demo": False
-                    }
-
-                    _signal_cache[pair] = signal_data
-                    _save_cache()
-
-                    logger.info(f"Successfully generated signal for {pair}")
-                    return signal_data
-
-                elif "Note" in data:
-                    logger.warning(f"API rate limit hit for key {api_key}: {data['Note']}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2)
-                        continue
-                    # If this is the last API key, generate demo data
-                    if api_key == api_keys[-1]:
-                        logger.info(f"All API keys exhausted, generating demo data for {pair}")
-                        demo_data = _generate_demo_data(pair)
-                        _signal_cache[pair] = demo_data
-                        _save_cache()
-                        return demo_data
-                    break  # Try next API key
-
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Request error for {pair}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(2)
-                    continue
-                if api_key == api_keys[-1]:
-                    # Generate demo data as fallback after all retries
-                    logger.info(f"Generating demo data as fallback for {pair} after request error")
-                    demo_data = _generate_demo_data(pair)
-                    _signal_cache[pair] = demo_data
-                    _save_cache()
-                    return demo_data
-                break  # Try next API key
-
-            except Exception as e:
-                logger.error(f"Error processing forex data for {pair}: {str(e)}")
-                if attempt == max_retries - 1 and api_key == api_keys[-1]:
-                    # Generate demo data after all retries failed
-                    logger.info(f"Generating demo data after all retries failed for {pair}")
-                    demo_data = _generate_demo_data(pair)
-                    _signal_cache[pair] = demo_data
-                    _save_cache()
-                    return demo_data
-                time.sleep(2)
-                continue
+                data = await client.get_exchange_rate(base, quote, api_key.key)
+            finally:
+                metrics.API_LATENCY.observe(time.perf_counter() - started, key=api_key.name)
+
+            if "Realtime Currency Exchange Rate" in data:
+                signal_data = _build_signal(pair, data["Realtime Currency Exchange Rate"])
+                _store_signal(pair, signal_data)
+
+                logger.info(f"Successfully generated signal for {pair}")
+                return signal_data
+
+            elif "Note" in data:
+                # The key's quota model was off; mark it spent and move to another key
+                logger.warning(f"API rate limit hit for key '{api_key.name}': {data['Note']}")
+                metrics.API_RATE_LIMITED.inc(key=api_key.name)
+                await asyncio.to_thread(_key_scheduler.report_rate_limited, api_key)
+
+            else:
+                metrics.API_ERRORS.inc(key=api_key.name, kind="unexpected_response")
+
+        except httpx.HTTPError as e:
+            logger.error(f"Request error for {pair}: {str(e)}")
+            metrics.API_ERRORS.inc(key=api_key.name, kind="http")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(_retry_delay(attempt))
+
+        except Exception as e:
+            logger.error(f"Error processing forex data for {pair}: {str(e)}")
+            metrics.API_ERRORS.inc(key=api_key.name, kind="invalid_data")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(_retry_delay(attempt))
 
     # If we get here, all API keys failed
     logger.error(f"All API keys failed for {pair}, generating demo data")
     demo_data = _generate_demo_data(pair)
-    _signal_cache[pair] = demo_data
-    _save_cache()
+    _store_signal(pair, demo_data)
     return demo_data
 
-def _load_cache():
-    """Load signal cache from file"""
-    global _signal_cache
-    try:
-        if os.path.exists(_cache_file):
-            with open(_cache_file, 'r') as f:
-                _signal_cache = json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading cache: {e}")
-        _signal_cache = {}
-
-def _save_cache():
-    """Save signal cache to file"""
-    try:
-        os.makedirs(os.path.dirname(_cache_file), exist_ok=True)
-        with open(_cache_file, 'w') as f:
-            json.dump(_signal_cache, f)
-    except Exception as e:
-        logger.error(f"Error saving cache: {e}")
-
-def get_signal_type(strength):
-    """Determine signal type based on strength"""
-    if strength >= 0.90:  # Increased threshold for stronger buy signals
-        return "STRONG_BUY"
-    elif strength >= 0.75:  # Moderate buy needs higher confidence
-        return "MODERATE_BUY"
-    elif strength <= 0.10:  # Very low strength for strong sell
-        return "STRONG_SELL"
-    elif strength <= 0.25:  # Decreased threshold for moderate sell
-        return "MODERATE_SELL"
-    else:
-        return "NEUTRAL"
-
-def get_trading_duration(strength, trend):
-    """Calculate recommended trading duration based on signal strength and trend"""
-    if trend == "⬆️ RRITËSE":
-        base_duration = 5  # 5 minute base for upward trend
-    elif trend == "⬇️ ZBRITËSE":
-        base_duration = 3  # 3 minute base for downward trend
-    else:
-        return None  # No duration recommendation for neutral trend
+async def _derive_forex_data(pair: str, is_premium: bool, max_retries: int,
+                             client: MarketDataClient) -> Dict:
+    """Compute a cross pair from its anchor legs instead of calling the API"""
+    legs = _rate_graph.legs_for(pair)
+    leg_quotes = await asyncio.gather(*[
+        get_forex_data_async(leg, is_premium, max_retries, client) for leg in legs
+    ])
+    derived = _rate_graph.derive(pair, dict(zip(legs, leg_quotes)))
+
+    signal_data = signal_from_quote(
+        pair, derived["price"], derived["bid"], derived["ask"], derived["timestamp"], source="derived"
+    )
+    signal_data["legs"] = derived["legs"]
+    signal_data["is_demo"] = derived["is_demo"]
+    # The cross is cached from now, like a fetched quote, so the refresh
+    # cycle keeps it warm; the age of its data is kept separately
+    signal_data["legs_fetched_at"] = derived["legs_fetched_at"]
+    _store_signal(pair, signal_data)
+    logger.info(f"Derived signal for {pair} from {', '.join(legs)}")
+    return signal_data
 
-    # Adjust duration based on signal strength - only recommend for very strong signals
-    if strength >= 0.90:  # Strong signals only
-        multiplier = 1.5  # Longer duration for very strong signals
-    elif strength >= 0.75:
-        multiplier = 1.0  # Base duration for moderate signals
-    else:
-        return None  # No duration recommendation for weak signals
+def _fetcher_for(pair: str):
+    if config.TRIANGULATION_ENABLED and _rate_graph.is_derived(pair):
+        return _derive_forex_data
+    return _fetch_forex_data
+
+@traced
+async def get_forex_data_async(pair: str, is_premium: bool = False, max_retries: int = 3,
+                               client: Optional[MarketDataClient] = None) -> Optional[Dict]:
+    """Get forex data from Alpha Vantage API with retry mechanism and caching"""
+    _adopt_shared(pair)
+    cached_data, state = _signal_cache.lookup(pair)
+    fetcher = _fetcher_for(pair)
+    fetch = lambda: fetcher(pair, is_premium, max_retries, client or get_client())
+
+    if state == FRESH:
+        metrics.CACHE_LOOKUPS.inc(result="fresh")
+        logger.info(f"Using cached data for {pair}. Next refresh in {int(get_time_until_refresh(cached_data))} seconds")
+        return _served(pair, cached_data)
+
+    if state == STALE:
+        metrics.CACHE_LOOKUPS.inc(result="stale")
+        # Serve the stale entry now and refresh it in the background
+        logger.info(f"Serving stale data for {pair} while it is refreshed")
+        task = asyncio.ensure_future(_fetch_group.do(pair, fetch))
+        _background_refreshes.add(task)
+        task.add_done_callback(_background_refreshes.discard)
+        return _served(pair, cached_data)
+
+    metrics.CACHE_LOOKUPS.inc(result="miss")
+    logger.info(f"Cache expired for {pair}, refreshing data from API")
+    return _served(pair, await _fetch_group.do(pair, fetch))
+
+def _served(pair: str, signal_data: Optional[Dict]) -> Optional[Dict]:
+    if signal_data and signal_data.get("is_demo"):
+        metrics.DEMO_SERVED.inc(pair=pair)
+    return signal_data
+
+async def refresh_pair(pair: str, max_retries: int = 3,
+                       client: Optional[MarketDataClient] = None) -> Dict:
+    """Fetch a pair from the API regardless of the cache state.
+
+    Derived pairs are recomputed from their (cached) legs.
+    """
+    fetcher = _fetcher_for(pair)
+    return await _fetch_group.do(
+        pair, lambda: fetcher(pair, True, max_retries, client or get_client())
+    )
 
-    return int(base_duration * multiplier)
+def get_refresh_pairs() -> List[str]:
+    """Pairs the background refresher has to keep warm, legs first"""
+    if not config.TRIANGULATION_ENABLED:
+        return list(config.FOREX_PAIRS)
+    return list(dict.fromkeys(_rate_graph.base_legs() + config.FOREX_PAIRS))
+
+# Latest quotes shared with the other bot processes on this host
+_shared_quotes = _create_shared_quotes()
+
+def get_key_budgets() -> Dict[str, Dict]:
+    """Remaining per-minute and per-day budget for each API key"""
+    return _key_scheduler.get_budgets()
+
+def get_fetch_stats() -> Dict[str, int]:
+    """Upstream fetches started and requests coalesced onto them"""
+    return _fetch_group.stats()
+
+def get_forex_data(pair: str, is_premium: bool = False, max_retries: int = 3) -> Optional[Dict]:
+    """Blocking wrapper around get_forex_data_async for scripts.
+
+    Must not be called from a running event loop; async code should await
+    get_forex_data_async instead.
+    """
+    async def _run():
+        client = MarketDataClient()
+        try:
+            return await get_forex_data_async(pair, is_premium, max_retries, client=client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(_run())
+
+def close_cache():
+    """Fold the cache log into the snapshot file on shutdown"""
+    _signal_cache.close()
+    if _shared_quotes is not None:
+        _shared_quotes.close()
 
 def format_signal_message(signal_data):
     """Format signal data into a readable message"""
@@ -280,4 +374,18 @@ def format_signal_message(signal_data):
     else:
         message += "\n\n⚠️ Nuk ka sinjal të qartë - Rekomandohet të prisni"
 
-    return message
\ No newline at end of file
+    return message
+
+def get_signal_message(signal_data):
+    """Formatted signal body, rendered once per cached snapshot version"""
+    if not signal_data or "version" not in signal_data:
+        return format_signal_message(signal_data)
+
+    pair = signal_data["pair"]
+    rendered = _rendered_messages.get(pair)
+    if rendered and rendered[0] == signal_data["version"]:
+        return rendered[1]
+
+    message = format_signal_message(signal_data)
+    _rendered_messages[pair] = (signal_data["version"], message)
+    return message
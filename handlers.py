@@ -2,7 +2,12 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKe
 from telegram.ext import ContextTypes
 import config
 from database import Database
-from forex import get_forex_data, format_signal_message
+from quota import QuotaService, daily_signals
+from forex import get_forex_data_async, get_signal_message, get_time_until_refresh, get_fetch_stats, get_key_budgets
+from refresher import pair_refresher
+from broadcast import create_broadcast_job, run_broadcast_job
+from bars import bar_store, TIMEFRAMES
+import profiling
 import random
 import string
 import logging
@@ -15,6 +20,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 db = Database()
+quotas = QuotaService(db)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -84,7 +90,6 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user:
         status = "Premium ✨" if user["is_premium"] else "Free 🆓"
         signals_used = user["signals_used"]
-        daily_signals = user.get("daily_signals", 0)
 
         message = f"""
 📊 Statusi juaj:
@@ -92,7 +97,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📈 Sinjale të përdorura: {signals_used}
 """
         if user["is_premium"]:
-            message += f"🔄 Sinjale sot: {daily_signals}/{config.PREMIUM_DAILY_LIMIT}\n"
+            message += f"🔄 Sinjale sot: {quotas.used_today(user)}/{config.PREMIUM_DAILY_LIMIT}\n"
             message += "✨ Ju keni akses në të gjitha funksionet premium!"
             keyboard = [[InlineKeyboardButton("📊 Merr Sinjal të Ri", callback_data="get_manual_signal")]]
         else:
@@ -116,6 +121,17 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(message, reply_markup=reply_markup)
 
 
+def _daily_limit_message() -> str:
+    # Time until the next midnight in the quota reset timezone
+    seconds_until_reset = quotas.time_until_reset()
+    hours_until_reset = int(seconds_until_reset / 3600)
+    minutes_until_reset = int((seconds_until_reset % 3600) / 60)
+    return (
+        f"🕒 Keni arritur limitin ditor prej {config.PREMIUM_DAILY_LIMIT} sinjalesh.\n"
+        f"Ju lutemi prisni edhe {hours_until_reset} orë dhe {minutes_until_reset} minuta "
+        "për të marrë sinjale të tjera."
+    )
+
 async def manual_signal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     logger.info(f"Manual signal requested by user {user_id}")
@@ -143,34 +159,18 @@ async def manual_signal_command(update: Update, context: ContextTypes.DEFAULT_TY
             return
     else:
         # Check daily signal limit for premium users
-        daily_signals = db.get_daily_signals(user_id)
-        if daily_signals >= config.PREMIUM_DAILY_LIMIT:
+        if quotas.remaining(user) == 0:
             logger.info(f"Premium user {user_id} reached daily manual signal limit")
-            # Calculate time until next reset (midnight)
-            now = datetime.now()
-            next_reset = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            if now >= next_reset:
-                next_reset = next_reset.replace(day=now.day + 1)
-
-            hours_until_reset = int((next_reset - now).total_seconds() / 3600)
-            minutes_until_reset = int(((next_reset - now).total_seconds() % 3600) / 60)
-
-            await update.message.reply_text(
-                "🕒 Keni arritur limitin ditor prej 10 sinjalesh.\n"
-                f"Ju lutemi prisni edhe {hours_until_reset} orë dhe {minutes_until_reset} minuta "
-                "për të marrë sinjale të tjera."
-            )
+            await update.message.reply_text(_daily_limit_message())
             return
 
     keyboard = [[InlineKeyboardButton(pair, callback_data=f"signal_{pair}")] for pair in config.FOREX_PAIRS]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    daily_signals = db.get_daily_signals(user_id)
+    signals_remaining = quotas.remaining(user)
     if user["is_premium"]:
-        signals_remaining = config.PREMIUM_DAILY_LIMIT - daily_signals
         limit_text = f"(Sinjale të mbetura sot: {signals_remaining}/{config.PREMIUM_DAILY_LIMIT})"
     else:
-        signals_remaining = config.FREE_SIGNAL_LIMIT - daily_signals
         limit_text = f"(Sinjale të mbetura falas: {signals_remaining}/{config.FREE_SIGNAL_LIMIT})"
 
     logger.info(f"Showing forex pair selection to user {user_id}")
@@ -179,6 +179,7 @@ async def manual_signal_command(update: Update, context: ContextTypes.DEFAULT_TY
         reply_markup=reply_markup
     )
 
+@profiling.traced
 async def signal_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -203,48 +204,33 @@ async def signal_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Check daily signal limit for premium users
-    daily_signals = db.get_daily_signals(user_id)
-    if daily_signals >= config.PREMIUM_DAILY_LIMIT:
+    # Charge the signal up front; it is refunded below if it cannot be delivered
+    user = quotas.reserve(user_id)
+    if user is None:
         logger.info(f"Premium user {user_id} reached daily manual signal limit during callback")
-        # Calculate time until next reset (midnight)
-        now = datetime.now()
-        next_reset = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        if now >= next_reset:
-            next_reset = next_reset.replace(day=now.day + 1)
-
-        hours_until_reset = int((next_reset - now).total_seconds() / 3600)
-        minutes_until_reset = int(((next_reset - now).total_seconds() % 3600) / 60)
-
-        await query.edit_message_text(
-            "🕒 Keni arritur limitin ditor prej 10 sinjalesh.\n"
-            f"Ju lutemi prisni edhe {hours_until_reset} orë dhe {minutes_until_reset} minuta "
-            "për të marrë sinjale të tjera."
-        )
+        await query.edit_message_text(_daily_limit_message())
         return
 
     pair = query.data.replace("signal_", "")
     logger.info(f"Getting forex data for pair {pair}")
-    await query.edit_message_text("⏳ Duke marrë sinjalet më të fundit...")
 
+    delivered = False
     try:
+        await query.edit_message_text("⏳ Duke marrë sinjalet më të fundit...")
         # Pass user's premium status to get_forex_data
-        signal_data = get_forex_data(pair, is_premium=user["is_premium"])
+        signal_data = await get_forex_data_async(pair, is_premium=user["is_premium"])
         if signal_data:
             logger.info(f"Successfully got forex data for pair {pair}")
-            message = format_signal_message(signal_data)
+            # The body is shared by everyone asking for this snapshot; only the footer is per user
+            message = get_signal_message(signal_data)
 
             # Add refresh time information
-            cache_time = datetime.fromisoformat(signal_data['timestamp'])
-            time_since_cache = (datetime.now() - cache_time).total_seconds()
-            time_until_refresh = max(0, config.CACHE_DURATION - time_since_cache)
+            time_until_refresh = get_time_until_refresh(signal_data)
             refresh_msg = f"\n\n🔄 Sinjali përditësohet pas {int(time_until_refresh/60)} minutave dhe {int(time_until_refresh%60)} sekondave"
 
             message += refresh_msg
 
-            # Update daily signals count
-            signals_used = db.add_signal_use(user_id)
-            signals_remaining = config.PREMIUM_DAILY_LIMIT - db.get_daily_signals(user_id)
+            signals_remaining = config.PREMIUM_DAILY_LIMIT - user["daily_signals"]
             message += f"\n\n📊 Sinjale të mbetura sot: {signals_remaining}/{config.PREMIUM_DAILY_LIMIT}"
 
             keyboard = [
@@ -254,6 +240,7 @@ async def signal_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(text=message, reply_markup=reply_markup)
+            delivered = True
         else:
             logger.error(f"Failed to get forex data for pair {pair}")
             keyboard = [
@@ -276,6 +263,9 @@ async def signal_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ Ndodhi një gabim. Ju lutemi provoni përsëri.",
             reply_markup=reply_markup
         )
+    finally:
+        if not delivered:
+            quotas.release(user_id)
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -420,24 +410,10 @@ async def send_signal_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         }
         db.save_signal(signal_data)
 
-        users = db._load_data(db.users_file)
-        sent_count = 0
-        for user_id_str, user_data in users.items():
-            user_id = int(user_id_str)
-            if user_data["is_premium"] or user_data["signals_used"] < config.FREE_SIGNAL_LIMIT:
-                try:
-                    if not user_data["is_premium"]:
-                        db.add_signal_use(user_id)
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=f"🔔 Sinjal i Ri Forex:\n\n{signal_text}"
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    print(f"Dërgimi i sinjalit dështoi për përdoruesin {user_id}: {str(e)}")
-                    continue
-
-        await update.message.reply_text(f"✅ Sinjali u dërgua me sukses tek {sent_count} përdorues!")
+        status_message = await update.message.reply_text("📤 Duke filluar dërgimin e sinjalit...")
+        job = create_broadcast_job(db, signal_text, update.effective_chat.id, status_message.message_id)
+        # Run the broadcast in the background so the admin is not blocked
+        context.application.create_task(run_broadcast_job(context.bot, db, job), update=update)
     except Exception as e:
         await update.message.reply_text(f"❌ Gabim në dërgimin e sinjalit: {str(e)}")
 
@@ -473,7 +449,7 @@ async def view_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     try:
-        users = db._load_data(db.users_file)
+        users = db.get_all_users()
         if not users:
             await update.message.reply_text("Nuk ka përdorues të regjistruar.")
             return
@@ -488,7 +464,7 @@ async def view_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             message += f"⭐️ Status: {status}\n"
             message += f"📊 Sinjale të përdorura: {user_data['signals_used']}\n"
             if user_data["is_premium"]:
-                message += f"📅 Sinjale sot: {user_data.get('daily_signals', 0)}/{config.PREMIUM_DAILY_LIMIT}\n"
+                message += f"📅 Sinjale sot: {daily_signals(user_data)}/{config.PREMIUM_DAILY_LIMIT}\n"
                 message += f"🔑 Licenca: {user_data.get('license_key', 'N/A')}\n"
             message += f"📆 Regjistruar më: {join_date}\n"
             message += "──────────────\n"
@@ -502,4 +478,96 @@ async def view_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     except Exception as e:
         logger.error(f"Error in view_users_command: {e}")
-        await update.message.reply_text(f"❌ Gabim gjatë marrjes së listës së përdoruesve: {str(e)}")
\ No newline at end of file
+        await update.message.reply_text(f"❌ Gabim gjatë marrjes së listës së përdoruesve: {str(e)}")
+
+async def refresh_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != config.ADMIN_ID:
+        await update.message.reply_text("⚠️ Kjo komandë është vetëm për administratorët.")
+        return
+
+    message = "🔄 Statusi i rifreskimit të çifteve:\n\n"
+    for pair, status in pair_refresher.get_status().items():
+        if status["last_refresh"] is None:
+            message += f"{pair}: ende pa rifreskim"
+            if status["last_error"]:
+                message += f" (gabim: {status['last_error']})"
+            message += "\n"
+            continue
+        last_refresh = datetime.fromisoformat(status["last_refresh"]).strftime("%H:%M:%S")
+        demo = " (demo)" if status["is_demo"] else ""
+        message += (
+            f"{pair}: {last_refresh}, mosha {int(status['age'])}s, "
+            f"vonesa {status['lag']:.1f}s{demo}\n"
+        )
+
+    fetch_stats = get_fetch_stats()
+    message += (
+        f"\n📡 Thirrje API: {fetch_stats['calls']}, "
+        f"kërkesa të bashkuara: {fetch_stats['coalesced']}\n"
+    )
+    for name, budget in get_key_budgets().items():
+        minute = budget["minute_remaining"] if budget["minute_remaining"] is not None else "∞"
+        day = budget["day_remaining"] if budget["day_remaining"] is not None else "∞"
+        message += (
+            f"🔑 {name}: {minute}/min, {day}/ditë, "
+            f"kërkesa {budget['requests']}, limit {budget['rate_limited']}\n"
+        )
+
+    await update.message.reply_text(message)
+
+async def bars_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != config.ADMIN_ID:
+        await update.message.reply_text("⚠️ Kjo komandë është vetëm për administratorët.")
+        return
+
+    # /bars EUR/USD 5m [numri]
+    if len(context.args) < 2 or context.args[1] not in TIMEFRAMES:
+        await update.message.reply_text(f"Përdorimi: /bars EUR/USD {'|'.join(TIMEFRAMES)} [numri]")
+        return
+    pair, timeframe = context.args[0].upper(), context.args[1]
+    try:
+        count = min(int(context.args[2]), 50) if len(context.args) > 2 else 10
+    except ValueError:
+        await update.message.reply_text("⚠️ Numri i barëve duhet të jetë numër i plotë.")
+        return
+
+    bars = bar_store.query(pair, timeframe, limit=count)
+    if not len(bars):
+        await update.message.reply_text(f"Nuk ka barë {timeframe} për {pair}.")
+        return
+
+    message = f"📊 {pair} {timeframe} (O/H/L/C):\n\n"
+    for bar in bars:
+        start = datetime.fromtimestamp(bar["start"]).strftime("%d/%m %H:%M")
+        message += f"{start}: {bar['open']:.5f} / {bar['high']:.5f} / {bar['low']:.5f} / {bar['close']:.5f}\n"
+    await update.message.reply_text(message)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != config.ADMIN_ID:
+        await update.message.reply_text("⚠️ Kjo komandë është vetëm për administratorët.")
+        return
+
+    # /profile [trace] [sekonda]
+    args = list(context.args)
+    mode = "trace" if args and args[0] == "trace" else "sample"
+    if mode == "trace":
+        args.pop(0)
+    try:
+        seconds = int(args[0]) if args else config.PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("Përdorimi: /profile [trace] [sekonda]")
+        return
+    seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+
+    if profiling.is_active():
+        await update.message.reply_text("⚠️ Një profilim është tashmë në punë.")
+        return
+
+    what = "gjurmimi i signal_callback dhe get_forex_data" if mode == "trace" else "profilimi me mostra"
+    await update.message.reply_text(f"🔬 Filloi {what} për {seconds} sekonda...")
+    context.application.create_task(
+        profiling.run_and_send(context.bot, update.effective_chat.id, mode, seconds), update=update
+    )
@@ -0,0 +1,203 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class IndicatorEngine:
+    """Incremental SMA, EMA, RSI, ATR and Bollinger bands for many pairs at once.
+
+    All state is held in arrays with one row per pair, and step() advances
+    every pair that received data with a single set of array operations.
+    Finished OHLC bars are staged with add_bar() and applied together by
+    the next step(), so all pairs closing the same window move at once.
+    """
+
+    def __init__(self, pairs: List[str], timeframe: str = "5m", sma_period: int = 20, ema_fast: int = 12, ema_slow: int = 26,
+                 rsi_period: int = 14, atr_period: int = 14, bollinger_k: float = 2.0):
+        self.pairs = list(pairs)
+        self.timeframe = timeframe
+        self.index = {pair: i for i, pair in enumerate(self.pairs)}
+        self.sma_period = sma_period
+        self.rsi_period = rsi_period
+        self.atr_period = atr_period
+        self.bollinger_k = bollinger_k
+        self.warmup = max(sma_period, ema_slow, rsi_period + 1, atr_period + 1)
+        self._alpha_fast = 2 / (ema_fast + 1)
+        self._alpha_slow = 2 / (ema_slow + 1)
+        self._lock = threading.Lock()
+
+        n = len(self.pairs)
+        self._window = np.zeros((n, sma_period))
+        self._window_pos = np.zeros(n, dtype=np.int64)
+        self._sum = np.zeros(n)
+        self._sum_sq = np.zeros(n)
+        self._count = np.zeros(n, dtype=np.int64)
+        self._close = np.full(n, np.nan)
+        self._ema_fast = np.full(n, np.nan)
+        self._ema_slow = np.full(n, np.nan)
+        self._avg_gain = np.zeros(n)
+        self._avg_loss = np.zeros(n)
+        self._atr = np.zeros(n)
+        self._strength = np.full(n, np.nan)
+
+        # Bars staged since the last step
+        self._pending = np.zeros(n, dtype=bool)
+        self._pending_close = np.full(n, np.nan)
+        self._pending_high = np.full(n, np.nan)
+        self._pending_low = np.full(n, np.nan)
+
+    def add_bar(self, pair: str, high: float, low: float, close: float):
+        row = self.index.get(pair)
+        if row is None:
+            return
+        with self._lock:
+            if self._pending[row]:
+                # A bar is already waiting for this pair, apply it before staging the next
+                self.update(self._pending_close, self._pending_high, self._pending_low, self._row_mask(row))
+            self._pending[row] = True
+            self._pending_high[row] = high
+            self._pending_low[row] = low
+            self._pending_close[row] = close
+
+    def _row_mask(self, row: int) -> np.ndarray:
+        mask = np.zeros(len(self.pairs), dtype=bool)
+        mask[row] = True
+        return mask
+
+    def on_bar(self, pair: str, timeframe: str, bar: np.ndarray):
+        """Bar listener for bars.BarAggregator.add_listener"""
+        if timeframe == self.timeframe:
+            self.add_bar(pair, float(bar["high"]), float(bar["low"]), float(bar["close"]))
+
+    def step(self) -> int:
+        """Fold the staged bars into the indicators; returns the number of pairs updated"""
+        with self._lock:
+            mask = self._pending.copy()
+            self._pending[:] = False
+            if mask.any():
+                self.update(self._pending_close, self._pending_high, self._pending_low, mask)
+        return int(mask.sum())
+
+    def update(self, close: np.ndarray, high: np.ndarray, low: np.ndarray, mask: Optional[np.ndarray] = None):
+        """Advance the pairs selected by mask by one observation each"""
+        rows = np.flatnonzero(mask if mask is not None else ~np.isnan(close))
+        if not len(rows):
+            return
+        c, h, l = close[rows], high[rows], low[rows]
+        prev = self._close[rows]
+        has_prev = ~np.isnan(prev)
+        count = self._count[rows] + 1
+
+        # SMA and Bollinger bands from running sums over a circular window
+        pos = self._window_pos[rows]
+        dropped = self._window[rows, pos]  # zero until the window has filled once
+        self._sum[rows] += c - dropped
+        self._sum_sq[rows] += c * c - dropped * dropped
+        self._window[rows, pos] = c
+        self._window_pos[rows] = (pos + 1) % self.sma_period
+
+        # EMAs start from the first close
+        fast, slow = self._ema_fast[rows], self._ema_slow[rows]
+        self._ema_fast[rows] = np.where(np.isnan(fast), c, fast + self._alpha_fast * (c - fast))
+        self._ema_slow[rows] = np.where(np.isnan(slow), c, slow + self._alpha_slow * (c - slow))
+
+        # Wilder smoothing: a plain mean until `period` samples, then 1/period weighting
+        delta = np.where(has_prev, c - np.nan_to_num(prev), 0.0)
+        deltas_seen = np.maximum(count - 1, 1)
+        rsi_weight = np.where(has_prev, 1 / np.minimum(deltas_seen, self.rsi_period), 0.0)
+        self._avg_gain[rows] += rsi_weight * (np.maximum(delta, 0) - self._avg_gain[rows])
+        self._avg_loss[rows] += rsi_weight * (np.maximum(-delta, 0) - self._avg_loss[rows])
+
+        # The first observation has no previous close, its range is just high - low
+        prev_close = np.where(has_prev, prev, c)
+        true_range = np.maximum(h, prev_close) - np.minimum(l, prev_close)
+        atr_weight = 1 / np.minimum(count, self.atr_period)
+        self._atr[rows] += atr_weight * (true_range - self._atr[rows])
+
+        self._close[rows] = c
+        self._count[rows] = count
+        self._strength[rows] = self._compute_strength(rows)
+
+    def _compute_strength(self, rows: np.ndarray) -> np.ndarray:
+        """Blend trend, momentum and band position into a 0..1 strength"""
+        indicators = self._values(rows)
+        atr = np.where(indicators["atr"] > 0, indicators["atr"], np.nan)
+        trend = 0.5 + 0.5 * np.tanh((indicators["ema_fast"] - indicators["ema_slow"]) / atr)
+        momentum = indicators["rsi"] / 100
+        band_width = indicators["bb_upper"] - indicators["bb_lower"]
+        band_position = np.clip(
+            (self._close[rows] - indicators["bb_lower"]) / np.where(band_width > 0, band_width, np.nan), 0, 1
+        )
+        strength = 0.4 * trend + 0.3 * momentum + 0.3 * band_position
+        strength = np.where(np.isnan(strength), 0.5, strength)
+        return np.where(self._count[rows] >= self.warmup, np.clip(strength, 0, 1), np.nan)
+
+    def _values(self, rows) -> Dict[str, np.ndarray]:
+        n = np.minimum(self._count[rows], self.sma_period)
+        n_safe = np.maximum(n, 1)
+        sma = self._sum[rows] / n_safe
+        variance = np.maximum(self._sum_sq[rows] / n_safe - sma * sma, 0)
+        std = np.sqrt(variance)
+        avg_gain, avg_loss = self._avg_gain[rows], self._avg_loss[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(avg_loss > 0, 100 - 100 / (1 + avg_gain / avg_loss), np.where(avg_gain > 0, 100.0, 50.0))
+        return {
+            "sma": sma,
+            "ema_fast": self._ema_fast[rows],
+            "ema_slow": self._ema_slow[rows],
+            "rsi": rsi,
+            "atr": self._atr[rows],
+            "bb_upper": sma + self.bollinger_k * std,
+            "bb_lower": sma - self.bollinger_k * std,
+        }
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Current indicator arrays for all pairs, in self.pairs order"""
+        rows = np.arange(len(self.pairs))
+        values = self._values(rows)
+        values["strength"] = self._strength.copy()
+        values["ready"] = self._count >= self.warmup
+        return values
+
+    def signal_for(self, pair: str) -> Optional[Tuple[float, int]]:
+        """(strength, trend direction) once the pair is warmed up, else None"""
+        row = self.index.get(pair)
+        if row is None or np.isnan(self._strength[row]):
+            return None
+        trend = np.sign(self._ema_fast[row] - self._ema_slow[row])
+        return float(self._strength[row]), int(trend)
+
+    def seed(self, store):
+        """Replay stored bars so indicators are warm after a restart"""
+        limit = self.warmup * 3
+        bars = [store.query(pair, self.timeframe, limit=limit) for pair in self.pairs]
+        longest = max((len(pair_bars) for pair_bars in bars), default=0)
+        if not longest:
+            return
+        # Right-align the bars so every step advances pairs at the same relative time
+        ohlc = np.full((3, len(self.pairs), longest), np.nan)
+        for row, pair_bars in enumerate(bars):
+            if len(pair_bars):
+                for field, name in enumerate(("high", "low", "close")):
+                    ohlc[field, row, longest - len(pair_bars):] = pair_bars[name]
+        for column in range(longest):
+            high, low, close = ohlc[:, :, column]
+            self.update(close, high, low, ~np.isnan(close))
+        logger.info(f"Seeded indicators from up to {longest} stored {self.timeframe} bars per pair")
+
+indicator_engine = IndicatorEngine(
+    config.FOREX_PAIRS,
+    timeframe=config.INDICATOR_TIMEFRAME,
+    sma_period=config.INDICATOR_SMA_PERIOD,
+    ema_fast=config.INDICATOR_EMA_FAST,
+    ema_slow=config.INDICATOR_EMA_SLOW,
+    rsi_period=config.INDICATOR_RSI_PERIOD,
+    atr_period=config.INDICATOR_ATR_PERIOD,
+    bollinger_k=config.INDICATOR_BOLLINGER_K
+)
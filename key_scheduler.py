@@ -0,0 +1,248 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_day() -> str:
+    # Alpha Vantage daily quotas reset at midnight UTC
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _minute() -> int:
+    return int(time.time() // 60)
+
+
+class UsageStore:
+    """Requests made per key, calendar day and minute, kept in SQLite.
+
+    Unlike a refilling bucket, a day's count only resets when the date
+    changes, and it survives restarts. Every process using the same file
+    shares the counts, so worker processes together stay within each
+    key's per-minute and per-day quota.
+    """
+
+    def __init__(self, db_path: str = ":memory:", keep_days: int = 7, busy_timeout: float = 0.5):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        if db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        # Waiting long for another process's write would hold up the fetch;
+        # a key whose count cannot be taken in time is treated as exhausted
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS api_usage ("
+            "key TEXT NOT NULL, day TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (key, day));"
+            "CREATE TABLE IF NOT EXISTS api_usage_minute ("
+            "key TEXT NOT NULL, minute INTEGER NOT NULL, count INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (key, minute));"
+        )
+        self._pruned_day = None
+        self._pruned_minute = None
+
+    def _count(self, table: str, column: str, key: str, window) -> int:
+        row = self._conn.execute(
+            f"SELECT count FROM {table} WHERE key = ? AND {column} = ?", (key, window)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def used(self, key: str, day: Optional[str] = None) -> int:
+        with self._lock:
+            return self._count("api_usage", "day", key, day or _utc_day())
+
+    def used_minute(self, key: str, minute: Optional[int] = None) -> int:
+        with self._lock:
+            return self._count("api_usage_minute", "minute", key, minute or _minute())
+
+    def try_consume(self, key: str, limit: Optional[int], day: Optional[str] = None,
+                    per_minute: Optional[int] = None, minute: Optional[int] = None) -> bool:
+        """Count one request unless `limit` were made that day or `per_minute` that minute"""
+        day = day or _utc_day()
+        minute = minute or _minute()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                logger.warning(f"API usage store busy, skipping key '{key}': {e}")
+                return False
+            try:
+                if limit and self._count("api_usage", "day", key, day) >= limit:
+                    return False
+                if per_minute and self._count("api_usage_minute", "minute", key, minute) >= per_minute:
+                    return False
+                self._conn.execute(
+                    "INSERT INTO api_usage (key, day, count) VALUES (?, ?, 1) "
+                    "ON CONFLICT(key, day) DO UPDATE SET count = count + 1",
+                    (key, day)
+                )
+                if per_minute:
+                    self._conn.execute(
+                        "INSERT INTO api_usage_minute (key, minute, count) VALUES (?, ?, 1) "
+                        "ON CONFLICT(key, minute) DO UPDATE SET count = count + 1",
+                        (key, minute)
+                    )
+                self._prune(day, minute)
+            finally:
+                self._conn.execute("COMMIT")
+        return True
+
+    def exhaust_minute(self, key: str, per_minute: int, minute: Optional[int] = None):
+        """Mark the key's current minute as used up"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO api_usage_minute (key, minute, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key, minute) DO UPDATE SET count = MAX(count, excluded.count)",
+                    (key, minute or _minute(), per_minute)
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"API usage store busy, could not mark key '{key}' as rate limited: {e}")
+
+    def _prune(self, day: str, minute: int):
+        if day != self._pruned_day:
+            cutoff = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+            self._conn.execute("DELETE FROM api_usage WHERE day < ?", (cutoff,))
+            self._pruned_day = day
+        if minute != self._pruned_minute:
+            self._conn.execute("DELETE FROM api_usage_minute WHERE minute < ?", (minute,))
+            self._pruned_minute = minute
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ApiKey:
+    """An Alpha Vantage key with per-minute and per-day request counters"""
+
+    def __init__(self, name: str, key: str, per_minute: Optional[int], per_day: Optional[int],
+                 premium: bool, usage: Optional[UsageStore] = None):
+        self.name = name
+        self.key = key
+        self.premium = premium
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.usage = usage or UsageStore()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def minute_remaining(self) -> Optional[int]:
+        if not self.per_minute:
+            return None
+        return max(0, self.per_minute - self.usage.used_minute(self.name))
+
+    def day_remaining(self) -> Optional[int]:
+        if not self.per_day:
+            return None
+        return max(0, self.per_day - self.usage.used(self.name))
+
+    def headroom(self) -> float:
+        """Smallest remaining fraction of the minute and day budgets"""
+        fractions = []
+        if self.per_minute:
+            fractions.append(self.minute_remaining() / self.per_minute)
+        if self.per_day:
+            fractions.append(self.day_remaining() / self.per_day)
+        return min(fractions) if fractions else 1.0
+
+    def can_consume(self) -> bool:
+        if self.per_minute and self.minute_remaining() < 1:
+            return False
+        return not self.per_day or self.day_remaining() >= 1
+
+    def consume(self) -> bool:
+        """Take one request from both budgets; False if either ran out meanwhile"""
+        if not self.usage.try_consume(self.name, self.per_day, per_minute=self.per_minute):
+            return False
+        self.requests += 1
+        return True
+
+    def budget(self) -> Dict:
+        return {
+            "premium": self.premium,
+            "minute_remaining": self.minute_remaining(),
+            "day_remaining": self.day_remaining(),
+            "requests": self.requests,
+            "rate_limited": self.rate_limited
+        }
+
+
+class KeyScheduler:
+    """Chooses an API key with remaining quota before a request is sent.
+
+    Premium keys keep a reserve of their capacity for premium users; other
+    requests may only use a premium key while its headroom stays above
+    that reserve.
+    """
+
+    def __init__(self, api_keys: Dict[str, str], quotas: Optional[Dict[str, Dict]] = None,
+                 default_quota: Optional[Dict] = None, premium_reserve: float = 0.0,
+                 usage: Optional[UsageStore] = None):
+        quotas = quotas or {}
+        default_quota = default_quota or {}
+        self.premium_reserve = premium_reserve
+        self.usage = usage or UsageStore()
+        self._lock = threading.Lock()
+        self.keys: List[ApiKey] = []
+        for name, key in api_keys.items():
+            quota = {**default_quota, **quotas.get(name, {})}
+            self.keys.append(ApiKey(
+                name, key,
+                per_minute=quota.get("per_minute"),
+                per_day=quota.get("per_day"),
+                premium=quota.get("premium", False),
+                usage=self.usage
+            ))
+
+    def acquire(self, is_premium: bool = False) -> Optional[ApiKey]:
+        """Reserve one request on the best available key, or None if all are exhausted"""
+        with self._lock:
+            candidates = []
+            for api_key in self.keys:
+                if not api_key.can_consume():
+                    continue
+                if api_key.premium and not is_premium and api_key.headroom() <= self.premium_reserve:
+                    continue
+                candidates.append(api_key)
+            if not candidates:
+                return None
+
+            # Premium users go to premium keys first, everyone else to regular keys first
+            candidates.sort(key=lambda k: (k.premium != is_premium, -k.headroom()))
+            for chosen in candidates:
+                # Another process sharing the usage store may have taken the last request
+                if chosen.consume():
+                    return chosen
+            return None
+
+    def report_rate_limited(self, api_key: ApiKey):
+        """The API refused a request: treat the key's minute budget as spent"""
+        with self._lock:
+            api_key.rate_limited += 1
+            if api_key.per_minute:
+                api_key.usage.exhaust_minute(api_key.name, api_key.per_minute)
+
+    def get_budgets(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {api_key.name: api_key.budget() for api_key in self.keys}
+
+
+def create_key_scheduler() -> KeyScheduler:
+    return KeyScheduler(
+        config.ALPHA_VANTAGE_API_KEYS,
+        quotas=config.ALPHA_VANTAGE_KEY_QUOTAS,
+        default_quota=config.ALPHA_VANTAGE_DEFAULT_QUOTA,
+        premium_reserve=config.PREMIUM_KEY_RESERVE,
+        usage=UsageStore(config.API_USAGE_DB_PATH)
+    )
@@ -0,0 +1,361 @@
+"""End-to-end load generator for the bot handlers.
+
+Simulated users drive the real handlers from handlers.py with synthetic
+updates. Replies go to a fake bot that only records calls, and quotes come
+from a local Alpha Vantage stand-in with configurable latency, errors and
+rate-limit notes. Nothing talks to Telegram or the real API, e.g.
+
+    python loadgen.py --users 5000 --concurrency 500 --api-latency 0.2 --note-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+import config
+from benchmark import exchange_rate_payload, isolate_data
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_NOTE = {
+    "Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute "
+            "and 500 calls per day."
+}
+
+
+# Alpha Vantage stand-in, run in its own process so it does not compete with the handlers' event loop
+
+async def _serve_connection(reader, writer, settings: Dict, stats: Counter):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            target = urlsplit(request_line.split()[1].decode())
+
+            if target.path == "/stats":
+                status, body = 200, dict(stats)
+            else:
+                stats["requests"] += 1
+                latency = settings["latency"] * random.uniform(0.5, 1.5)
+                if latency:
+                    await asyncio.sleep(latency)
+                params = {key: values[0] for key, values in parse_qs(target.query).items()}
+                roll = random.random()
+                if roll < settings["error_rate"]:
+                    stats["errors"] += 1
+                    status, body = 500, {"Error Message": "Internal error"}
+                elif roll < settings["error_rate"] + settings["note_rate"]:
+                    stats["notes"] += 1
+                    status, body = 200, RATE_LIMIT_NOTE
+                else:
+                    status, body = 200, exchange_rate_payload(params["from_currency"], params["to_currency"])
+
+            payload = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+    except (ConnectionError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+def _run_api_server(settings: Dict, ready):
+    async def serve():
+        stats = Counter()
+        server = await asyncio.start_server(
+            lambda reader, writer: _serve_connection(reader, writer, settings, stats), "127.0.0.1", 0
+        )
+        ready.send(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_api_server(latency: float, error_rate: float, note_rate: float):
+    """Start the stand-in server; returns (process, base URL)"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    settings = {"latency": latency, "error_rate": error_rate, "note_rate": note_rate}
+    process = multiprocessing.Process(target=_run_api_server, args=(settings, sender), daemon=True)
+    process.start()
+    port = receiver.recv()
+    return process, f"http://127.0.0.1:{port}"
+
+
+# Telegram stand-ins: just enough of Bot, Update and the handler context for handlers.py
+
+class FakeBot:
+    """Records outgoing Bot API calls instead of sending them"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def _call(self, method: str, chat_id=None, text=None):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._message_id += 1
+        return FakeMessage(self, chat_id, self._message_id, text)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call("send_message", chat_id, text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return await self._call("edit_message_text", chat_id, text)
+
+    async def answer_callback_query(self, callback_query_id=None, text=None, **kwargs):
+        return await self._call("answer_callback_query")
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id, message_id: int, text: Optional[str] = None):
+        self._bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        return await self._bot.send_message(chat_id=self.chat_id, text=text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, user, data: str, message: FakeMessage):
+        self._bot = bot
+        self.from_user = user
+        self.data = data
+        self.message = message
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        return await self._bot.answer_callback_query(text=text)
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        return await self._bot.edit_message_text(text, chat_id=self.message.chat_id, message_id=self.message.message_id)
+
+
+class FakeApplication:
+    """Tracks background tasks the handlers start, such as broadcasts"""
+
+    def __init__(self):
+        self.tasks: List[asyncio.Task] = []
+
+    def create_task(self, coroutine, update=None):
+        task = asyncio.create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+def message_update(bot: FakeBot, user_id: int, text: str):
+    user = SimpleNamespace(id=user_id, username=f"load{user_id}")
+    return SimpleNamespace(
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=user_id),
+        message=FakeMessage(bot, user_id, 0, text),
+        callback_query=None
+    )
+
+
+def callback_update(bot: FakeBot, user_id: int, data: str):
+    user = SimpleNamespace(id=user_id, username=f"load{user_id}")
+    return SimpleNamespace(
+        effective_user=user,
+        effective_chat=SimpleNamespace(id=user_id),
+        message=None,
+        callback_query=FakeCallbackQuery(bot, user, data, FakeMessage(bot, user_id, 0))
+    )
+
+
+class LoadRun:
+    def __init__(self, handlers, bot: FakeBot, application: FakeApplication):
+        self.handlers = handlers
+        self.bot = bot
+        self.application = application
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = Counter()
+
+    async def call(self, name: str, update, args: Optional[List[str]] = None):
+        context = SimpleNamespace(bot=self.bot, application=self.application, args=args or [])
+        started = time.perf_counter()
+        try:
+            await getattr(self.handlers, name)(update, context)
+        except Exception as e:
+            self.errors[name] += 1
+            logger.debug(f"{name} raised {e!r}")
+        self.latencies[name].append(time.perf_counter() - started)
+
+    async def user_session(self, user_id: int, requests: int, premium: bool, think_time: float):
+        await self.call("start_command", message_update(self.bot, user_id, "/start"))
+        if premium:
+            user = self.handlers.db.get_user(user_id)
+            user["is_premium"] = True
+            self.handlers.db.save_user(user_id, user)
+        for _ in range(requests):
+            await self.call("manual_signal_command", message_update(self.bot, user_id, "📊 Manual Signal"))
+            pair = random.choice(config.FOREX_PAIRS)
+            await self.call("signal_callback", callback_update(self.bot, user_id, f"signal_{pair}"))
+            if think_time:
+                await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+    async def admin_session(self, broadcasts: int, interval: float):
+        for number in range(broadcasts):
+            await asyncio.sleep(interval)
+            update = message_update(self.bot, config.ADMIN_ID, "/sendsignal")
+            await self.call("send_signal_command", update, args=["Load", "test", "signal", str(number + 1)])
+
+
+def _latency_summary(samples: List[float], elapsed: float) -> Dict:
+    samples = sorted(samples)
+    count = len(samples)
+
+    def percentile(p):
+        return round(samples[min(count - 1, int(p / 100 * count))] * 1000, 2)
+
+    return {
+        "count": count,
+        "per_second": round(count / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+async def run_load(args, api_url: str) -> Dict:
+    import forex
+    import handlers
+    import market_client
+    from key_scheduler import KeyScheduler
+
+    if not args.real_quotas:
+        # Quotas would turn almost every miss into demo data, hiding the API path
+        forex._key_scheduler = KeyScheduler(config.ALPHA_VANTAGE_API_KEYS)
+    if args.cache_ttl is not None:
+        forex._signal_cache.ttl = args.cache_ttl
+
+    bot = FakeBot(latency=args.bot_latency)
+    application = FakeApplication()
+    load = LoadRun(handlers, bot, application)
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id: int):
+        async with limit:
+            await load.user_session(user_id, args.requests, random.random() < args.premium_ratio, args.think_time)
+
+    started = time.perf_counter()
+    sessions = [limited(1_000_000 + number) for number in range(args.users)]
+    await asyncio.gather(load.admin_session(args.broadcasts, args.broadcast_interval), *sessions)
+    elapsed = time.perf_counter() - started
+
+    broadcast_started = time.perf_counter()
+    if application.tasks:
+        done, pending = await asyncio.wait(application.tasks, timeout=args.drain_timeout)
+        for task in pending:
+            task.cancel()
+    broadcast_drain = time.perf_counter() - broadcast_started
+
+    async with httpx.AsyncClient() as client:
+        api_stats = (await client.get(f"{api_url}/stats")).json()
+    await market_client.close_client()
+    forex.close_cache()
+    handlers.db.close()
+
+    all_samples = [sample for samples in load.latencies.values() for sample in samples]
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(all_samples) / elapsed, 1) if elapsed else None,
+        "overall": _latency_summary(all_samples, elapsed) if all_samples else None,
+        "handlers": {name: _latency_summary(samples, elapsed) for name, samples in load.latencies.items()},
+        "errors": dict(load.errors),
+        "bot_calls": dict(bot.calls),
+        "api": api_stats,
+        "broadcast_drain": round(broadcast_drain, 3),
+        "fetch_stats": forex.get_fetch_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot handlers against local stand-ins")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="users active at the same time")
+    parser.add_argument("--requests", type=int, default=3, help="manual signal round trips per user")
+    parser.add_argument("--premium-ratio", type=float, default=0.5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's requests")
+    parser.add_argument("--broadcasts", type=int, default=1, help="/sendsignal calls made by the admin")
+    parser.add_argument("--broadcast-interval", type=float, default=1.0)
+    parser.add_argument("--broadcast-rate", type=float, help="override config.BROADCAST_RATE_LIMIT")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="seconds to wait for broadcasts")
+    parser.add_argument("--bot-latency", type=float, default=0.0, help="seconds per fake Bot API call")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="mean stand-in API latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of API responses that are HTTP 500")
+    parser.add_argument("--note-rate", type=float, default=0.0, help="share of API responses that are rate-limit notes")
+    parser.add_argument("--cache-ttl", type=float, help="override the signal cache TTL (0 forces API calls)")
+    parser.add_argument("--real-quotas", action="store_true", help="keep the configured API key quotas")
+    parser.add_argument("--output", default=config.LOADGEN_OUTPUT_FILE)
+    parser.add_argument("--verbose", action="store_true", help="keep the handlers' per-request logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    output = os.path.abspath(args.output)
+
+    process, api_url = start_api_server(args.api_latency, args.error_rate, args.note_rate)
+    data_dir = tempfile.mkdtemp(prefix="bot-load-")
+    isolate_data(data_dir)
+    config.ALPHA_VANTAGE_URL = f"{api_url}/query"
+    if args.broadcast_rate:
+        config.BROADCAST_RATE_LIMIT = args.broadcast_rate
+
+    # The handlers log every request at INFO, which would dominate the measurement
+    if not args.verbose:
+        for name in ("handlers", "forex", "broadcast", "user_cache", "httpx"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    try:
+        report = asyncio.run(run_load(args, api_url))
+    finally:
+        process.terminate()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    logger.info(
+        f"{report['users']} users, {report['overall']['count']} handler calls in {report['elapsed']}s: "
+        f"{report['throughput']}/s, p50 {report['overall']['p50_ms']}ms, "
+        f"p95 {report['overall']['p95_ms']}ms, p99 {report['overall']['p99_ms']}ms"
+    )
+    for name, summary in report["handlers"].items():
+        logger.info(
+            f"  {name}: {summary['count']} calls, p50 {summary['p50_ms']}ms, "
+            f"p95 {summary['p95_ms']}ms, p99 {summary['p99_ms']}ms, errors {report['errors'].get(name, 0)}"
+        )
+    logger.info(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
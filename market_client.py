@@ -0,0 +1,73 @@
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class MarketDataClient:
+    """Pooled async HTTP client for the Alpha Vantage API.
+
+    A single httpx.AsyncClient is shared by all requests so connections are
+    kept alive and reused instead of being opened for every quote.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, timeout: Optional[float] = None,
+                 max_connections: Optional[int] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url or config.ALPHA_VANTAGE_URL
+        self.timeout = timeout or config.API_REQUEST_TIMEOUT
+        self.max_connections = max_connections or config.API_MAX_CONNECTIONS
+        # Benchmarks plug in a stub transport instead of the network
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=config.API_KEEPALIVE_EXPIRY
+                ),
+                transport=self.transport
+            )
+        return self._client
+
+    async def get_exchange_rate(self, base: str, quote: str, api_key: str) -> Dict:
+        """Request a CURRENCY_EXCHANGE_RATE quote and return the decoded JSON"""
+        params = {
+            "function": "CURRENCY_EXCHANGE_RATE",
+            "from_currency": base,
+            "to_currency": quote,
+            "apikey": api_key
+        }
+        response = await self._get_client().get(self.base_url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+_default_client: Optional[MarketDataClient] = None
+
+
+def get_client() -> MarketDataClient:
+    """Return the process-wide client used by the bot's event loop"""
+    global _default_client
+    if _default_client is None:
+        _default_client = MarketDataClient()
+    return _default_client
+
+
+async def close_client():
+    global _default_client
+    if _default_client is not None:
+        await _default_client.aclose()
+        _default_client = None
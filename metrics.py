@@ -0,0 +1,374 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(label_pairs)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        return [("", tuple(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(Metric):
+    """A value that is set directly or, with `function`, read when scraped"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                items = list(self._function().items())
+            except Exception as e:
+                logger.error(f"Error collecting {self.name}: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [("", tuple(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in items:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", labels + (("le", _format_value(float(bound))),), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "bot_handler_duration_seconds", "Time spent in each command and callback handler", ("handler",)
+))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Handlers that raised an exception", ("handler",)
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    "bot_signal_cache_lookups_total", "Signal cache lookups by result (fresh, stale, miss)", ("result",)
+))
+API_LATENCY = registry.register(Histogram(
+    "bot_api_request_duration_seconds", "Alpha Vantage request latency per API key", ("key",)
+))
+API_ERRORS = registry.register(Counter(
+    "bot_api_errors_total", "Failed Alpha Vantage requests per API key", ("key", "kind")
+))
+API_RATE_LIMITED = registry.register(Counter(
+    "bot_api_rate_limited_total", "Alpha Vantage rate-limit notes per API key", ("key",)
+))
+API_KEYS_EXHAUSTED = registry.register(Counter(
+    "bot_api_keys_exhausted_total", "Fetches that found no API key with quota left"
+))
+DEMO_SERVED = registry.register(Counter(
+    "bot_demo_signals_served_total", "Requests answered with demo data instead of a real quote", ("pair",)
+))
+STORAGE_LATENCY = registry.register(Histogram(
+    "bot_storage_operation_duration_seconds", "Storage backend call latency", ("operation",)
+))
+LOOP_LAG = registry.register(Gauge(
+    "bot_event_loop_lag_seconds", "Most recent delay of the event loop in waking a sleeping task"
+))
+LOOP_LAG_HISTOGRAM = registry.register(Histogram(
+    "bot_event_loop_lag_distribution_seconds", "Event loop wake-up delays"
+))
+BROADCAST_MESSAGES = registry.register(Counter(
+    "bot_broadcast_messages_total", "Broadcast sends by result (delivered, failed, retry)", ("result",)
+))
+
+
+def _cache_hit_ratio():
+    fresh, stale, miss = (CACHE_LOOKUPS.value(result=result) for result in ("fresh", "stale", "miss"))
+    lookups = fresh + stale + miss
+    return {(): (fresh + stale) / lookups if lookups else 0.0}
+
+
+# stats() of the user cache in use, if any
+_user_cache_stats: Optional[Callable[[], Dict]] = None
+
+
+def track_user_cache(stats: Callable[[], Dict]):
+    """Export the user cache's counters, read from `stats()` on every scrape"""
+    global _user_cache_stats
+    _user_cache_stats = stats
+
+
+def _user_cache_values():
+    if _user_cache_stats is None:
+        return {}
+    return {(name,): value for name, value in _user_cache_stats().items()}
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _data_file_sizes():
+    paths = {
+        "users": os.path.join(config.DATA_DIR, "users.json"),
+        "signals": os.path.join(config.DATA_DIR, "signals.json"),
+        "licenses": os.path.join(config.DATA_DIR, "licenses.json"),
+        "broadcasts": os.path.join(config.DATA_DIR, "broadcasts.json"),
+        "sqlite": config.SQLITE_DB_PATH,
+        "sqlite_wal": f"{config.SQLITE_DB_PATH}-wal",
+        "signal_cache": config.SIGNAL_CACHE_FILE,
+        "signal_cache_log": config.SIGNAL_CACHE_LOG_FILE,
+        "tick_archive": config.TICK_ARCHIVE_DIR,
+        "bars": config.BAR_STORE_DIR,
+    }
+    return {(name,): _path_size(path) for name, path in paths.items()}
+
+
+# Walking the tick and bar directories is too slow for every scrape, so the
+# sizes are refreshed in the background and scrapes read the last result
+_data_file_bytes: Dict[Tuple[str, ...], float] = {}
+
+
+def _cached_data_file_sizes():
+    return dict(_data_file_bytes)
+
+
+async def _refresh_data_file_sizes(interval: float):
+    while True:
+        try:
+            _data_file_bytes.update(await asyncio.to_thread(_data_file_sizes))
+        except Exception as e:
+            logger.error(f"Error measuring data files: {e}")
+        await asyncio.sleep(interval)
+
+
+registry.register(Gauge(
+    "bot_signal_cache_hit_ratio", "Share of signal cache lookups served from the cache", function=_cache_hit_ratio
+))
+registry.register(Gauge(
+    "bot_user_cache", "User cache counters (hits, misses, hit_ratio, cached_users, dirty_users, flushes, "
+    "flushed_records, flush_errors)", ("stat",), function=_user_cache_values
+))
+registry.register(Gauge(
+    "bot_data_file_bytes", "Size of the bot's data files, refreshed periodically", ("file",),
+    function=_cached_data_file_sizes
+))
+
+
+def timed_handler(callback):
+    """Wrap a PTB handler callback so its latency and errors are recorded"""
+    name = callback.__name__
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+
+    return wrapper
+
+
+class TimedStorage:
+    """Storage proxy that records the latency of every backend call"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        attribute = getattr(self.storage, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        @wraps(attribute)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                STORAGE_LATENCY.observe(time.perf_counter() - started, operation=name)
+
+        # Cache the wrapper so later calls skip __getattr__
+        setattr(self, name, wrapper)
+        return wrapper
+
+
+async def _monitor_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+async def _handle_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+_server: Optional[asyncio.AbstractServer] = None
+_lag_task: Optional[asyncio.Task] = None
+_sizes_task: Optional[asyncio.Task] = None
+
+
+async def start(host: str, port: int, lag_interval: float = 1.0, sizes_interval: float = 60.0):
+    """Serve /metrics on host:port and start the event-loop lag and data size monitors"""
+    global _server, _lag_task, _sizes_task
+    _server = await asyncio.start_server(_handle_request, host, port)
+    _lag_task = asyncio.create_task(_monitor_loop_lag(lag_interval))
+    _sizes_task = asyncio.create_task(_refresh_data_file_sizes(sizes_interval))
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+
+
+async def stop():
+    global _server, _lag_task, _sizes_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+    if _sizes_task is not None:
+        _sizes_task.cancel()
+        _sizes_task = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
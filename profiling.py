@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_session_lock = threading.Lock()
+_active = False
+
+# Tracing is off unless a trace session is running; traced() then only checks this flag
+_tracing = False
+_traces: List[Dict] = []
+_current_span: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("profiling_span", default=None)
+
+
+def is_active() -> bool:
+    return _active
+
+
+def _begin_session() -> bool:
+    global _active
+    with _session_lock:
+        if _active:
+            return False
+        _active = True
+        return True
+
+
+def _end_session():
+    global _active
+    with _session_lock:
+        _active = False
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(duration: float, interval: float) -> Tuple[Counter, int]:
+    """Sample every other thread's stack; returns (collapsed stack counts, samples taken)"""
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(frames))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def traced(func):
+    """Record a timing span for each call of an async function while tracing is on"""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not _tracing:
+            return await func(*args, **kwargs)
+
+        parent = _current_span.get()
+        span = {"name": name, "start": time.perf_counter(), "duration": None, "children": []}
+        token = _current_span.set(span)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            span["duration"] = time.perf_counter() - span["start"]
+            _current_span.reset(token)
+            if parent is not None:
+                parent["children"].append(span)
+            else:
+                _traces.append(span)
+
+    return wrapper
+
+
+def _span_tree(span: Dict, origin: float) -> Dict:
+    return {
+        "name": span["name"],
+        "offset_ms": round((span["start"] - origin) * 1000, 3),
+        "duration_ms": round(span["duration"] * 1000, 3) if span["duration"] is not None else None,
+        "children": [_span_tree(child, origin) for child in span["children"]],
+    }
+
+
+def _walk(span: Dict):
+    yield span
+    for child in span["children"]:
+        yield from _walk(child)
+
+
+def summarize_traces(traces: List[Dict], slowest: int = 20) -> Dict:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for root in traces:
+        for span in _walk(root):
+            if span["duration"] is not None:
+                durations[span["name"]].append(span["duration"] * 1000)
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(values[len(values) // 2], 3),
+            "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            "max_ms": round(values[-1], 3),
+        }
+    roots = sorted(traces, key=lambda span: span["duration"] or 0, reverse=True)[:slowest]
+    return {"functions": summary, "slowest": [_span_tree(root, root["start"]) for root in roots]}
+
+
+def _output_path(kind: str, extension: str) -> str:
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(config.PROFILE_DIR, f"{kind}-{stamp}.{extension}")
+
+
+async def profile(duration: float) -> Tuple[str, str]:
+    """Sample the live process for `duration` seconds; returns (collapsed stack file, summary)"""
+    stacks, samples = await asyncio.to_thread(sample_stacks, duration, config.PROFILE_SAMPLE_INTERVAL)
+    path = _output_path("profile", "folded")
+    with open(path, 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    top = "\n".join(f"{count * 100 / total:.1f}% {name}" for name, count in leaves.most_common(8))
+    return path, f"🔬 {samples} mostra në {duration:.0f}s\n{top}"
+
+
+async def trace(duration: float) -> Tuple[str, str]:
+    """Record timing traces of the traced functions for `duration` seconds"""
+    global _tracing
+    _traces.clear()
+    _tracing = True
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        _tracing = False
+    traces = list(_traces)
+    _traces.clear()
+
+    summary = summarize_traces(traces)
+    path = _output_path("trace", "json")
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    lines = [
+        f"{name}: {stats['count']}x, p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, max {stats['max_ms']}ms"
+        for name, stats in summary["functions"].items()
+    ]
+    return path, f"⏱ {len(traces)} gjurmë në {duration:.0f}s\n" + ("\n".join(lines) or "Asnjë thirrje")
+
+
+async def run_and_send(bot, chat_id: int, mode: str, duration: float):
+    """Run a profiling session and send the result file to the admin chat"""
+    if not _begin_session():
+        await bot.send_message(chat_id=chat_id, text="⚠️ Një profilim është tashmë në punë.")
+        return
+    try:
+        path, caption = await (trace(duration) if mode == "trace" else profile(duration))
+        logger.info(f"Profiling result written to {path}")
+        with open(path, 'rb') as f:
+            await bot.send_document(chat_id=chat_id, document=f, filename=os.path.basename(path), caption=caption[:1024])
+    except Exception as e:
+        logger.error(f"Profiling failed: {e}")
+        await bot.send_message(chat_id=chat_id, text=f"❌ Profilimi dështoi: {str(e)}")
+    finally:
+        _end_session()
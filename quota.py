@@ -0,0 +1,81 @@
+import time
+from datetime import datetime, time as day_start, timedelta
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+import config
+
+
+def _zone() -> Optional[ZoneInfo]:
+    # ZoneInfo caches instances, so looking the zone up per call is cheap
+    return ZoneInfo(config.QUOTA_RESET_TIMEZONE) if config.QUOTA_RESET_TIMEZONE else None
+
+
+def _now(zone: Optional[ZoneInfo]) -> datetime:
+    return datetime.now(zone) if zone is not None else datetime.now().astimezone()
+
+
+def current_day(now: Optional[datetime] = None) -> str:
+    """Day bucket ("YYYY-MM-DD") daily limits are counted in"""
+    zone = _zone()
+    if now is None:
+        now = _now(zone)
+    elif now.tzinfo is not None:
+        # Without a configured zone, astimezone(None) gives the server's local time
+        now = now.astimezone(zone)
+    return now.strftime("%Y-%m-%d")
+
+
+def time_until_reset(now: Optional[datetime] = None) -> float:
+    """Seconds until the next midnight in the reset timezone"""
+    zone = _zone()
+    now = now or _now(zone)
+    if zone is not None or now.tzinfo is not None:
+        now = now.astimezone(zone)
+    next_day = now.date() + timedelta(days=1)
+    if zone is None:
+        # Server local time; mktime applies the DST offset in effect at midnight
+        return max(0.0, time.mktime(next_day.timetuple()) - now.timestamp())
+    # Compared as timestamps, so a DST change during the day is accounted for
+    midnight = datetime.combine(next_day, day_start(), tzinfo=zone)
+    return max(0.0, midnight.timestamp() - now.timestamp())
+
+
+def daily_signals(user: Dict, day: Optional[str] = None) -> int:
+    """A premium user's count for `day` (today) from the stored record"""
+    if user.get("last_signal_date") != (day or current_day()):
+        return 0
+    return user.get("daily_signals", 0)
+
+
+class QuotaService:
+    """Daily signal quotas read from the stored user records.
+
+    Records roll over lazily: a user's daily count only counts for the day
+    in its last_signal_date, and is rewritten by the next charge, so reads
+    never write and there is no per-process state to go stale.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def used_today(self, user: Dict) -> int:
+        """Signals `user` was charged today (premium) or in total (free)"""
+        if not user["is_premium"]:
+            return user.get("signals_used", 0)
+        return daily_signals(user, current_day())
+
+    def remaining(self, user: Dict) -> int:
+        limit = config.PREMIUM_DAILY_LIMIT if user["is_premium"] else config.FREE_SIGNAL_LIMIT
+        return max(0, limit - self.used_today(user))
+
+    def reserve(self, user_id) -> Optional[Dict]:
+        """Charge one signal if the user has one left; returns the updated user or None"""
+        return self.db.reserve_signal_use(user_id, current_day())
+
+    def release(self, user_id):
+        """Refund a reserved signal that was not delivered"""
+        self.db.release_signal_use(user_id, current_day())
+
+    def time_until_reset(self) -> float:
+        return time_until_reset()
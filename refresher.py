@@ -0,0 +1,91 @@
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import config
+import forex
+
+logger = logging.getLogger(__name__)
+
+
+class PairRefresher:
+    """Keeps the signal cache warm by refreshing pairs on the job queue.
+
+    Each pair gets its own repeating job. The jobs run slightly more often
+    than CACHE_DURATION so entries are replaced before they expire, and their
+    start times are spread evenly over the interval so API calls do not
+    arrive in bursts.
+    """
+
+    def __init__(self, pairs: List[str], interval: Optional[float] = None):
+        self.pairs = list(pairs)
+        self.interval = interval or max(1, config.CACHE_DURATION - config.PAIR_REFRESH_LEAD_TIME)
+        self._status: Dict[str, Dict] = {}
+        self._next_due: Dict[str, float] = {}
+
+    def schedule(self, job_queue):
+        """Register one staggered repeating job per pair"""
+        if not self.pairs:
+            return
+        step = self.interval / len(self.pairs)
+        now = time.time()
+        for index, pair in enumerate(self.pairs):
+            first = index * step
+            self._next_due[pair] = now + first
+            job_queue.run_repeating(
+                self._refresh_job,
+                interval=self.interval,
+                first=first,
+                data=pair,
+                name=f"refresh_{pair}"
+            )
+        logger.info(f"Scheduled refresh of {len(self.pairs)} pairs every {self.interval}s")
+
+    async def _refresh_job(self, context):
+        await self.refresh(context.job.data)
+
+    async def refresh(self, pair: str):
+        if not forex.is_refresher():
+            return  # Another process refreshes the shared quote cache
+        started = time.time()
+        due = self._next_due.get(pair, started)
+        try:
+            signal_data = await forex.refresh_pair(pair)
+        except Exception as e:
+            logger.error(f"Background refresh failed for {pair}: {e}")
+            self._status.setdefault(pair, {})["last_error"] = str(e)
+            return
+
+        finished = time.time()
+        # Re-anchor the schedule if a refresh ran later than a whole interval
+        self._next_due[pair] = due + self.interval if finished - due < self.interval else finished + self.interval
+        self._status[pair] = {
+            "last_refresh": finished,
+            "lag": max(0.0, finished - due),
+            "duration": finished - started,
+            "is_demo": signal_data.get("is_demo", False),
+            "last_error": None
+        }
+
+    def get_status(self) -> Dict[str, Dict]:
+        """Last refresh time, data age and lag (seconds past due) for each pair"""
+        now = time.time()
+        status = {}
+        for pair in self.pairs:
+            entry = self._status.get(pair)
+            if not entry or "last_refresh" not in entry:
+                status[pair] = {"last_refresh": None, "age": None, "lag": None,
+                                "is_demo": None, "last_error": entry.get("last_error") if entry else None}
+                continue
+            status[pair] = {
+                "last_refresh": datetime.fromtimestamp(entry["last_refresh"]).isoformat(),
+                "age": now - entry["last_refresh"],
+                "lag": entry["lag"],
+                "is_demo": entry["is_demo"],
+                "last_error": entry["last_error"]
+            }
+        return status
+
+
+pair_refresher = PairRefresher(forex.get_refresh_pairs())
@@ -0,0 +1,208 @@
+"""Replay archived ticks through the signal pipeline and report statistics.
+
+Runs offline against the tick archive: each pair is replayed in its own
+worker process through the same bar, indicator and signal code the bot
+uses, with an optional strength threshold override, e.g.
+
+    python replay.py --threshold 0.8 --start 2024-01-01 --output data/replay_080.json
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+import config
+from bars import BarAggregator, TIMEFRAMES
+from indicators import IndicatorEngine
+from signals import get_trading_duration, signal_from_quote
+from tick_archive import TickArchive
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_TYPES = list(config.SIGNAL_STRENGTH_MESSAGES)
+BUY_TYPES = {"STRONG_BUY", "MODERATE_BUY"}
+SELL_TYPES = {"STRONG_SELL", "MODERATE_SELL"}
+
+
+def _create_engine(pair: str) -> IndicatorEngine:
+    return IndicatorEngine(
+        [pair],
+        timeframe=config.INDICATOR_TIMEFRAME,
+        sma_period=config.INDICATOR_SMA_PERIOD,
+        ema_fast=config.INDICATOR_EMA_FAST,
+        ema_slow=config.INDICATOR_EMA_SLOW,
+        rsi_period=config.INDICATOR_RSI_PERIOD,
+        atr_period=config.INDICATOR_ATR_PERIOD,
+        bollinger_k=config.INDICATOR_BOLLINGER_K
+    )
+
+
+def replay_pair(pair: str, archive_dir: str, start: Optional[float] = None, end: Optional[float] = None,
+                threshold: Optional[float] = None, horizon: float = 300) -> Dict:
+    """Replay one pair and return its statistics per signal type.
+
+    A signal counts as a hit when the price has moved its way after the
+    recommended trading duration, or after `horizon` seconds when there is
+    no recommendation.
+    """
+    started = time.perf_counter()
+    # Read-only use: never expire segments of an archive we are only replaying
+    archive = TickArchive(archive_dir, retention_days=None)
+    engine = _create_engine(pair)
+    aggregator = BarAggregator(None, {engine.timeframe: TIMEFRAMES[engine.timeframe]})
+    aggregator.add_listener(engine.on_bar)
+
+    timestamps, prices, codes, strengths, durations = [], [], [], [], []
+    for chunk in archive.iter_range(pair, start, end):
+        for timestamp, price, bid, ask in zip(chunk["timestamp"].tolist(), chunk["price"].tolist(),
+                                              chunk["bid"].tolist(), chunk["ask"].tolist()):
+            aggregator.add_tick(pair, timestamp, price)
+            engine.step()
+            signal_data = signal_from_quote(
+                pair, price, bid, ask, datetime.fromtimestamp(timestamp).isoformat(),
+                source="replay", engine=engine, threshold=threshold
+            )
+            duration = get_trading_duration(signal_data["strength"], signal_data["trend"], threshold)
+            timestamps.append(timestamp)
+            prices.append(price)
+            codes.append(SIGNAL_TYPES.index(signal_data["signal"]))
+            strengths.append(signal_data["strength"])
+            durations.append(duration or 0)
+    archive.close()
+
+    timestamps, prices = np.array(timestamps), np.array(prices)
+    codes, strengths, durations = np.array(codes, dtype=np.int64), np.array(strengths), np.array(durations)
+
+    # Price at the end of each signal's holding period, if the archive reaches that far
+    holding = np.where(durations > 0, durations * 60, horizon)
+    exit_rows = np.searchsorted(timestamps, timestamps + holding, side="left")
+    resolved = exit_rows < len(timestamps)
+    exit_prices = np.where(resolved, prices[np.minimum(exit_rows, max(len(prices) - 1, 0))], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (exit_prices - prices) / prices
+
+    stats = {}
+    for code, signal_type in enumerate(SIGNAL_TYPES):
+        selected = codes == code
+        direction = 1 if signal_type in BUY_TYPES else -1 if signal_type in SELL_TYPES else 0
+        evaluated = selected & resolved
+        signed = direction * returns[evaluated]
+        stats[signal_type] = {
+            "count": int(selected.sum()),
+            "strength_sum": float(strengths[selected].sum()),
+            "with_duration": int((selected & (durations > 0)).sum()),
+            "evaluated": int(evaluated.sum()) if direction else 0,
+            "hits": int((signed > 0).sum()) if direction else 0,
+            "return_sum": float(signed.sum()) if direction else 0.0,
+        }
+    return {
+        "pair": pair,
+        "ticks": len(timestamps),
+        "elapsed": time.perf_counter() - started,
+        "signals": stats,
+    }
+
+
+def _summarize(stats: Dict) -> Dict:
+    count, evaluated = stats["count"], stats["evaluated"]
+    return {
+        "count": count,
+        "mean_strength": stats["strength_sum"] / count if count else None,
+        "with_duration": stats["with_duration"],
+        "evaluated": evaluated,
+        "hit_rate": stats["hits"] / evaluated if evaluated else None,
+        "mean_return": stats["return_sum"] / evaluated if evaluated else None,
+    }
+
+
+def aggregate(results) -> Dict:
+    """Per-pair and overall statistics per signal type"""
+    totals = {signal_type: {"count": 0, "strength_sum": 0.0, "with_duration": 0, "evaluated": 0,
+                            "hits": 0, "return_sum": 0.0} for signal_type in SIGNAL_TYPES}
+    pairs = {}
+    for result in results:
+        pairs[result["pair"]] = {
+            "ticks": result["ticks"],
+            "elapsed": round(result["elapsed"], 3),
+            "signals": {signal_type: _summarize(stats) for signal_type, stats in result["signals"].items()},
+        }
+        for signal_type, stats in result["signals"].items():
+            for field, value in stats.items():
+                totals[signal_type][field] += value
+    return {
+        "ticks": sum(result["ticks"] for result in results),
+        "pairs": pairs,
+        "signals": {signal_type: _summarize(stats) for signal_type, stats in totals.items()},
+    }
+
+
+def run(pairs, archive_dir: str, start: Optional[float] = None, end: Optional[float] = None,
+        threshold: Optional[float] = None, horizon: float = 300, workers: Optional[int] = None) -> Dict:
+    started = time.perf_counter()
+    workers = workers or min(len(pairs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(replay_pair, pair, archive_dir, start, end, threshold, horizon)
+            for pair in pairs
+        ]
+        results = [future.result() for future in futures]
+
+    report = aggregate(results)
+    elapsed = time.perf_counter() - started
+    report.update({
+        "threshold": config.SIGNAL_STRENGTH_THRESHOLD if threshold is None else threshold,
+        "start": start,
+        "end": end,
+        "horizon": horizon,
+        "workers": workers,
+        "elapsed": round(elapsed, 3),
+        "ticks_per_second": round(report["ticks"] / elapsed) if elapsed else None,
+    })
+    return report
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived ticks through the signal pipeline")
+    parser.add_argument("--pairs", nargs="+", help="pairs to replay (default: all archived pairs)")
+    parser.add_argument("--start", type=_parse_time, help="ISO start time")
+    parser.add_argument("--end", type=_parse_time, help="ISO end time")
+    parser.add_argument("--threshold", type=float, help="override config.SIGNAL_STRENGTH_THRESHOLD")
+    parser.add_argument("--horizon", type=float, default=config.REPLAY_HORIZON,
+                        help="seconds to evaluate signals without a trading duration")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per pair, up to CPUs)")
+    parser.add_argument("--archive-dir", default=config.TICK_ARCHIVE_DIR)
+    parser.add_argument("--output", default=config.REPLAY_OUTPUT_FILE)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    pairs = args.pairs or TickArchive(args.archive_dir, retention_days=None).pairs()
+    if not pairs:
+        logger.error(f"No archived ticks found in {args.archive_dir}")
+        return
+    report = run(pairs, args.archive_dir, args.start, args.end, args.threshold, args.horizon, args.workers)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    logger.info(
+        f"Replayed {report['ticks']} ticks for {len(pairs)} pairs in {report['elapsed']}s "
+        f"({report['ticks_per_second']} ticks/s), results in {args.output}"
+    )
+
+
+if __name__ == '__main__':
+    main()
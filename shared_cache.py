@@ -0,0 +1,163 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FXQC"
+LAYOUT_VERSION = 1
+
+# magic, layout version, slot count, payload size, hash of the pair list
+HEADER = struct.Struct("<4sIII8s")
+# seq (odd while a write is in progress), fetched_at epoch, payload length
+RECORD = struct.Struct("<QdI4x")
+
+
+def _pairs_digest(pairs: List[str]) -> bytes:
+    return hashlib.sha1("\n".join(pairs).encode()).digest()[:8]
+
+
+class SharedQuoteCache:
+    """Latest quote per pair in a shared memory segment all local processes map.
+
+    Every pair has a fixed slot: a record header followed by the quote as
+    JSON. Writers bump the slot's sequence number to an odd value, write,
+    and bump it to even again; readers retry until they see the same even
+    number before and after copying (a seqlock), so they never take a lock.
+    Writers serialize on an flock. A separate flock elects the one process
+    that runs the background refresh; it is released when that process
+    exits, and the next process to ask takes over.
+
+    All processes must be configured with the same pair list; attaching to
+    a segment with a different layout raises ValueError.
+    """
+
+    def __init__(self, name: str, pairs: List[str], lock_file: str, payload_size: int = 2048):
+        self.name = name
+        self.pairs = list(pairs)
+        self.payload_size = payload_size
+        self.slot_size = RECORD.size + payload_size
+        self._slots = {pair: index for index, pair in enumerate(self.pairs)}
+        # pair -> (seq, decoded quote), so unchanged slots are not decoded again
+        self._decoded: Dict[str, Tuple[int, Dict]] = {}
+
+        os.makedirs(os.path.dirname(lock_file) or ".", exist_ok=True)
+        self._write_lock = open(lock_file, 'a')
+        self._refresher_lock_file = f"{lock_file}.refresher"
+        self._refresher_lock = None
+
+        size = HEADER.size + len(self.pairs) * self.slot_size
+        fcntl.flock(self._write_lock, fcntl.LOCK_EX)
+        try:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                HEADER.pack_into(self._shm.buf, 0, MAGIC, LAYOUT_VERSION, len(self.pairs), payload_size,
+                                 _pairs_digest(self.pairs))
+                logger.info(f"Created shared quote cache {name} ({size} bytes)")
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                self._check_layout()
+        finally:
+            fcntl.flock(self._write_lock, fcntl.LOCK_UN)
+        # The segment outlives any single process; the resource tracker would
+        # otherwise unlink it when the process that mapped it exits
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+    def _check_layout(self):
+        magic, version, slots, payload_size, digest = HEADER.unpack_from(self._shm.buf, 0)
+        expected = (MAGIC, LAYOUT_VERSION, len(self.pairs), self.payload_size, _pairs_digest(self.pairs))
+        if (magic, version, slots, payload_size, digest) != expected:
+            self._shm.close()
+            raise ValueError(f"Shared memory segment {self.name} has a different layout, "
+                             f"remove /dev/shm/{self.name} after stopping all bot processes")
+
+    def _offset(self, pair: str) -> Optional[int]:
+        index = self._slots.get(pair)
+        if index is None:
+            return None
+        return HEADER.size + index * self.slot_size
+
+    def get(self, pair: str, retries: int = 100) -> Optional[Dict]:
+        """Latest quote stored for `pair`, or None"""
+        offset = self._offset(pair)
+        if offset is None:
+            return None
+        buf = self._shm.buf
+        payload_start = offset + RECORD.size
+        for _ in range(retries):
+            seq, _, length = RECORD.unpack_from(buf, offset)
+            if seq & 1:
+                time.sleep(0)  # A write is in progress
+                continue
+            if seq == 0:
+                return None
+            cached = self._decoded.get(pair)
+            if cached is not None and cached[0] == seq:
+                return cached[1]
+            payload = bytes(buf[payload_start:payload_start + length])
+            if RECORD.unpack_from(buf, offset)[0] != seq:
+                continue
+            signal_data = json.loads(payload)
+            self._decoded[pair] = (seq, signal_data)
+            return signal_data
+        logger.warning(f"Gave up reading {pair} from the shared quote cache")
+        return None
+
+    def fetched_at(self, pair: str) -> float:
+        """Epoch of the stored quote without decoding it; 0 if there is none"""
+        offset = self._offset(pair)
+        if offset is None:
+            return 0.0
+        return RECORD.unpack_from(self._shm.buf, offset)[1]
+
+    def put(self, pair: str, signal_data: Dict, fetched_at: float) -> bool:
+        """Store a quote unless the slot already holds a newer one"""
+        offset = self._offset(pair)
+        if offset is None:
+            return False
+        payload = json.dumps(signal_data).encode()
+        if len(payload) > self.payload_size:
+            logger.warning(f"Quote for {pair} is {len(payload)} bytes, too large for the shared quote cache")
+            return False
+
+        buf = self._shm.buf
+        payload_start = offset + RECORD.size
+        fcntl.flock(self._write_lock, fcntl.LOCK_EX)
+        try:
+            seq, stored_at, _ = RECORD.unpack_from(buf, offset)
+            if stored_at >= fetched_at:
+                return False
+            RECORD.pack_into(buf, offset, seq + 1, stored_at, 0)
+            buf[payload_start:payload_start + len(payload)] = payload
+            RECORD.pack_into(buf, offset, seq + 2, fetched_at, len(payload))
+        finally:
+            fcntl.flock(self._write_lock, fcntl.LOCK_UN)
+        return True
+
+    def is_refresher(self) -> bool:
+        """Whether this process is (or just became) the elected refresher"""
+        if self._refresher_lock is not None:
+            return True
+        lock = open(self._refresher_lock_file, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        self._refresher_lock = lock
+        logger.info(f"Process {os.getpid()} elected as the market data refresher")
+        return True
+
+    def close(self):
+        if self._refresher_lock is not None:
+            self._refresher_lock.close()
+            self._refresher_lock = None
+        self._decoded.clear()
+        self._shm.close()
+        self._write_lock.close()
@@ -0,0 +1,280 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def _stored_at(signal_data: Dict) -> float:
+    return datetime.fromisoformat(signal_data.get("fetched_at", signal_data["timestamp"])).timestamp()
+
+
+class SignalCache:
+    """Bounded TTL cache of signal snapshots persisted incrementally.
+
+    Each update is appended as one line to a log file; the log is folded
+    into the snapshot file (written to a temporary file and atomically
+    renamed) every `compact_every` updates. Entries are fresh for `ttl`
+    seconds and may then be served as stale for another `stale_window`
+    seconds while a refresh runs. The least recently used pair is evicted
+    once `max_entries` is exceeded.
+
+    Every stored snapshot gets a new `version`, so derived data such as the
+    rendered message can be cached per (pair, version).
+
+    Several processes may share the files: each appends its own updates and
+    picks up the others' with sync(). Only the owner compacts; it swaps in
+    a new, empty log file, which the other processes notice by its inode.
+    Appends hold a shared lock on `<log_file>.lock` and compaction an
+    exclusive one, so no line lands in a log that is being replaced.
+    """
+
+    def __init__(self, snapshot_file: str, log_file: str, ttl: float, stale_window: float = 0,
+                 max_entries: int = 1000, compact_every: int = 500, owner: bool = True):
+        self.snapshot_file = snapshot_file
+        self.log_file = log_file
+        self.ttl = ttl
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self.owner = owner
+
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # pair -> (version, stored-at epoch) so ages are computed without re-parsing timestamps
+        self._meta: Dict[str, Tuple[int, float]] = {}
+        self._version = 0
+        self._lock = threading.RLock()
+        self._log = None
+        self._log_entries = 0
+        self._loaded = False
+        # Position in the log (and the log file's inode) up to which sync() has read
+        self._read_offset = 0
+        self._read_inode = None
+        # Entries compaction picked up from other processes, reported by the next sync()
+        self._unreported: List[Dict] = []
+        self._lock_fd = None
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        if self._lock_fd is None:
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            self._lock_fd = open(f"{self.log_file}.lock", 'a')
+        fcntl.flock(self._lock_fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def load(self):
+        """Read the snapshot and replay the log; only the first call does any work"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            self._load_snapshot()
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'rb') as f:
+                    self._read_inode = os.fstat(f.fileno()).st_ino
+                    for record in self._read_records(f):
+                        self._remember(record["pair"], record["data"])
+                        self._log_entries += 1
+
+    def _load_snapshot(self) -> List[Dict]:
+        """Merge the snapshot file; returns the entries that were newer than ours"""
+        updated = []
+        try:
+            if os.path.exists(self.snapshot_file):
+                with open(self.snapshot_file, 'r') as f:
+                    for pair, signal_data in json.load(f).items():
+                        if self._is_newer(pair, signal_data):
+                            self._remember(pair, signal_data)
+                            updated.append(signal_data)
+        except Exception as e:
+            logger.error(f"Error loading cache snapshot: {e}")
+        return updated
+
+    def _read_records(self, f) -> List[Dict]:
+        """Complete log lines from the current position of `f` on; advances the read offset"""
+        records = []
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Still being written by another process
+            self._read_offset = f.tell()
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write
+                logger.warning("Skipping unreadable signal cache log line")
+        return records
+
+    def _is_newer(self, pair: str, signal_data: Dict) -> bool:
+        current = self._entries.get(pair)
+        return current is None or _stored_at(signal_data) > _stored_at(current)
+
+    def sync(self) -> List[Dict]:
+        """Pick up entries other processes added since the last call; returns them"""
+        with self._lock:
+            updated, self._unreported = self._unreported, []
+            try:
+                inode = os.stat(self.log_file).st_ino
+            except FileNotFoundError:
+                return updated
+            if inode != self._read_inode:
+                # The owner compacted: everything before the new log is in the snapshot
+                updated.extend(self._load_snapshot())
+                self._read_inode, self._read_offset = inode, 0
+
+            with open(self.log_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != self._read_inode:
+                    return updated  # Swapped again just now, the next sync reloads
+                f.seek(self._read_offset)
+                for record in self._read_records(f):
+                    pair, signal_data = record["pair"], record["data"]
+                    # Our own appends come back here too; they are not newer than what we hold
+                    if self._is_newer(pair, signal_data):
+                        self._remember(pair, signal_data)
+                        updated.append(signal_data)
+            return updated
+
+    def merge(self, pair: str, signal_data: Dict) -> bool:
+        """Adopt an entry stored elsewhere if it is newer than ours; it is not logged"""
+        with self._lock:
+            if not self._is_newer(pair, signal_data):
+                return False
+            self._remember(pair, signal_data)
+            return True
+
+    def _remember(self, pair: str, signal_data: Dict):
+        version = signal_data.get("version") or 0
+        if version <= self._version:
+            version = self._version + 1
+            signal_data["version"] = version
+        self._version = version
+
+        self._entries[pair] = signal_data
+        self._entries.move_to_end(pair)
+        self._meta[pair] = (version, _stored_at(signal_data))
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._meta.pop(evicted, None)
+
+    def _age(self, signal_data: Dict) -> float:
+        meta = self._meta.get(signal_data.get("pair"))
+        if meta and meta[0] == signal_data.get("version"):
+            stored_at = meta[1]
+        else:
+            stored_at = _stored_at(signal_data)
+        return time.time() - stored_at
+
+    def lookup(self, pair: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Return (signal, FRESH|STALE), or (None, None) if missing or expired"""
+        with self._lock:
+            signal_data = self._entries.get(pair)
+            if signal_data is None:
+                return None, None
+            self._entries.move_to_end(pair)
+            age = self._age(signal_data)
+            if age < self.ttl:
+                return signal_data, FRESH
+            if age < self.ttl + self.stale_window:
+                return signal_data, STALE
+            return None, None
+
+    def get(self, pair: str) -> Optional[Dict]:
+        """Return the entry regardless of its age"""
+        with self._lock:
+            return self._entries.get(pair)
+
+    def __contains__(self, pair: str) -> bool:
+        return pair in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def time_until_expiry(self, signal_data: Dict) -> float:
+        return max(0.0, self.ttl - self._age(signal_data))
+
+    def put(self, pair: str, signal_data: Dict):
+        with self._lock:
+            self._remember(pair, signal_data)
+            try:
+                self._append(pair, signal_data)
+                if self.owner and self._log_entries >= self.compact_every:
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Error saving cache: {e}")
+
+    def _append(self, pair: str, signal_data: Dict):
+        with self._file_lock(fcntl.LOCK_SH):
+            self._append_locked(pair, signal_data)
+
+    def _append_locked(self, pair: str, signal_data: Dict):
+        if self._log is not None and not self.owner:
+            # Follow the owner to the new log after a compaction
+            try:
+                swapped = os.stat(self.log_file).st_ino != os.fstat(self._log.fileno()).st_ino
+            except FileNotFoundError:
+                swapped = True
+            if swapped:
+                self._log.close()
+                self._log = None
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            self._log = open(self.log_file, 'a')
+        self._log.write(json.dumps({"pair": pair, "data": signal_data}) + "\n")
+        self._log.flush()
+        self._log_entries += 1
+
+    def compact(self):
+        """Write the current entries as the new snapshot and start an empty log"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # Read the log to its end first: lines other processes appended
+            # since our last sync() exist nowhere else once it is replaced
+            synced = self.sync()
+            self._unreported = synced
+
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(dict(self._entries), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+
+            # Replaying a log that is already in the snapshot is harmless,
+            # so a crash before the swap below loses nothing. The empty log
+            # replaces the old one as a new file so other processes notice.
+            if self._log is not None:
+                self._log.close()
+            tmp_log = f"{self.log_file}.tmp"
+            open(tmp_log, 'w').close()
+            os.replace(tmp_log, self.log_file)
+            self._log = open(self.log_file, 'a')
+            self._log_entries = 0
+            self._read_inode = os.fstat(self._log.fileno()).st_ino
+            self._read_offset = 0
+
+    def close(self):
+        with self._lock:
+            if self._log is None and self._log_entries == 0:
+                return
+            if self.owner:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting signal cache: {e}")
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if self._lock_fd is not None:
+                self._lock_fd.close()
+                self._lock_fd = None
@@ -0,0 +1,109 @@
+"""Signal strength, type and trading duration for a quote.
+
+Pure functions shared by the bot and by offline replay; importing this
+module opens no caches, files or API clients.
+"""
+import random
+from typing import Dict, Optional, Tuple
+
+import config
+from indicators import indicator_engine
+
+
+def _strength_levels(threshold: Optional[float] = None) -> Tuple[float, float]:
+    """(moderate, strong) buy levels; sell levels mirror them around 0.5"""
+    moderate = config.SIGNAL_STRENGTH_THRESHOLD if threshold is None else threshold
+    return moderate, round(moderate + config.SIGNAL_STRONG_MARGIN, 6)
+
+
+def get_signal_type(strength, threshold: Optional[float] = None):
+    """Determine signal type based on strength"""
+    moderate, strong = _strength_levels(threshold)
+    if strength >= strong:  # Increased threshold for stronger buy signals
+        return "STRONG_BUY"
+    elif strength >= moderate:  # Moderate buy needs higher confidence
+        return "MODERATE_BUY"
+    elif strength <= round(1 - strong, 6):  # Very low strength for strong sell
+        return "STRONG_SELL"
+    elif strength <= round(1 - moderate, 6):  # Decreased threshold for moderate sell
+        return "MODERATE_SELL"
+    else:
+        return "NEUTRAL"
+
+
+def get_trading_duration(strength, trend, threshold: Optional[float] = None):
+    """Calculate recommended trading duration based on signal strength and trend"""
+    if trend == "⬆️ RRITËSE":
+        base_duration = 5  # 5 minute base for upward trend
+    elif trend == "⬇️ ZBRITËSE":
+        base_duration = 3  # 3 minute base for downward trend
+    else:
+        return None  # No duration recommendation for neutral trend
+
+    # Adjust duration based on signal strength - only recommend for very strong signals
+    moderate, strong = _strength_levels(threshold)
+    if strength >= strong:  # Strong signals only
+        multiplier = 1.5  # Longer duration for very strong signals
+    elif strength >= moderate:
+        multiplier = 1.0  # Base duration for moderate signals
+    else:
+        return None  # No duration recommendation for weak signals
+
+    return int(base_duration * multiplier)
+
+
+def _spread_strength(close: float, bid: float, ask: float) -> Tuple[float, int]:
+    """Estimate strength and trend direction from the bid/ask spread alone"""
+    # Përmirësojmë trendin duke përdorur spread
+    spread = ask - bid
+    spread_percentage = spread / close
+
+    # Trend më realist bazuar në spread
+    if spread_percentage < 0.0001:  # Spread shumë i ngushtë
+        trend_direction = 1  # Trend pozitiv
+    elif spread_percentage > 0.0003:  # Spread i gjerë
+        trend_direction = -1  # Trend negativ
+    else:
+        trend_direction = 0  # Neutral
+
+    # Forcë e sinjalit më realiste
+    strength = 1 - (spread_percentage * 1000)  # Normalize spread impact
+    strength = min(max(strength, 0), 1)  # Keep between 0 and 1
+
+    # Përshtatim forcën bazuar në trendin
+    if trend_direction != 0:
+        strength = strength * (0.8 + (0.4 * random.random()))  # Add some randomness
+    else:
+        strength = strength * 0.5  # Weaken neutral signals
+
+    return strength, trend_direction
+
+
+def signal_from_quote(pair: str, close: float, bid: float, ask: float, timestamp: str,
+                      source: str = "direct", engine=None, threshold: Optional[float] = None) -> Dict:
+    """Derive signal strength, type and trend for a quote.
+
+    Once the indicator engine has enough history for the pair its strength
+    and EMA trend are used; until then the spread-based estimate is. Replay
+    passes its own engine and threshold instead of the live ones.
+    """
+    engine = engine or indicator_engine
+    indicator_signal = engine.signal_for(pair) if config.INDICATORS_ENABLED else None
+    if indicator_signal:
+        strength, trend_direction = indicator_signal
+    else:
+        strength, trend_direction = _spread_strength(close, bid, ask)
+
+    return {
+        "pair": pair,
+        "price": close,
+        "strength": strength,
+        "signal": get_signal_type(strength, threshold),
+        "timestamp": timestamp,
+        "trend": "⬆️ RRITËSE" if trend_direction > 0 else "⬇️ ZBRITËSE" if trend_direction < 0 else "➡️ NEUTRALE",
+        "bid": bid,
+        "ask": ask,
+        "is_demo": False,
+        "source": source,
+        "strength_source": "indicators" if indicator_signal else "spread"
+    }
@@ -0,0 +1,156 @@
+"""Run the bot as several worker processes sharded by user id.
+
+The supervisor receives updates from Telegram (polling or webhook, as
+configured) and forwards each one to the worker that owns its user, so a
+user's updates always land in the same process. Workers share the SQLite
+database and the signal cache files; worker 0 additionally keeps the
+market data pipeline (tick archive, bars, pair refresh) and
+resumes interrupted broadcasts.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(update: Update, workers: int) -> int:
+    """Index of the worker that handles `update`"""
+    if update.effective_user is not None:
+        key = update.effective_user.id
+    elif update.effective_chat is not None:
+        key = update.effective_chat.id
+    else:
+        key = 0
+    return key % workers
+
+
+class WorkerPool:
+    """Worker processes with one inbound queue each; dead workers are restarted"""
+
+    def __init__(self, size: int):
+        self.size = size
+        # Spawned workers start from a clean interpreter instead of a copy of the router's state
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(size)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * size
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker, args=(index, self.queues[index]), name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.size):
+            self._spawn(index)
+
+    def dispatch(self, update: Update):
+        self.queues[shard_for(update, self.size)].put(update.to_dict())
+
+    def restart_dead(self):
+        for index, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self._spawn(index)
+
+    def stop(self, timeout: float = 30):
+        for queue in self.queues:
+            queue.put(None)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in {timeout}s, terminating")
+                process.terminate()
+                process.join()
+
+
+def build_router(pool: WorkerPool) -> Application:
+    # Updates are forwarded one at a time, in the order Telegram sent them
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(False)
+        .build()
+    )
+
+    async def route(update: Update, context):
+        pool.dispatch(update)
+
+    async def restart_workers(context):
+        pool.restart_dead()
+
+    application.add_handler(TypeHandler(Update, route))
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(restart_workers, interval=config.WORKER_RESTART_INTERVAL)
+    return application
+
+
+def run(workers: int):
+    if config.STORAGE_BACKEND != "sqlite":
+        raise ValueError("WORKER_PROCESSES > 1 needs the sqlite storage backend")
+    import bot
+
+    pool = WorkerPool(workers)
+    pool.start()
+    logging.info(f"Sharding updates across {workers} workers")
+    try:
+        bot.start(build_router(pool))
+    finally:
+        pool.stop()
+
+
+async def _serve(application: Application, queue):
+    loop = asyncio.get_running_loop()
+    async with application:
+        # post_init and post_shutdown are only called by run_polling/run_webhook
+        await application.post_init(application)
+        await application.start()
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()
+    await application.post_shutdown(application)
+
+
+def run_worker(index: int, queue):
+    # The supervisor stops workers through their queue; Ctrl+C reaches the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    # Admin commands and broadcasts in one worker write users another worker
+    # serves, so workers go straight to the database instead of caching users
+    config.USER_CACHE_ENABLED = False
+    import bot
+    import forex
+    import handlers
+    from database import Database
+    from quota import QuotaService
+
+    previous_db, handlers.db = handlers.db, Database()
+    handlers.quotas = QuotaService(handlers.db)
+    previous_db.close()
+    # Only one process may compact the shared signal cache files
+    forex._signal_cache.owner = index == 0
+
+    application = bot.build_application(worker=index)
+    try:
+        asyncio.run(_serve(application, queue))
+    finally:
+        handlers.db.close()
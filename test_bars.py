@@ -0,0 +1,66 @@
+from bars import BarAggregator, BarStore
+
+START = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def _aggregator(tmp_path, timeframes=None):
+    store = BarStore(str(tmp_path))
+    aggregator = BarAggregator(store, timeframes or {"1m": 60, "5m": 300})
+    finished = []
+    aggregator.add_listener(lambda pair, timeframe, bar: finished.append((timeframe, float(bar["start"]))))
+    return store, aggregator, finished
+
+
+def test_late_tick_after_close_due_is_dropped(tmp_path):
+    store, aggregator, finished = _aggregator(tmp_path)
+    aggregator.add_tick("EUR/GBP", START + 185, 0.85)
+    aggregator.close_due(START + 300 + 5)
+    # A quote stamped inside the closed windows arrives afterwards
+    aggregator.add_tick("EUR/GBP", START + 190, 0.86)
+    aggregator.close_due(START + 600 + 5)
+
+    assert finished == [("1m", START + 180.0), ("5m", float(START))]
+    assert store.query("EUR/GBP", "1m")["start"].tolist() == [START + 180.0]
+
+
+def test_closed_windows_survive_restart(tmp_path):
+    _, aggregator, _ = _aggregator(tmp_path)
+    aggregator.add_tick("EUR/USD", START + 10, 1.1)
+    aggregator.close_due(START + 300)
+
+    store, restarted, finished = _aggregator(tmp_path)
+    restarted.add_tick("EUR/USD", START + 20, 1.2)
+    restarted.add_tick("EUR/USD", START + 310, 1.3)
+    restarted.close_due(START + 400)
+    assert finished == [("1m", START + 300.0)]
+    assert store.query("EUR/USD", "1m")["start"].tolist() == [float(START), START + 300.0]
+
+
+def test_bar_boundaries_and_ohlc(tmp_path):
+    store, aggregator, finished = _aggregator(tmp_path, {"1m": 60})
+    aggregator.add_tick("EUR/USD", START, 1.10)
+    aggregator.add_tick("EUR/USD", START + 30, 1.12)
+    aggregator.add_tick("EUR/USD", START + 59.999, 1.09)
+    # A tick exactly on the boundary opens the next window
+    aggregator.add_tick("EUR/USD", START + 60, 1.11)
+    assert finished == [("1m", float(START))]
+
+    bar = store.query("EUR/USD", "1m")[0]
+    assert (bar["open"], bar["high"], bar["low"], bar["close"], bar["ticks"]) == (1.10, 1.12, 1.09, 1.09, 3)
+    # The open window is not finished before its end
+    assert aggregator.close_due(START + 119) == 0
+    assert aggregator.close_due(START + 120) == 1
+    assert store.query("EUR/USD", "1m", start=START + 60, end=START + 120)["start"].tolist() == [START + 60.0]
+
+
+def test_late_tick_while_a_newer_bar_is_open_is_dropped(tmp_path):
+    store, aggregator, finished = _aggregator(tmp_path, {"1m": 60})
+    aggregator.add_tick("EUR/USD", START + 10, 1.10)
+    aggregator.add_tick("EUR/USD", START + 70, 1.20)
+    aggregator.add_tick("EUR/USD", START + 20, 1.50)
+    aggregator.close_due(START + 120)
+
+    bars = store.query("EUR/USD", "1m")
+    assert bars["start"].tolist() == [float(START), START + 60.0]
+    assert bars["high"].tolist() == [1.10, 1.20]
+    assert finished == [("1m", float(START)), ("1m", START + 60.0)]
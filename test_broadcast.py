@@ -0,0 +1,115 @@
+import asyncio
+
+from telegram.error import RetryAfter, TimedOut
+
+from broadcast import Broadcaster
+
+
+class FakeBot:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(chat_id)
+
+
+def _broadcaster(bot):
+    return Broadcaster(bot, concurrency=1, rate_per_second=1000, per_chat_interval=0, max_attempts=2)
+
+
+def test_flood_control_does_not_use_up_attempts():
+    bot = FakeBot([RetryAfter(0), RetryAfter(0), RetryAfter(0)])
+    stats = asyncio.run(_broadcaster(bot).run([1], "hi"))
+    assert stats.delivered_ids == [1]
+    assert stats.retries == 3
+
+
+def test_other_errors_use_up_attempts(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr("broadcast.asyncio.sleep", no_sleep)
+    bot = FakeBot([TimedOut(), RetryAfter(0), TimedOut()])
+    stats = asyncio.run(_broadcaster(bot).run([1], "hi"))
+    assert stats.failed_ids == [1]
+    assert bot.sent == []
+
+
+def test_resume_skips_jobs_with_a_live_lease(tmp_path, monkeypatch):
+    import broadcast
+    from database import Database, SqliteStorage
+
+    db = Database(SqliteStorage(str(tmp_path / "bot.db"), import_dir=None))
+    db.create_user(1, "user1")
+    live = db.create_broadcast("live", 10, [1])
+    expired = db.create_broadcast("expired", 10, [1])
+    assert db.acquire_broadcast_lease(live, "other:1")
+    db.storage.acquire_broadcast_lease(expired, "other:2", now=0, lease_until=1)
+
+    started = []
+    monkeypatch.setattr(broadcast, "run_broadcast_job", lambda bot, db, job: job["id"])
+
+    class FakeApplication:
+        bot = None
+
+        def create_task(self, job_id):
+            started.append(job_id)
+
+    broadcast.resume_broadcasts(FakeApplication(), db)
+    assert started == [expired]
+    db.close()
+
+
+def _job_db(tmp_path, users):
+    from database import Database, SqliteStorage
+
+    db = Database(SqliteStorage(str(tmp_path / "bot.db"), import_dir=None))
+    for user_id in users:
+        db.create_user(user_id, f"user{user_id}")
+    job_id = db.create_broadcast("EUR/USD BUY", 100, users)
+    return db, job_id
+
+
+def test_expired_lease_is_taken_over_without_resending(tmp_path, monkeypatch):
+    import broadcast
+
+    monkeypatch.setattr(broadcast.config, "BROADCAST_CHECKPOINT_SIZE", 1)
+    db, job_id = _job_db(tmp_path, [1, 2, 3])
+    # A sender died after claiming user 1 and its lease ran out
+    db.storage.acquire_broadcast_lease(job_id, "dead:1", now=0, lease_until=1)
+    assert db.claim_broadcast_recipients(job_id, 1) == [1]
+
+    bot = FakeBot([])
+    asyncio.run(broadcast.run_broadcast_job(bot, db, db.get_broadcast(job_id)))
+    job = db.get_broadcast(job_id)
+    assert bot.sent == [2, 3, 100]
+    assert (job["status"], job["delivered"], job["uncertain"]) == ("done", 2, 1)
+    assert job["owner"] == broadcast.LEASE_OWNER
+    db.close()
+
+
+def test_sender_stops_when_its_lease_is_taken_over(tmp_path, monkeypatch):
+    import time
+
+    import broadcast
+
+    monkeypatch.setattr(broadcast.config, "BROADCAST_CHECKPOINT_SIZE", 1)
+    db, job_id = _job_db(tmp_path, [1, 2, 3])
+
+    class StalledBot(FakeBot):
+        async def send_message(self, chat_id, text):
+            await super().send_message(chat_id, text)
+            # The sender stalls past its lease and another process takes the job
+            far_future = time.time() + 10 * broadcast.config.BROADCAST_LEASE_SECONDS
+            assert db.storage.acquire_broadcast_lease(job_id, "other:1", now=far_future, lease_until=far_future + 1)
+
+    bot = StalledBot([])
+    asyncio.run(broadcast.run_broadcast_job(bot, db, db.get_broadcast(job_id)))
+    job = db.get_broadcast(job_id)
+    assert bot.sent == [1]
+    assert (job["status"], job["owner"], job["delivered"]) == ("running", "other:1", 1)
+    assert job_id not in broadcast._running
+    db.close()
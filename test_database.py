@@ -0,0 +1,246 @@
+import json
+import os
+
+import pytest
+
+import config
+from database import Database, JsonStorage, SqliteStorage, create_storage
+
+
+def _user(user_id, **fields):
+    user = {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "is_premium": False,
+        "signals_used": 0,
+        "daily_signals": 0,
+        "last_signal_date": "2024-01-01",
+        "join_date": "2024-01-01T00:00:00",
+        "license_key": None,
+    }
+    user.update(fields)
+    return user
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        storage = SqliteStorage(str(tmp_path / "bot.db"), import_dir=None)
+    else:
+        storage = JsonStorage(str(tmp_path))
+    yield storage
+    storage.close()
+
+
+def test_users_round_trip(storage):
+    storage.save_users({1: _user(1), 2: _user(2, is_premium=True)})
+    assert storage.get_user(1) == _user(1)
+    assert storage.get_user(2)["is_premium"] is True
+    assert storage.get_user(3) is None
+    assert set(storage.get_all_users()) == {"1", "2"}
+
+    storage.save_user(1, _user(1, signals_used=2))
+    assert storage.get_user(1)["signals_used"] == 2
+
+
+def test_licenses_and_signals(storage):
+    storage.save_license("KEY", {"key": "KEY", "duration_days": 30, "created_at": "2024-01-01", "used": False})
+    assert storage.get_license("KEY")["used"] is False
+    assert storage.get_license("MISSING") is None
+
+    first = storage.add_signal({"pair": "EUR/USD", "sent_by": 1, "created_at": "2024-01-01"})
+    second = storage.add_signal({"pair": "GBP/USD", "sent_by": 1, "created_at": "2024-01-02"})
+    assert int(second) == int(first) + 1
+
+
+def test_broadcast_lifecycle(storage):
+    storage.save_users({1: _user(1), 2: _user(2), 3: _user(3)})
+    job = {"text": "hi", "status": "running", "total": 3, "delivered": 0, "failed": 0, "uncertain": 0}
+    job_id = storage.create_broadcast(job, [1, 2, 3])
+    assert storage.claim_broadcast_recipients(job_id, 2) == [1, 2]
+
+    storage.checkpoint_broadcast(job_id, [1], [2], {1: _user(1, signals_used=1)})
+    assert storage.get_user(1)["signals_used"] == 1
+    job = storage.get_broadcast(job_id)
+    assert (job["delivered"], job["failed"]) == (1, 1)
+
+    assert storage.claim_broadcast_recipients(job_id, 5) == [3]
+    assert storage.recover_broadcast(job_id) == 1
+    assert storage.claim_broadcast_recipients(job_id, 5) == []
+    assert [job["id"] for job in storage.get_unfinished_broadcasts()] == [job_id]
+
+
+def test_activate_and_remove_license(storage):
+    db = Database(storage)
+    db.create_user(1, "user1")
+    db.create_license("KEY", 30)
+
+    assert db.activate_license(1, "KEY") is True
+    assert db.get_user(1)["is_premium"] is True
+    assert storage.get_license("KEY")["used"] is True
+    assert db.activate_license(1, "KEY") is False
+
+    assert db.remove_user_license(1) is True
+    assert db.get_user(1)["is_premium"] is False
+    assert storage.get_license("KEY")["used"] is False
+
+
+def test_sqlite_license_activation_is_atomic(tmp_path, monkeypatch):
+    storage = SqliteStorage(str(tmp_path / "bot.db"), import_dir=None)
+    db = Database(storage)
+    db.create_user(1, "user1")
+    db.create_license("KEY", 30)
+
+    def crash(conn, users_data):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(storage, "_upsert_users", crash)
+    with pytest.raises(RuntimeError):
+        db.activate_license(1, "KEY")
+    monkeypatch.undo()
+
+    # Neither write happened, so the license can still be used
+    assert storage.get_license("KEY")["used"] is False
+    assert db.activate_license(1, "KEY") is True
+    storage.close()
+
+
+def test_sqlite_imports_json_data_once(tmp_path):
+    legacy = JsonStorage(str(tmp_path))
+    os.remove(legacy.broadcasts_file)
+    legacy.save_users({1: _user(1), 2: _user(2, is_premium=True)})
+    legacy.save_license("KEY", {"key": "KEY", "duration_days": 30, "created_at": "2024-01-01", "used": True})
+    legacy.add_signal({"pair": "EUR/USD", "sent_by": 1, "created_at": "2024-01-01"})
+
+    db_path = str(tmp_path / "bot.db")
+    storage = SqliteStorage(db_path, import_dir=str(tmp_path))
+    assert storage.get_all_users() == {"1": _user(1), "2": _user(2, is_premium=True)}
+    assert storage.get_license("KEY")["used"] is True
+    storage.close()
+
+    # Importing only reads the files that exist
+    assert not os.path.exists(tmp_path / "broadcasts.json")
+
+    # An existing database is never re-imported
+    with open(legacy.users_file, 'w') as f:
+        json.dump({}, f)
+    storage = SqliteStorage(db_path, import_dir=str(tmp_path))
+    assert len(storage.get_all_users()) == 2
+    storage.close()
+
+
+def test_create_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "SQLITE_DB_PATH", os.path.join(str(tmp_path), "bot.db"))
+    monkeypatch.setattr(config, "USER_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+    storage = create_storage("sqlite")
+    assert isinstance(storage, SqliteStorage)
+    storage.close()
+    assert isinstance(create_storage("json"), JsonStorage)
+    with pytest.raises(ValueError):
+        create_storage("redis")
+
+
+def test_create_storage_times_the_backend_under_the_cache(tmp_path, monkeypatch):
+    from metrics import TimedStorage, registry
+    from user_cache import CachedStorage
+
+    monkeypatch.setattr(config, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "SQLITE_DB_PATH", os.path.join(str(tmp_path), "bot.db"))
+    monkeypatch.setattr(config, "USER_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "METRICS_ENABLED", True)
+
+    storage = create_storage("sqlite")
+    assert isinstance(storage, CachedStorage)
+    assert isinstance(storage.storage, TimedStorage)
+    assert isinstance(storage.storage.storage, SqliteStorage)
+
+    # The cache's counters are exported with the other metrics
+    storage.get_user(1)
+    assert 'bot_user_cache{stat="misses"} 1' in registry.render()
+    storage.close()
+
+
+def test_create_storage_skips_the_user_cache_for_shared_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "SQLITE_DB_PATH", os.path.join(str(tmp_path), "bot.db"))
+    monkeypatch.setattr(config, "USER_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "SHARED_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+    storage = create_storage("sqlite")
+    assert isinstance(storage, SqliteStorage)
+    storage.close()
+
+
+def test_broadcast_lease(storage):
+    job = {"text": "hi", "status": "running", "total": 1, "delivered": 0, "failed": 0, "uncertain": 0}
+    job_id = storage.create_broadcast(job, [1])
+    assert storage.acquire_broadcast_lease(job_id, "a", now=100, lease_until=200)
+    # The holder renews, anyone else waits for the lease to expire
+    assert storage.acquire_broadcast_lease(job_id, "a", now=150, lease_until=250)
+    assert not storage.acquire_broadcast_lease(job_id, "b", now=200, lease_until=300)
+    assert storage.acquire_broadcast_lease(job_id, "b", now=251, lease_until=351)
+    assert not storage.acquire_broadcast_lease(job_id, "a", now=300, lease_until=400)
+    assert storage.get_broadcast(job_id)["owner"] == "b"
+
+    storage.update_broadcast(job_id, {"status": "done"})
+    assert not storage.acquire_broadcast_lease(job_id, "b", now=300, lease_until=400)
+
+
+def test_sqlite_adds_lease_columns_to_old_databases(tmp_path):
+    import sqlite3
+
+    db_path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE broadcasts (id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, "
+                 "admin_chat_id INTEGER, status_message_id INTEGER, status TEXT NOT NULL, "
+                 "total INTEGER NOT NULL DEFAULT 0, delivered INTEGER NOT NULL DEFAULT 0, "
+                 "failed INTEGER NOT NULL DEFAULT 0, uncertain INTEGER NOT NULL DEFAULT 0, "
+                 "created_at TEXT, updated_at TEXT)")
+    conn.close()
+
+    storage = SqliteStorage(db_path, import_dir=None)
+    job_id = storage.create_broadcast({"text": "hi", "status": "running", "total": 0}, [])
+    assert storage.acquire_broadcast_lease(job_id, "a", now=100, lease_until=200)
+    storage.close()
+
+
+def test_reserve_and_release_signal(storage, monkeypatch):
+    monkeypatch.setattr(config, "FREE_SIGNAL_LIMIT", 2)
+    monkeypatch.setattr(config, "PREMIUM_DAILY_LIMIT", 1)
+    db = Database(storage)
+    storage.save_users({1: _user(1), 2: _user(2, is_premium=True, daily_signals=5, last_signal_date="2024-01-01")})
+
+    assert db.reserve_signal_use(1)["signals_used"] == 1
+    assert db.reserve_signal_use(1)["signals_used"] == 2
+    assert db.reserve_signal_use(1) is None
+    db.release_signal_use(1)
+    assert storage.get_user(1)["signals_used"] == 1
+
+    # A premium user's count starts over on a new day
+    user = db.reserve_signal_use(2, "2024-01-02")
+    assert (user["daily_signals"], user["last_signal_date"]) == (1, "2024-01-02")
+    assert db.reserve_signal_use(2, "2024-01-02") is None
+    # A refund for another day leaves today's count alone
+    db.release_signal_use(2, "2024-01-01")
+    assert storage.get_user(2)["daily_signals"] == 1
+    db.release_signal_use(2, "2024-01-02")
+    assert storage.get_user(2)["daily_signals"] == 0
+
+    assert db.reserve_signal_use(3) is None
+
+
+def test_json_broadcast_progress_does_not_rewrite_recipients(tmp_path):
+    storage = JsonStorage(str(tmp_path))
+    job = {"text": "hi", "status": "running", "total": 3, "delivered": 0, "failed": 0, "uncertain": 0}
+    job_id = storage.create_broadcast(job, [1, 2, 3])
+    assert storage.claim_broadcast_recipients(job_id, 2) == [1, 2]
+
+    # broadcasts.json only holds the job summary and two offsets
+    with open(storage.broadcasts_file) as f:
+        stored = json.load(f)[job_id]
+    assert "recipients" not in stored
+    assert (stored["claimed"], stored["checkpointed"]) == (2, 0)
@@ -0,0 +1,42 @@
+import os
+import tempfile
+from datetime import datetime
+
+import config
+
+# forex opens its signal cache and API usage store on import; keep them out of data/
+_data_dir = tempfile.mkdtemp()
+config.SIGNAL_CACHE_FILE = os.path.join(_data_dir, "signal_cache.json")
+config.SIGNAL_CACHE_LOG_FILE = os.path.join(_data_dir, "signal_cache.log")
+config.API_USAGE_DB_PATH = os.path.join(_data_dir, "api_usage.db")
+
+import forex  # noqa: E402
+from signal_cache import SignalCache  # noqa: E402
+
+
+def _signal(price):
+    now = datetime.now().isoformat()
+    return {"pair": "EUR/USD", "price": price, "bid": price - 0.0001, "ask": price + 0.0001,
+            "strength": 0.9, "signal": "STRONG_BUY", "trend": "⬆️ RRITËSE", "timestamp": now,
+            "fetched_at": now, "is_demo": False}
+
+
+def test_rendered_message_follows_the_snapshot_version(tmp_path):
+    cache = SignalCache(str(tmp_path / "cache.json"), str(tmp_path / "cache.log"), ttl=300)
+    first = _signal(1.1)
+    cache.put("EUR/USD", first)
+    message = forex.get_signal_message(first)
+    assert "1.10000" in message
+    # The same version is served from the rendered cache
+    assert forex.get_signal_message(cache.get("EUR/USD")) is message
+
+    second = _signal(1.2)
+    cache.put("EUR/USD", second)
+    assert second["version"] > first["version"]
+    assert "1.20000" in forex.get_signal_message(second)
+
+
+def test_unversioned_signals_are_not_cached():
+    forex._rendered_messages.clear()
+    assert "1.30000" in forex.get_signal_message(_signal(1.3))
+    assert forex._rendered_messages == {}
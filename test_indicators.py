@@ -0,0 +1,95 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from indicators import IndicatorEngine
+
+
+def _reference(closes, highs, lows, sma_period=20, ema_fast=12, ema_slow=26, rsi_period=14, atr_period=14, k=2.0):
+    """Textbook indicators for one series, computed with plain loops"""
+    window = closes[-sma_period:]
+    sma = sum(window) / len(window)
+    std = math.sqrt(sum((c - sma) ** 2 for c in window) / len(window))
+
+    def ema(period):
+        alpha = 2 / (period + 1)
+        value = closes[0]
+        for c in closes[1:]:
+            value += alpha * (c - value)
+        return value
+
+    # Wilder: simple mean of the first `period` values, then (period - 1) / period smoothing
+    def wilder(values, period):
+        value = sum(values[:period]) / len(values[:period])
+        for v in values[period:]:
+            value = (value * (period - 1) + v) / period
+        return value
+
+    deltas = [b - a for a, b in zip(closes, closes[1:])]
+    avg_gain = wilder([max(d, 0) for d in deltas], rsi_period)
+    avg_loss = wilder([max(-d, 0) for d in deltas], rsi_period)
+    rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+
+    ranges = [highs[0] - lows[0]] + [
+        max(h, prev) - min(l, prev) for h, l, prev in zip(highs[1:], lows[1:], closes)
+    ]
+    atr = wilder(ranges, atr_period)
+    return {
+        "sma": sma,
+        "ema_fast": ema(ema_fast),
+        "ema_slow": ema(ema_slow),
+        "rsi": rsi,
+        "atr": atr,
+        "bb_upper": sma + k * std,
+        "bb_lower": sma - k * std,
+    }
+
+
+def _series(seed, length):
+    rng = random.Random(seed)
+    closes, highs, lows = [], [], []
+    price = 1.1
+    for _ in range(length):
+        price += rng.uniform(-0.002, 0.002)
+        closes.append(price)
+        highs.append(price + rng.uniform(0, 0.001))
+        lows.append(price - rng.uniform(0, 0.001))
+    return closes, highs, lows
+
+
+def test_batched_indicators_match_the_reference():
+    pairs = ["EUR/USD", "GBP/USD", "USD/JPY"]
+    series = [_series(seed, 60) for seed in range(len(pairs))]
+    engine = IndicatorEngine(pairs)
+    for i in range(60):
+        close = np.array([s[0][i] for s in series])
+        high = np.array([s[1][i] for s in series])
+        low = np.array([s[2][i] for s in series])
+        engine.update(close, high, low)
+
+    snapshot = engine.snapshot()
+    assert snapshot["ready"].all()
+    for row, (closes, highs, lows) in enumerate(series):
+        expected = _reference(closes, highs, lows)
+        for name, value in expected.items():
+            assert snapshot[name][row] == pytest.approx(value, rel=1e-9), name
+
+
+def test_staged_bars_only_advance_their_own_pair():
+    engine = IndicatorEngine(["EUR/USD", "GBP/USD"], sma_period=3, ema_fast=2, ema_slow=3, rsi_period=2, atr_period=2)
+    closes, highs, lows = _series(1, 10)
+    for close, high, low in zip(closes, highs, lows):
+        engine.add_bar("EUR/USD", high, low, close)
+        assert engine.step() == 1
+
+    snapshot = engine.snapshot()
+    expected = _reference(closes, highs, lows, sma_period=3, ema_fast=2, ema_slow=3, rsi_period=2, atr_period=2)
+    assert snapshot["sma"][0] == pytest.approx(expected["sma"])
+    assert snapshot["rsi"][0] == pytest.approx(expected["rsi"])
+    assert snapshot["atr"][0] == pytest.approx(expected["atr"])
+    assert snapshot["ready"].tolist() == [True, False]
+    assert engine.signal_for("GBP/USD") is None
+    strength, _ = engine.signal_for("EUR/USD")
+    assert 0 <= strength <= 1
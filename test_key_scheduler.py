@@ -0,0 +1,94 @@
+import time
+
+from key_scheduler import KeyScheduler, UsageStore
+
+
+def test_daily_quota_is_a_calendar_day_counter():
+    usage = UsageStore()
+    assert usage.try_consume("a", 2, day="2024-01-01")
+    assert usage.try_consume("a", 2, day="2024-01-01")
+    assert not usage.try_consume("a", 2, day="2024-01-01")
+    # The count starts over on the next day, not after a rolling 24 hours
+    assert usage.try_consume("a", 2, day="2024-01-02")
+    assert usage.used("a", day="2024-01-01") == 2
+    usage.close()
+
+
+def test_old_days_are_pruned():
+    usage = UsageStore(keep_days=1)
+    usage.try_consume("a", 5, day="2024-01-01")
+    usage.try_consume("a", 5, day="2024-01-03")
+    assert usage.used("a", day="2024-01-01") == 0
+    usage.close()
+
+
+def test_daily_usage_survives_restart(tmp_path):
+    path = str(tmp_path / "api_usage.db")
+    scheduler = KeyScheduler({"a": "key-a"}, default_quota={"per_day": 2}, usage=UsageStore(path))
+    assert scheduler.acquire().name == "a"
+    assert scheduler.acquire().name == "a"
+    assert scheduler.acquire() is None
+    scheduler.usage.close()
+
+    restarted = KeyScheduler({"a": "key-a"}, default_quota={"per_day": 2}, usage=UsageStore(path))
+    assert restarted.acquire() is None
+    assert restarted.get_budgets()["a"]["day_remaining"] == 0
+    restarted.usage.close()
+
+
+def test_daily_usage_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "api_usage.db")
+    other = UsageStore(path)
+    scheduler = KeyScheduler({"a": "key-a", "b": "key-b"}, default_quota={"per_day": 1},
+                             usage=UsageStore(path))
+    # Another process spends key a
+    other.try_consume("a", 1)
+    assert scheduler.acquire().name == "b"
+    assert scheduler.acquire() is None
+    other.close()
+    scheduler.usage.close()
+
+
+def test_minute_budget_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "api_usage.db")
+    quota = {"per_minute": 2}
+    first = KeyScheduler({"a": "key-a"}, default_quota=quota, usage=UsageStore(path))
+    second = KeyScheduler({"a": "key-a"}, default_quota=quota, usage=UsageStore(path))
+
+    assert first.acquire() is not None
+    assert second.acquire() is not None
+    # Two processes, one key: the minute is used up for both
+    assert first.acquire() is None
+    assert second.get_budgets()["a"]["minute_remaining"] == 0
+    first.usage.close()
+    second.usage.close()
+
+
+def test_rate_limited_key_waits_for_the_next_minute():
+    usage = UsageStore()
+    scheduler = KeyScheduler({"a": "key-a", "b": "key-b"}, default_quota={"per_minute": 5}, usage=usage)
+    api_key = scheduler.acquire()
+    scheduler.report_rate_limited(api_key)
+    assert scheduler.get_budgets()[api_key.name]["minute_remaining"] == 0
+    assert scheduler.acquire().name != api_key.name
+
+    # Counts start over in the next minute
+    next_minute = int(time.time() // 60) + 1
+    assert usage.try_consume(api_key.name, None, per_minute=5, minute=next_minute)
+    usage.close()
+
+
+def test_busy_usage_store_means_no_key(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "api_usage.db")
+    scheduler = KeyScheduler({"a": "key-a"}, default_quota={"per_day": 10},
+                             usage=UsageStore(path, busy_timeout=0.05))
+    # Another process holds the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    assert scheduler.acquire() is None
+    other.execute("COMMIT")
+    assert scheduler.acquire().name == "a"
+    other.close()
+    scheduler.usage.close()
@@ -0,0 +1,112 @@
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import config
+from database import Database, SqliteStorage
+from quota import QuotaService, current_day, daily_signals, time_until_reset
+
+UTC = timezone.utc
+
+
+@pytest.fixture
+def server_tz(monkeypatch):
+    """Run the server clock in a given zone"""
+    def set_zone(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+
+    yield set_zone
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_reset_zone_decides_the_day(monkeypatch):
+    now = datetime(2024, 1, 31, 20, 0, tzinfo=UTC)
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "Asia/Tokyo")
+    assert current_day(now) == "2024-02-01"
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "America/New_York")
+    assert current_day(now) == "2024-01-31"
+
+
+def test_server_time_without_a_reset_zone(monkeypatch, server_tz):
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "")
+    server_tz("Asia/Tokyo")
+    now = datetime(2024, 1, 31, 20, 0, tzinfo=UTC)
+    # 05:00 in Tokyo, so 19 hours until the server's midnight
+    assert current_day(now) == "2024-02-01"
+    assert time_until_reset(now) == 19 * 3600
+
+    # A reset zone overrides the server's zone
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "UTC")
+    assert current_day(now) == "2024-01-31"
+    assert time_until_reset(now) == 4 * 3600
+
+
+def test_time_until_reset_at_month_and_year_end(monkeypatch):
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "Europe/Tirane")
+    zone = ZoneInfo("Europe/Tirane")
+    assert time_until_reset(datetime(2024, 2, 29, 23, 0, tzinfo=zone)) == 3600
+    assert time_until_reset(datetime(2024, 12, 31, 23, 59, 30, tzinfo=zone)) == 30
+    assert current_day(datetime(2024, 12, 31, 23, 30, tzinfo=UTC)) == "2025-01-01"
+
+
+def test_time_until_reset_across_dst(monkeypatch):
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "Europe/Tirane")
+    zone = ZoneInfo("Europe/Tirane")
+    # Clocks go forward on 31 March and back on 27 October 2024
+    assert time_until_reset(datetime(2024, 3, 31, 0, 0, tzinfo=zone)) == 23 * 3600
+    assert time_until_reset(datetime(2024, 10, 27, 0, 0, tzinfo=zone)) == 25 * 3600
+
+
+def test_time_until_reset_across_dst_in_server_time(monkeypatch, server_tz):
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "")
+    server_tz("Europe/Tirane")
+    midnight = datetime(2024, 3, 31, 0, 0).astimezone()
+    assert time_until_reset(midnight) == 23 * 3600
+
+
+def test_daily_signals_only_count_for_their_day():
+    user = {"daily_signals": 3, "last_signal_date": "2024-01-01"}
+    assert daily_signals(user, "2024-01-01") == 3
+    assert daily_signals(user, "2024-01-02") == 0
+
+
+def test_quota_service_reserve_and_release(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "QUOTA_RESET_TIMEZONE", "")
+    monkeypatch.setattr(config, "FREE_SIGNAL_LIMIT", 1)
+    monkeypatch.setattr(config, "PREMIUM_DAILY_LIMIT", 2)
+    db = Database(SqliteStorage(str(tmp_path / "bot.db"), import_dir=None))
+    db.create_user(1, "free")
+    db.create_user(2, "premium")
+    premium = db.get_user(2)
+    premium["is_premium"] = True
+    db.save_user(2, premium)
+    quotas = QuotaService(db)
+
+    assert quotas.reserve(1) is not None
+    assert quotas.reserve(1) is None
+    assert quotas.remaining(db.get_user(1)) == 0
+    quotas.release(1)
+    assert quotas.remaining(db.get_user(1)) == 1
+
+    assert quotas.remaining(db.get_user(2)) == 2
+    assert quotas.reserve(2)["daily_signals"] == 1
+    assert quotas.used_today(db.get_user(2)) == 1
+    assert quotas.reserve(2) is not None
+    assert quotas.reserve(2) is None
+    assert quotas.remaining(db.get_user(2)) == 0
+    quotas.release(2)
+    assert quotas.remaining(db.get_user(2)) == 1
+    db.close()
+
+
+def test_quota_service_reads_the_count_for_the_current_day(monkeypatch):
+    days = iter(["2024-01-01", "2024-01-02"])
+    monkeypatch.setattr("quota.current_day", lambda: next(days))
+    quotas = QuotaService(db=None)
+    user = {"user_id": 1, "is_premium": True, "daily_signals": 2, "last_signal_date": "2024-01-01"}
+    assert quotas.used_today(user) == 2
+    assert quotas.used_today(user) == 0
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import time
+
+import replay
+from tick_archive import TickArchive
+
+
+def test_replay_does_not_load_the_live_pipeline():
+    # forex opens the signal cache, the API key store and the shared quote cache on import
+    code = "import sys, replay; print('forex' in sys.modules)"
+    assert subprocess.check_output([sys.executable, "-c", code], text=True).strip() == "False"
+
+
+def test_archive_and_replay_use_the_fetch_clock(tmp_path):
+    archive = TickArchive(str(tmp_path))
+    archive.on_quote({"pair": "EUR/USD", "price": 1.1, "bid": 1.0999, "ask": 1.1001,
+                      "timestamp": "2024-01-01 00:00:00", "fetched_at": "2024-01-01T01:00:07"})
+    ticks = archive.query("EUR/USD")
+    archive.close()
+    assert ticks["timestamp"].tolist() == [time.mktime((2024, 1, 1, 1, 0, 7, 0, 0, -1))]
+
+
+def test_replay_pair(tmp_path):
+    start = float(int(time.time()))
+    archive = TickArchive(str(tmp_path))
+    for i in range(50):
+        price = 1.1 + 0.0001 * (i % 7)
+        archive.append("EUR/USD", start + 30 * i, price, price - 0.00005, price + 0.00005)
+    archive.close()
+
+    result = replay.replay_pair("EUR/USD", str(tmp_path), horizon=60)
+    assert result["ticks"] == 50
+    assert sum(stats["count"] for stats in result["signals"].values()) == 50
+    report = replay.aggregate([result])
+    assert report["ticks"] == 50
+
+
+def test_replay_keeps_segments_past_the_default_retention(tmp_path):
+    start = time.time() - 200 * 86400
+    archive = TickArchive(str(tmp_path), segment_seconds=86400, retention_days=None)
+    for i in range(10):
+        archive.append("EUR/USD", start + 3600 * i, 1.1, 1.0999, 1.1001)
+    archive.append("EUR/USD", start + 2 * 86400, 1.1, 1.0999, 1.1001)
+    archive.close()
+
+    result = replay.replay_pair("EUR/USD", str(tmp_path), horizon=60)
+    assert result["ticks"] == 11
+    assert len(os.listdir(tmp_path / "EUR_USD")) == 2
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from shared_cache import SharedQuoteCache
+
+PAIRS = ["EUR/USD", "GBP/USD"]
+
+
+@pytest.fixture
+def name():
+    name = f"forex_bot_test_{os.getpid()}"
+    yield name
+    try:
+        os.unlink(f"/dev/shm/{name}")
+    except FileNotFoundError:
+        pass
+
+
+def _quote(pair, price):
+    return {"pair": pair, "price": price}
+
+
+def test_put_and_get_across_attachments(tmp_path, name):
+    lock_file = str(tmp_path / "shared.lock")
+    writer = SharedQuoteCache(name, PAIRS, lock_file, payload_size=256)
+    reader = SharedQuoteCache(name, PAIRS, lock_file, payload_size=256)
+    assert reader.get("EUR/USD") is None
+
+    assert writer.put("EUR/USD", _quote("EUR/USD", 1.1), fetched_at=100.0)
+    assert reader.get("EUR/USD") == _quote("EUR/USD", 1.1)
+    assert reader.fetched_at("EUR/USD") == 100.0
+
+    # An older quote never replaces a newer one
+    assert not writer.put("EUR/USD", _quote("EUR/USD", 1.0), fetched_at=99.0)
+    assert writer.put("EUR/USD", _quote("EUR/USD", 1.2), fetched_at=101.0)
+    assert reader.get("EUR/USD")["price"] == 1.2
+
+    assert not writer.put("USD/JPY", _quote("USD/JPY", 150.0), fetched_at=100.0)
+    assert not writer.put("GBP/USD", {"pair": "GBP/USD", "padding": "x" * 300}, fetched_at=100.0)
+    writer.close()
+    reader.close()
+
+
+def test_layout_mismatch(tmp_path, name):
+    lock_file = str(tmp_path / "shared.lock")
+    cache = SharedQuoteCache(name, PAIRS, lock_file, payload_size=256)
+    with pytest.raises(ValueError):
+        SharedQuoteCache(name, PAIRS + ["USD/JPY"], lock_file, payload_size=256)
+    with pytest.raises(ValueError):
+        SharedQuoteCache(name, PAIRS, lock_file, payload_size=512)
+    cache.close()
+
+
+def test_one_refresher_until_it_closes(tmp_path, name):
+    lock_file = str(tmp_path / "shared.lock")
+    first = SharedQuoteCache(name, PAIRS, lock_file, payload_size=256)
+    second = SharedQuoteCache(name, PAIRS, lock_file, payload_size=256)
+    assert first.is_refresher()
+    assert not second.is_refresher()
+
+    first.close()
+    assert second.is_refresher()
+    second.close()
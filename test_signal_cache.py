@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from signal_cache import FRESH, SignalCache
+
+
+def _signal(pair, price):
+    return {"pair": pair, "price": price, "timestamp": datetime.now().isoformat(),
+            "fetched_at": datetime.now().isoformat()}
+
+
+def _cache(tmp_path, owner=True, compact_every=500):
+    cache = SignalCache(str(tmp_path / "cache.json"), str(tmp_path / "cache.log"), ttl=300,
+                        compact_every=compact_every, owner=owner)
+    cache.load()
+    return cache
+
+
+def test_entries_survive_restart(tmp_path):
+    cache = _cache(tmp_path, compact_every=2)
+    for i, pair in enumerate(["EUR/USD", "GBP/USD", "USD/JPY"]):
+        cache.put(pair, _signal(pair, 1.0 + i))
+    cache.close()
+
+    reloaded = _cache(tmp_path)
+    assert len(reloaded) == 3
+    signal_data, state = reloaded.lookup("USD/JPY")
+    assert (signal_data["price"], state) == (3.0, FRESH)
+
+
+def test_sync_picks_up_other_processes(tmp_path):
+    owner = _cache(tmp_path)
+    worker = _cache(tmp_path, owner=False)
+    worker.put("EUR/USD", _signal("EUR/USD", 1.1))
+
+    assert [signal_data["pair"] for signal_data in owner.sync()] == ["EUR/USD"]
+    assert owner.sync() == []
+    assert owner.get("EUR/USD")["price"] == 1.1
+
+
+def test_compaction_keeps_lines_the_owner_has_not_synced(tmp_path):
+    owner = _cache(tmp_path)
+    worker = _cache(tmp_path, owner=False)
+    worker.put("EUR/USD", _signal("EUR/USD", 1.1))
+    owner.put("GBP/USD", _signal("GBP/USD", 1.3))
+    owner.compact()
+
+    # A third process starting after the compaction sees both entries
+    reader = _cache(tmp_path, owner=False)
+    assert reader.get("EUR/USD")["price"] == 1.1
+    assert reader.get("GBP/USD")["price"] == 1.3
+    # and the owner still reports what it picked up while compacting
+    assert [signal_data["pair"] for signal_data in owner.sync()] == ["EUR/USD"]
+
+    # The worker follows the owner to the new log
+    worker.put("USD/JPY", _signal("USD/JPY", 150.0))
+    assert [signal_data["pair"] for signal_data in reader.sync()] == ["USD/JPY"]
+    owner.close()
+    worker.close()
+    reader.close()
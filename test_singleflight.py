@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_fetch():
+    async def scenario():
+        group = SingleFlight()
+        started = []
+
+        async def fetch():
+            started.append(1)
+            await asyncio.sleep(0.01)
+            return "quote"
+
+        results = await asyncio.gather(*[group.do("EUR/USD", fetch) for _ in range(5)])
+        # A call after the first one finished starts a new fetch
+        results.append(await group.do("EUR/USD", fetch))
+        return results, started, group
+
+    results, started, group = asyncio.run(scenario())
+    assert results == ["quote"] * 6
+    assert len(started) == 2
+    assert group.stats() == {"calls": 2, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_reach_every_waiting_caller():
+    async def scenario():
+        group = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        return await asyncio.gather(*[group.do("EUR/USD", fetch) for _ in range(3)], return_exceptions=True), group
+
+    results, group = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert group.in_flight() == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        group = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "quote"
+
+        first = asyncio.ensure_future(group.do("EUR/USD", fetch))
+        second = asyncio.ensure_future(group.do("EUR/USD", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "quote"
@@ -0,0 +1,39 @@
+from telegram import Update
+
+from supervisor import WorkerPool, shard_for
+
+USER = {"id": 7, "is_bot": False, "first_name": "Ana"}
+CHAT = {"id": 7, "type": "private"}
+
+
+def _message(update_id, text="/start"):
+    return Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": CHAT, "from": USER, "text": text
+    }}, None)
+
+
+def _callback(update_id):
+    return Update.de_json({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": USER, "chat_instance": "1", "data": "EUR/USD",
+        "message": {"message_id": 1, "date": 0, "chat": CHAT, "text": "pairs"}
+    }}, None)
+
+
+def test_a_users_updates_go_to_one_worker():
+    assert shard_for(_message(1), 3) == 7 % 3
+    assert shard_for(_message(2, "/signal"), 3) == shard_for(_callback(3), 3) == 7 % 3
+
+
+def test_updates_without_a_user_are_routed_by_chat():
+    channel_post = Update.de_json({"update_id": 1, "channel_post": {
+        "message_id": 1, "date": 0, "chat": {"id": -1001, "type": "channel"}, "text": "hi"
+    }}, None)
+    assert shard_for(channel_post, 4) == -1001 % 4
+    assert shard_for(Update(update_id=2), 4) == 0
+
+
+def test_dispatch_puts_the_update_on_its_workers_queue():
+    pool = WorkerPool(3)
+    pool.dispatch(_message(5))
+    assert pool.queues[1].get(timeout=5)["update_id"] == 5
+    assert pool.queues[0].empty() and pool.queues[2].empty()
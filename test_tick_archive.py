@@ -0,0 +1,50 @@
+import os
+import time
+
+from tick_archive import TickArchive
+
+
+def _archive(tmp_path, **kwargs):
+    return TickArchive(str(tmp_path), stride=4, **kwargs)
+
+
+def test_query_across_segments(tmp_path):
+    start = float(int(time.time()))
+    archive = _archive(tmp_path, segment_rows=10)
+    for i in range(25):
+        assert archive.append("EUR/USD", start + i, 1.1, 1.0999, 1.1001)
+    assert not archive.append("EUR/USD", start, 1.1, 1.0999, 1.1001)
+
+    ticks = archive.query("EUR/USD", start + 5, start + 20)
+    assert ticks["timestamp"].tolist() == [start + i for i in range(5, 20)]
+    assert len(os.listdir(tmp_path / "EUR_USD")) == 3
+    archive.close()
+
+
+def test_segments_roll_over_by_time_and_expire(tmp_path):
+    day = 86400
+    now = time.time()
+    archive = _archive(tmp_path, retention_days=2)
+    # Few ticks, far below segment_rows, spread over several days
+    for days_ago in (5, 4, 3, 1, 0):
+        archive.append("EUR/USD", now - days_ago * day, 1.1, 1.0999, 1.1001)
+
+    remaining = archive.query("EUR/USD")["timestamp"]
+    assert remaining.tolist() == [now - day, now]
+    archive.close()
+
+
+def test_reading_never_expires_segments(tmp_path):
+    day = 86400
+    now = time.time()
+    archive = _archive(tmp_path, retention_days=90)
+    archive.append("EUR/USD", now - 10 * day, 1.1, 1.0999, 1.1001)
+    archive.append("EUR/USD", now - 5 * day, 1.1, 1.0999, 1.1001)
+    archive.close()
+
+    reopened = _archive(tmp_path, retention_days=7)
+    assert reopened.query("EUR/USD")["timestamp"].tolist() == [now - 10 * day, now - 5 * day]
+    # The writer's next rollover removes the expired segment
+    reopened.append("EUR/USD", now, 1.1, 1.0999, 1.1001)
+    assert reopened.query("EUR/USD")["timestamp"].tolist() == [now - 5 * day, now]
+    reopened.close()
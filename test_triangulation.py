@@ -0,0 +1,23 @@
+import pytest
+
+from triangulation import RateGraph
+
+
+def _quote(price, timestamp, fetched_at):
+    return {"price": price, "bid": price * 0.999, "ask": price * 1.001,
+            "timestamp": timestamp, "fetched_at": fetched_at}
+
+
+def test_cross_reports_its_oldest_leg():
+    graph = RateGraph(["EUR/USD", "USD/JPY", "EUR/JPY"])
+    assert graph.legs_for("EUR/JPY") == ("EUR/USD", "USD/JPY")
+
+    derived = graph.derive("EUR/JPY", {
+        "EUR/USD": _quote(1.1, "2024-01-01 10:00:05", "2024-01-01T10:00:06"),
+        "USD/JPY": _quote(150.0, "2024-01-01 09:58:00", "2024-01-01T09:58:30"),
+    })
+    assert derived["price"] == pytest.approx(165.0)
+    assert derived["bid"] < derived["price"] < derived["ask"]
+    assert derived["timestamp"] == "2024-01-01 09:58:00"
+    assert derived["legs_fetched_at"] == "2024-01-01T09:58:30"
+    assert "fetched_at" not in derived
@@ -0,0 +1,59 @@
+import asyncio
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import PerUserUpdateProcessor
+
+
+def _update(update_id, user_id):
+    user = User(id=user_id, first_name="user", is_bot=False)
+    message = Message(message_id=update_id, date=None, chat=Chat(id=user_id, type="private"), from_user=user)
+    return Update(update_id=update_id, message=message)
+
+
+def test_one_user_in_order_others_concurrently():
+    async def scenario():
+        processor = PerUserUpdateProcessor(10)
+        events = []
+
+        async def handle(name, delay):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        await asyncio.gather(
+            processor.process_update(_update(1, 1), handle("a1", 0.02)),
+            processor.process_update(_update(2, 1), handle("a2", 0)),
+            processor.process_update(_update(3, 2), handle("b1", 0)),
+        )
+        return events, processor
+
+    events, processor = asyncio.run(scenario())
+    assert events.index("end a1") < events.index("start a2")
+    assert events.index("end b1") < events.index("end a1")
+    # Locks of idle users are dropped
+    assert processor._locks == {} and processor._waiting == {}
+
+
+def test_waiting_updates_do_not_hold_slots():
+    async def scenario():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        done = []
+
+        async def block():
+            await release.wait()
+
+        async def handle(name):
+            done.append(name)
+
+        busy = [processor.process_update(_update(i, 1), block()) for i in range(5)]
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in busy]
+        await asyncio.sleep(0)
+        # User 1 has four updates queued behind the first; user 2 still gets a slot
+        await asyncio.wait_for(processor.process_update(_update(10, 2), handle("other")), timeout=1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return done
+
+    assert asyncio.run(scenario()) == ["other"]
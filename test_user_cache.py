@@ -0,0 +1,83 @@
+from database import Database, SqliteStorage
+from user_cache import CachedStorage
+
+
+def _user(user_id, **fields):
+    user = {"user_id": user_id, "username": f"user{user_id}", "is_premium": False, "signals_used": 0,
+            "daily_signals": 0, "last_signal_date": None, "join_date": None, "license_key": None}
+    user.update(fields)
+    return user
+
+
+def _cached(tmp_path, **kwargs):
+    backend = SqliteStorage(str(tmp_path / "bot.db"), import_dir=None)
+    # A long interval keeps the flush thread out of the way; tests flush explicitly
+    kwargs.setdefault("flush_interval", 3600)
+    return backend, CachedStorage(backend, **kwargs)
+
+
+def test_writes_are_buffered_until_flush(tmp_path):
+    backend, cache = _cached(tmp_path)
+    cache.save_user(1, _user(1))
+    assert cache.get_user(1) == _user(1)
+    assert backend.get_user(1) is None
+
+    assert cache.flush() == 1
+    assert backend.get_user(1) == _user(1)
+    assert cache.flush() == 0
+    cache.close()
+
+
+def test_flush_threshold(tmp_path):
+    backend, cache = _cached(tmp_path, flush_threshold=3)
+    cache.save_users({1: _user(1), 2: _user(2)})
+    assert backend.get_user(1) is None
+    cache.save_user(3, _user(3))
+    assert {user_id for user_id in backend.get_all_users()} == {"1", "2", "3"}
+    cache.close()
+
+
+def test_eviction_keeps_dirty_records(tmp_path):
+    backend, cache = _cached(tmp_path, max_entries=2)
+    backend.save_users({1: _user(1), 2: _user(2), 3: _user(3), 4: _user(4)})
+    cache.get_user(1)
+    cache.get_user(2)
+    cache.get_user(3)
+    assert list(cache._users) == ["2", "3"]
+
+    # A dirty record at the head blocks eviction until it is flushed
+    cache.save_user(2, _user(2, signals_used=1))
+    cache.get_user(1)
+    cache.get_user(3)
+    assert "2" in cache._users
+    # Once flushed it is evicted by the next record loaded
+    cache.flush()
+    cache.get_user(4)
+    assert list(cache._users) == ["3", "4"]
+    assert backend.get_user(2)["signals_used"] == 1
+    cache.close()
+
+
+def test_close_flushes_and_closes_backend(tmp_path):
+    backend, cache = _cached(tmp_path)
+    cache.save_user(1, _user(1))
+    cache.close()
+    cache.close()  # idempotent, also registered with atexit
+
+    reopened = SqliteStorage(str(tmp_path / "bot.db"), import_dir=None)
+    assert reopened.get_user(1) == _user(1)
+    reopened.close()
+
+
+def test_license_activation_is_written_through(tmp_path):
+    backend, cache = _cached(tmp_path)
+    db = Database(cache)
+    db.create_user(1, "user1")
+    db.create_license("KEY", 30)
+    assert db.activate_license(1, "KEY") is True
+
+    # No flush has run, yet the backend already has the premium user
+    assert backend.get_user(1)["is_premium"] is True
+    assert backend.get_license("KEY")["used"] is True
+    assert cache.stats()["dirty_users"] == 0
+    cache.close()
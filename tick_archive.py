@@ -0,0 +1,225 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+import config
+from timeseries import FIELDS
+
+logger = logging.getLogger(__name__)
+
+ROW_BYTES = np.dtype(np.float64).itemsize
+
+
+class TickSegment:
+    """One directory of fixed-width float64 column files that grow together.
+
+    A sparse index holds every `stride`-th timestamp, so locating a time
+    only needs a binary search over the index and then over one block of
+    the memory-mapped timestamp column.
+    """
+
+    def __init__(self, path: str, stride: int):
+        self.path = path
+        self.stride = stride
+        self.rows = 0
+        self._index: List[float] = []
+        self._last_ts: Optional[float] = None
+        self._files = None
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.f8")
+
+    def open(self):
+        """Count the complete rows and rebuild the sparse index"""
+        os.makedirs(self.path, exist_ok=True)
+        sizes = []
+        for name in FIELDS:
+            column_path = self._column_path(name)
+            sizes.append(os.path.getsize(column_path) if os.path.exists(column_path) else 0)
+        self.rows = min(sizes) // ROW_BYTES
+        # A crash between column writes leaves some columns a row ahead
+        for name, size in zip(FIELDS, sizes):
+            if size != self.rows * ROW_BYTES:
+                with open(self._column_path(name), 'ab') as f:
+                    f.truncate(self.rows * ROW_BYTES)
+        if self.rows:
+            timestamps = self.column("timestamp")
+            self._index = timestamps[::self.stride].tolist()
+            self._last_ts = float(timestamps[-1])
+            del timestamps
+        return self
+
+    @property
+    def first_ts(self) -> Optional[float]:
+        return self._index[0] if self._index else None
+
+    @property
+    def last_ts(self) -> Optional[float]:
+        return self._last_ts
+
+    def append(self, timestamp: float, price: float, bid: float, ask: float):
+        if self._files is None:
+            self._files = [open(self._column_path(name), 'ab') for name in FIELDS]
+        for f, value in zip(self._files, (timestamp, price, bid, ask)):
+            f.write(np.float64(value).tobytes())
+        for f in self._files:
+            f.flush()
+        if self.rows % self.stride == 0:
+            self._index.append(timestamp)
+        self.rows += 1
+        self._last_ts = timestamp
+
+    def column(self, name: str) -> np.ndarray:
+        if not self.rows:
+            return np.empty(0, dtype=np.float64)
+        return np.memmap(self._column_path(name), dtype=np.float64, mode='r', shape=(self.rows,))
+
+    def locate(self, timestamp: float) -> int:
+        """Index of the first row with a timestamp >= `timestamp`"""
+        block = max(int(np.searchsorted(self._index, timestamp, side="left")) - 1, 0)
+        lo = block * self.stride
+        hi = min(lo + 2 * self.stride, self.rows)
+        timestamps = self.column("timestamp")
+        return lo + int(np.searchsorted(timestamps[lo:hi], timestamp, side="left"))
+
+    def read(self, lo: int, hi: int) -> Dict[str, np.ndarray]:
+        return {name: np.array(self.column(name)[lo:hi]) for name in FIELDS}
+
+    def close(self):
+        if self._files is not None:
+            for f in self._files:
+                f.close()
+            self._files = None
+
+
+class TickArchive:
+    """Per-pair append-only tick archive split into bounded segments.
+
+    A pair's ticks go to the newest segment until it holds `segment_rows`
+    rows or spans `segment_seconds`, then a new segment is started. Segments
+    whose last tick is older than `retention_days` are deleted when the
+    writer rolls over to a new segment; reading never deletes anything.
+    Pass retention_days=None to open an archive without expiry, e.g. for
+    offline replay.
+    """
+
+    def __init__(self, directory: str, segment_rows: int = 1_000_000, retention_days: Optional[float] = 90,
+                 stride: int = 1024, segment_seconds: float = 86400):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.retention_days = retention_days
+        self.stride = stride
+        self._segments: Dict[str, List[TickSegment]] = {}
+        self._lock = threading.Lock()
+
+    def _pair_dir(self, pair: str) -> str:
+        return os.path.join(self.directory, pair.replace("/", "_"))
+
+    def _load(self, pair: str) -> List[TickSegment]:
+        segments = self._segments.get(pair)
+        if segments is None:
+            pair_dir = self._pair_dir(pair)
+            names = sorted(os.listdir(pair_dir)) if os.path.isdir(pair_dir) else []
+            segments = [TickSegment(os.path.join(pair_dir, name), self.stride).open() for name in names]
+            self._segments[pair] = segments
+        return segments
+
+    def _needs_rollover(self, segment: TickSegment, timestamp: float) -> bool:
+        if segment.rows >= self.segment_rows:
+            return True
+        return segment.first_ts is not None and timestamp - segment.first_ts >= self.segment_seconds
+
+    def pairs(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name.replace("_", "/") for name in os.listdir(self.directory))
+
+    def append(self, pair: str, timestamp: float, price: float, bid: float, ask: float) -> bool:
+        """Add a tick; repeated or out-of-order timestamps are ignored"""
+        with self._lock:
+            segments = self._load(pair)
+            current = segments[-1] if segments else None
+            if current is not None and current.last_ts is not None and timestamp <= current.last_ts:
+                return False
+            if current is None or self._needs_rollover(current, timestamp):
+                if current is not None:
+                    current.close()
+                # Zero-padded start time keeps segment directories in time order
+                name = f"{int(timestamp * 1000):016d}"
+                current = TickSegment(os.path.join(self._pair_dir(pair), name), self.stride).open()
+                segments.append(current)
+                self._expire(pair, segments)
+            current.append(timestamp, price, bid, ask)
+            return True
+
+    def on_quote(self, signal_data: Dict):
+        """Quote listener for forex.add_quote_listener.
+
+        Ticks are stored on the local fetch clock, the same one live bars
+        use, so replayed bars line up with the bars the bot built.
+        """
+        fetched_at = signal_data.get("fetched_at", signal_data["timestamp"])
+        self.append(
+            signal_data["pair"],
+            datetime.fromisoformat(fetched_at).timestamp(),
+            signal_data["price"],
+            signal_data["bid"],
+            signal_data["ask"]
+        )
+
+    def _expire(self, pair: str, segments: List[TickSegment]):
+        if self.retention_days is None:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        # The active segment is never removed
+        while len(segments) > 1 and segments[0].last_ts is not None and segments[0].last_ts < cutoff:
+            expired = segments.pop(0)
+            expired.close()
+            shutil.rmtree(expired.path, ignore_errors=True)
+            logger.info(f"Removed expired tick segment {expired.path}")
+
+    def iter_range(self, pair: str, start: Optional[float] = None,
+                   end: Optional[float] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Column arrays for ticks in [start, end), one chunk per segment"""
+        with self._lock:
+            segments = list(self._load(pair))
+            bounds = [(segment, segment.rows) for segment in segments]
+        for segment, rows in bounds:
+            if not rows:
+                continue
+            if end is not None and segment.first_ts >= end:
+                break
+            if start is not None and segment.last_ts < start:
+                continue
+            lo = 0 if start is None else segment.locate(start)
+            hi = rows if end is None else min(segment.locate(end), rows)
+            if hi > lo:
+                yield segment.read(lo, hi)
+
+    def query(self, pair: str, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, np.ndarray]:
+        chunks = list(self.iter_range(pair, start, end))
+        if not chunks:
+            return {name: np.empty(0, dtype=np.float64) for name in FIELDS}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in FIELDS}
+
+    def close(self):
+        with self._lock:
+            for segments in self._segments.values():
+                for segment in segments:
+                    segment.close()
+
+
+tick_archive = TickArchive(
+    config.TICK_ARCHIVE_DIR,
+    segment_rows=config.TICK_SEGMENT_ROWS,
+    retention_days=config.TICK_RETENTION_DAYS,
+    segment_seconds=config.TICK_SEGMENT_SECONDS,
+    stride=config.TICK_INDEX_STRIDE
+)
@@ -0,0 +1,53 @@
+from typing import Optional
+
+import numpy as np
+
+FIELDS = ("timestamp", "price", "bid", "ask")
+TIMESTAMP, PRICE, BID, ASK = range(len(FIELDS))
+
+
+class RingBuffer:
+    """Fixed-capacity ring of (timestamp, price, bid, ask) rows.
+
+    Rows live in one float64 array. Every row is written twice, at i and at
+    i + capacity, so the latest n rows are always contiguous and window()
+    can return a view instead of a copy.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity, len(FIELDS)), dtype=np.float64)
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, price: float, bid: float, ask: float):
+        row = (timestamp, price, bid, ask)
+        self._data[self._head] = row
+        self._data[self._head + self.capacity] = row
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def extend(self, rows: np.ndarray):
+        """Replace the contents with the last `capacity` rows, oldest first"""
+        rows = np.asarray(rows, dtype=np.float64)[-self.capacity:]
+        count = len(rows)
+        self._data[:count] = rows
+        self._data[self.capacity:self.capacity + count] = rows
+        self._head = count % self.capacity
+        self._count = count
+
+    def window(self, n: Optional[int] = None) -> np.ndarray:
+        """Read-only view of the latest n rows (all rows by default), oldest first"""
+        n = self._count if n is None else min(n, self._count)
+        end = self._head + self.capacity
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def last_timestamp(self) -> Optional[float]:
+        if not self._count:
+            return None
+        return float(self._data[self._head + self.capacity - 1, TIMESTAMP])
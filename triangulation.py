@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+
+class RateGraph:
+    """Derives cross rates from legs against a common anchor currency.
+
+    Every pair that contains the anchor (USD by default) is fetched
+    directly. Other pairs are computed from the two anchor legs of their
+    currencies, so only one upstream call per currency is needed.
+    """
+
+    def __init__(self, pairs: List[str], anchor: str = "USD"):
+        self.anchor = anchor
+        self.pairs = list(pairs)
+        self._legs: Dict[str, str] = {}
+        self._derived: Dict[str, Tuple[str, str]] = {}
+
+        # Prefer the orientation already listed in pairs, e.g. USD/JPY over JPY/USD
+        for pair in self.pairs:
+            base, quote = pair.split('/')
+            if base == anchor:
+                self._legs.setdefault(quote, pair)
+            elif quote == anchor:
+                self._legs.setdefault(base, pair)
+
+        for pair in self.pairs:
+            base, quote = pair.split('/')
+            if anchor in (base, quote):
+                continue
+            self._derived[pair] = (self._leg_for(base), self._leg_for(quote))
+
+    def _leg_for(self, currency: str) -> str:
+        if currency not in self._legs:
+            self._legs[currency] = f"{currency}/{self.anchor}"
+        return self._legs[currency]
+
+    def is_derived(self, pair: str) -> bool:
+        return pair in self._derived
+
+    def legs_for(self, pair: str) -> Tuple[str, str]:
+        return self._derived[pair]
+
+    def base_legs(self) -> List[str]:
+        """The minimal set of pairs that has to be fetched from the API"""
+        return list(dict.fromkeys(self._legs.values()))
+
+    def _anchor_value(self, currency: str, leg_quote: Dict) -> Tuple[float, float, float]:
+        """Bid, mid and ask of one unit of currency expressed in the anchor"""
+        if self._legs[currency].startswith(f"{currency}/"):
+            return leg_quote["bid"], leg_quote["price"], leg_quote["ask"]
+        return 1 / leg_quote["ask"], 1 / leg_quote["price"], 1 / leg_quote["bid"]
+
+    def derive(self, pair: str, leg_quotes: Dict[str, Dict]) -> Dict:
+        """Compute price, bid and ask of a cross pair from its cached legs"""
+        base, quote = pair.split('/')
+        base_leg, quote_leg = self._derived[pair]
+        base_bid, base_mid, base_ask = self._anchor_value(base, leg_quotes[base_leg])
+        quote_bid, quote_mid, quote_ask = self._anchor_value(quote, leg_quotes[quote_leg])
+
+        # Quote the cross at its oldest leg's time
+        timestamp = min(
+            (leg_quotes[base_leg]["timestamp"], leg_quotes[quote_leg]["timestamp"]),
+            key=datetime.fromisoformat
+        )
+        # and report how old the oldest leg's data is
+        fetched = [leg_quotes[leg]["fetched_at"] for leg in (base_leg, quote_leg) if leg_quotes[leg].get("fetched_at")]
+        legs_fetched_at = min(fetched, key=datetime.fromisoformat) if fetched else None
+        return {
+            "price": base_mid / quote_mid,
+            # Selling the base at its bid buys the quote at its ask, and vice versa
+            "bid": base_bid / quote_ask,
+            "ask": base_ask / quote_bid,
+            "timestamp": timestamp,
+            "legs_fetched_at": legs_fetched_at,
+            "legs": [base_leg, quote_leg],
+            "is_demo": leg_quotes[base_leg].get("is_demo", False) or leg_quotes[quote_leg].get("is_demo", False)
+        }
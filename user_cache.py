@@ -0,0 +1,213 @@
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from database import release_signal, reserve_signal
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CachedStorage:
+    """Write-behind user cache in front of any storage backend.
+
+    User reads are served from memory once loaded. Writes only mark the
+    record dirty; dirty records are written to the backend in one batch
+    when the flush interval elapses, when the number of dirty records
+    reaches the threshold, or on close. Licenses, signals and broadcast jobs
+    are passed straight through to the backend.
+    """
+
+    def __init__(self, storage, flush_interval: float = 5.0, flush_threshold: int = 500,
+                 max_entries: int = 100000):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_entries = max_entries
+
+        self._users: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self._dirty: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_records = 0
+        self.flush_errors = 0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-cache-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def _remember(self, key: str, user_data: Optional[Dict]):
+        self._users[key] = user_data
+        self._users.move_to_end(key)
+        # Only clean records may be evicted, dirty ones wait for the next flush
+        while len(self._users) > self.max_entries:
+            oldest = next(iter(self._users))
+            if oldest in self._dirty:
+                break
+            self._users.popitem(last=False)
+
+    def get_user(self, user_id) -> Optional[Dict]:
+        key = str(user_id)
+        with self._lock:
+            user = self._users.get(key, _MISSING)
+            if user is not _MISSING:
+                self.hits += 1
+                self._users.move_to_end(key)
+                return dict(user) if user is not None else None
+
+            self.misses += 1
+            user = self.storage.get_user(user_id)
+            self._remember(key, dict(user) if user is not None else None)
+            return user
+
+    def save_user(self, user_id, user_data: Dict):
+        self.save_users({user_id: user_data})
+
+    def _mark_dirty(self, user_id, user_data: Dict):
+        key = str(user_id)
+        self._remember(key, dict(user_data))
+        self._dirty[key] = self._users[key]
+
+    def save_users(self, users_data: Dict):
+        with self._lock:
+            for user_id, user_data in users_data.items():
+                self._mark_dirty(user_id, user_data)
+            should_flush = len(self._dirty) >= self.flush_threshold
+        if should_flush:
+            self.flush()
+
+    def reserve_signal(self, user_id, day: str, daily_limit: int, free_limit: int) -> Optional[Dict]:
+        # Check and charge under one hold of the lock; flushing waits until it is released
+        with self._lock:
+            user = self.get_user(user_id)
+            reserved = user is not None and reserve_signal(user, day, daily_limit, free_limit)
+            if reserved:
+                self._mark_dirty(user_id, user)
+            should_flush = len(self._dirty) >= self.flush_threshold
+        if should_flush:
+            self.flush()
+        return user if reserved else None
+
+    def release_signal(self, user_id, day: str):
+        with self._lock:
+            user = self.get_user(user_id)
+            if user is not None:
+                release_signal(user, day)
+                self._mark_dirty(user_id, user)
+
+    def get_all_users(self) -> Dict[str, Dict]:
+        users = self.storage.get_all_users()
+        with self._lock:
+            for key, user_data in self._dirty.items():
+                users[key] = dict(user_data)
+        return users
+
+    def flush(self) -> int:
+        """Write all dirty user records to the backend in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                batch = self._dirty
+                self._dirty = {}
+
+            try:
+                self.storage.save_users(batch)
+            except Exception as e:
+                logger.error(f"Error flushing {len(batch)} cached users: {e}")
+                with self._lock:
+                    self.flush_errors += 1
+                    # Newer writes made while flushing take precedence
+                    for key, user_data in batch.items():
+                        self._dirty.setdefault(key, user_data)
+                return 0
+
+            with self._lock:
+                self.flushes += 1
+                self.flushed_records += len(batch)
+            logger.debug(f"Flushed {len(batch)} cached users")
+            return len(batch)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "cached_users": len(self._users),
+                "dirty_users": len(self._dirty),
+                "flushes": self.flushes,
+                "flushed_records": self.flushed_records,
+                "flush_errors": self.flush_errors,
+            }
+
+    def get_license(self, key):
+        return self.storage.get_license(key)
+
+    def save_license(self, key, license_data: Dict):
+        self.storage.save_license(key, license_data)
+
+    def save_license_and_user(self, key, license_data: Dict, user_id, user_data: Dict):
+        """Write the user through with the license instead of waiting for a flush"""
+        # Same as checkpoint_broadcast: no concurrent flush may write an older copy afterwards
+        with self._flush_lock, self._lock:
+            key_str = str(user_id)
+            self._remember(key_str, dict(user_data))
+            self._dirty.pop(key_str, None)
+            self.storage.save_license_and_user(key, license_data, user_id, user_data)
+
+    def add_signal(self, signal_data: Dict) -> str:
+        return self.storage.add_signal(signal_data)
+
+    def create_broadcast(self, job: Dict, recipients) -> str:
+        return self.storage.create_broadcast(job, recipients)
+
+    def get_broadcast(self, job_id):
+        return self.storage.get_broadcast(job_id)
+
+    def update_broadcast(self, job_id, fields: Dict):
+        self.storage.update_broadcast(job_id, fields)
+
+    def get_unfinished_broadcasts(self):
+        return self.storage.get_unfinished_broadcasts()
+
+    def claim_broadcast_recipients(self, job_id, limit: int):
+        return self.storage.claim_broadcast_recipients(job_id, limit)
+
+    def acquire_broadcast_lease(self, job_id, owner: str, now: float, lease_until: float) -> bool:
+        return self.storage.acquire_broadcast_lease(job_id, owner, now, lease_until)
+
+    def recover_broadcast(self, job_id) -> int:
+        return self.storage.recover_broadcast(job_id)
+
+    def checkpoint_broadcast(self, job_id, delivered, failed, users_data: Dict):
+        """Write the charged users through together with the checkpoint"""
+        # Holding the flush lock keeps a concurrent flush from overwriting these records with older copies
+        with self._flush_lock, self._lock:
+            for user_id, user_data in users_data.items():
+                key = str(user_id)
+                self._remember(key, dict(user_data))
+                # The checkpoint persists these records, so they are no longer dirty
+                self._dirty.pop(key, None)
+            self.storage.checkpoint_broadcast(job_id, delivered, failed, users_data)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+        logger.info(f"User cache closed: {self.stats()}")
+        self.storage.close()